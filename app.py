@@ -21,6 +21,10 @@ def create_app(config_name='default'):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     
+    # Sérialisation JSON rapide (orjson si disponible)
+    from services.serializers import FastJSONProvider
+    app.json = FastJSONProvider(app)
+    
     # Initialisation des extensions
     db.init_app(app)
     login_manager.init_app(app)
@@ -66,6 +70,50 @@ def create_app(config_name='default'):
     app.register_blueprint(media_bp)
     app.register_blueprint(api_bp, url_prefix='/api')
     
+    # Cache des réponses de l'API publique
+    from services.cache import response_cache
+    response_cache.init_app(app)
+    
+    # Tâches de fond : vidage périodique des compteurs et de last_used des tokens
+    from services.tasks import background_tasks
+    from services.counters import view_counter
+    from services.tokens import token_cache, last_used_tracker
+    view_counter.max_keys = app.config['VIEW_COUNTER_MAX_KEYS']
+    token_cache.ttl = app.config['API_TOKEN_CACHE_TTL']
+    last_used_tracker.min_interval = app.config['API_TOKEN_LAST_USED_INTERVAL']
+    background_tasks.init_app(app)
+    background_tasks.register('view_counter', view_counter.flush,
+                              app.config['VIEW_COUNTER_FLUSH_INTERVAL'], at_shutdown=True)
+    background_tasks.register('api_token_last_used', last_used_tracker.flush,
+                              app.config['VIEW_COUNTER_FLUSH_INTERVAL'], at_shutdown=True)
+    
+    # Stockage des fichiers (disque local ou compatible S3)
+    from services.storage import storage
+    storage.init_app(app)
+    
+    # Pool de traitement des médias et reprise des traitements interrompus
+    from services.media_processing import media_processor
+    media_processor.init_app(app)
+    background_tasks.register('media_requeue', media_processor.requeue_stale,
+                              app.config['MEDIA_PROCESSING_STALE_AFTER'])
+    
+    # Purge des uploads par morceaux abandonnés
+    from services.uploads import purge_expired_uploads
+    background_tasks.register('upload_purge', purge_expired_uploads, 3600)
+    
+    # Publication programmée et transitions datées (offres, activités)
+    from services.scheduler import publish_scheduler
+    publish_scheduler.init_app(app)
+    background_tasks.register('publish_scheduler', publish_scheduler.run, app.config['SCHEDULER_INTERVAL'])
+    
+    # Index des chemins de médias, préchargé avec les plus récents
+    from services.media_index import media_index
+    media_index.init_app(app)
+    
+    # Rendu Markdown avec cache par contenu
+    from services.rendering import markdown_renderer
+    markdown_renderer.init_app(app)
+    
     # Import des modèles après db pour éviter les imports circulaires
     from database.models import User, Post, Media, Category, Activity
     
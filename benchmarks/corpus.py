@@ -0,0 +1,53 @@
+"""Générateur de corpus Markdown pour les benchmarks de rendu
+
+Articles de laboratoire déterministes (titres, paragraphes avec liens et
+emphase, listes, blocs de code, citations), d'environ 70 Ko chacun avec
+les valeurs par défaut. Utilisable comme module (`generate`) ou pour
+écrire le corpus sur disque :
+
+    python benchmarks/corpus.py --articles 20 --out /tmp/corpus
+"""
+import argparse
+import os
+import random
+
+WORDS = ('matrice valeur propre théorème lemme espace hilbertien convergence opérateur '
+         'spectre intégrale mesure série fonction laboratoire résultat données').split()
+
+def article(seed, sections=40):
+    """Texte Markdown d'un article, identique pour une même graine"""
+    rng = random.Random(seed)
+    
+    def sentence():
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + '.'
+    
+    parts = [f'# Rapport de recherche {seed}\n']
+    for section in range(sections):
+        parts.append(f'## Section {section}\n')
+        parts.append(' '.join(sentence() for _ in range(6))
+                     + f' Voir *[réf {section}](https://labmath.org/ref/{section})* et `code_{section}` **important**.\n')
+        parts.append('\n'.join(f'- {sentence()}' for _ in range(5)) + '\n')
+        parts.append('    def f(x):\n        return x ** 2  # exemple\n')
+        parts.append('> ' + sentence() + '\n')
+        parts.append('1. ' + sentence() + '\n2. ' + sentence() + '\n')
+    return '\n'.join(parts)
+
+def generate(count=20, sections=40):
+    """Liste de `count` articles"""
+    return [article(seed, sections) for seed in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--articles', type=int, default=20, help="nombre d'articles")
+    parser.add_argument('--sections', type=int, default=40, help='sections par article')
+    parser.add_argument('--out', required=True, help='dossier de sortie (un fichier .md par article)')
+    args = parser.parse_args()
+    
+    os.makedirs(args.out, exist_ok=True)
+    for seed, text in enumerate(generate(args.articles, args.sections)):
+        with open(os.path.join(args.out, f'article-{seed:03d}.md'), 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(f'{args.articles} articles écrits dans {args.out}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Benchmark du rendu Markdown -> HTML nettoyé
+
+Trois cas sur le même corpus (voir benchmarks/corpus.py) :
+- l'ancien rendu `clean(markdown.markdown(texte))`, reconstruit à chaque appel ;
+- le convertisseur et le nettoyeur réutilisés de MarkdownRenderer, cache manqué ;
+- MarkdownRenderer.render avec le cache déjà rempli.
+
+Les temps sont donnés par article (meilleur de `--repeat` passes).
+
+    python benchmarks/rendering.py --articles 20 --repeat 3
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FLASK_CONFIG', 'testing')
+
+import markdown
+from bleach import clean
+
+import app  # noqa: F401  initialise db avant l'import des services
+from corpus import generate
+from services.rendering import MarkdownRenderer
+
+def best_of(func, repeat):
+    """Meilleur temps d'exécution de `func`, en secondes"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--articles', type=int, default=20, help="nombre d'articles du corpus")
+    parser.add_argument('--sections', type=int, default=40, help='sections par article')
+    parser.add_argument('--repeat', type=int, default=3, help='nombre de passes par mesure')
+    args = parser.parse_args()
+    
+    corpus = generate(args.articles, args.sections)
+    renderer = MarkdownRenderer(max_entries=len(corpus))
+    
+    # Les trois chemins doivent produire le même HTML
+    assert all(clean(markdown.markdown(text)) == renderer.convert(text) for text in corpus)
+    
+    def cache_miss():
+        renderer.clear()
+        for text in corpus:
+            renderer.render(text)
+    
+    baseline = best_of(lambda: [clean(markdown.markdown(text)) for text in corpus], args.repeat)
+    miss = best_of(cache_miss, args.repeat)
+    cache_miss()  # remplit le cache
+    hit = best_of(lambda: [renderer.render(text) for text in corpus], args.repeat)
+    
+    size = sum(len(text.encode('utf-8')) for text in corpus) // len(corpus) // 1024
+    print(f'{len(corpus)} articles, {size} Ko en moyenne, meilleur de {args.repeat} passes')
+    for label, elapsed in [('clean(markdown.markdown())', baseline),
+                           ('convertisseur réutilisé, cache manqué', miss),
+                           ('cache trouvé', hit)]:
+        print(f'{label:<40} {elapsed * 1000 / len(corpus):8.3f} ms / article   x{baseline / elapsed:.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Microbenchmark de la sérialisation des posts de l'API publique
+
+Compare, pour une même liste de posts déjà chargés (relations comprises) :
+- l'ancien chemin : dictionnaires construits à la main puis `jsonify` avec
+  le fournisseur JSON standard de Flask ;
+- le chemin actuel : `serialize_post.many` puis `FastJSONProvider`.
+
+Les temps sont ramenés à 1 000 posts (meilleur de `--repeat` passes).
+
+    python benchmarks/serializers.py --posts 1000 --repeat 30
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FLASK_CONFIG', 'testing')
+
+from flask.json.provider import DefaultJSONProvider
+
+from app import create_app, db
+from database.models import User, Post, Category, Tag, Activity, Offer
+from database.queries import published_posts, with_post_relations
+from services.serializers import orjson, serialize_post
+
+def seed(count):
+    """Créer `count` posts publiés avec catégorie, tags, et une activité ou une offre sur deux"""
+    author = User(username='auteur', email='auteur@labmath.com', password_hash='x',
+                  first_name='Ada', last_name='Lovelace')
+    categories = [Category(name=f'Catégorie {i}') for i in range(5)]
+    tags = [Tag(name=f'tag{i}') for i in range(20)]
+    db.session.add(author)
+    db.session.add_all(categories + tags)
+    db.session.flush()
+    
+    for i in range(count):
+        post = Post(title=f'Post {i}', content=f'Contenu {i}', content_html=f'<p>Contenu {i}</p>' * 20,
+                    excerpt=f'Résumé du post {i}', post_type='article', status='published',
+                    user_id=author.id, category_id=categories[i % 5].id,
+                    published_at=datetime(2024, 1, 1) + timedelta(hours=i))
+        post.tags.extend([tags[i % 20], tags[(i + 7) % 20], tags[(i + 13) % 20]])
+        if i % 2 == 0:
+            post.activity = Activity(title=f'Atelier {i}', activity_type='workshop', location='Salle B12',
+                                     start_date=datetime(2030, 1, 1) + timedelta(days=i))
+        else:
+            post.offer = Offer(title=f'Offre {i}', description='Description', offer_type='job',
+                               contract_type='CDD', application_deadline=datetime(2030, 6, 1))
+        db.session.add(post)
+    db.session.commit()
+
+def legacy_post_dict(post):
+    """Dictionnaire d'un post tel que construit à la main avant serialize_post"""
+    return {
+        'id': post.id,
+        'title': post.title,
+        'slug': post.slug,
+        'excerpt': post.excerpt,
+        'content': post.content_html,
+        'post_type': post.post_type,
+        'featured_image': f"/media/{post.featured_image}" if post.featured_image else None,
+        'published_at': post.published_at.isoformat() if post.published_at else None,
+        'author': post.author.username if post.author else None,
+        'category': {
+            'name': post.category_ref.name,
+            'slug': post.category_ref.slug,
+            'color': post.category_ref.color
+        } if post.category_ref else None,
+        # tag_list préchargé : on mesure la sérialisation, pas la requête par post
+        'tags': [tag.name for tag in post.tag_list],
+        'activity': {
+            'activity_type': post.activity.activity_type,
+            'start_date': post.activity.start_date.isoformat() if post.activity and post.activity.start_date else None,
+            'end_date': post.activity.end_date.isoformat() if post.activity and post.activity.end_date else None,
+            'location': post.activity.location,
+            'is_online': post.activity.is_online,
+            'status': post.activity.status
+        } if post.activity else None,
+        'offer': {
+            'offer_type': post.offer.offer_type,
+            'contract_type': post.offer.contract_type,
+            'location': post.offer.location,
+            'salary_range': post.offer.salary_range,
+            'application_deadline': post.offer.application_deadline.isoformat() if post.offer and post.offer.application_deadline else None,
+            'status': post.offer.status
+        } if post.offer else None
+    }
+
+def best_of(func, repeat):
+    """Meilleur temps d'exécution de `func`, en secondes"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=1000, help='nombre de posts sérialisés')
+    parser.add_argument('--repeat', type=int, default=30, help='nombre de passes par mesure')
+    args = parser.parse_args()
+    
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        seed(args.posts)
+        posts = with_post_relations(published_posts()).all()
+        
+        legacy_json = DefaultJSONProvider(app)
+        cases = [
+            ('dicts       à la main', lambda: [legacy_post_dict(post) for post in posts]),
+            ('dicts       serialize_post.many', lambda: serialize_post.many(posts)),
+            ('réponse     à la main + jsonify', lambda: legacy_json.response(
+                {'success': True, 'data': [legacy_post_dict(post) for post in posts]})),
+            ('réponse     serialize_post.many + FastJSONProvider', lambda: app.json.response(
+                {'success': True, 'data': serialize_post.many(posts)})),
+        ]
+        
+        print(f'{len(posts)} posts, encodeur {"orjson" if orjson else "json"}, meilleur de {args.repeat} passes')
+        for label, func in cases:
+            elapsed = best_of(func, args.repeat)
+            print(f'{label:<52} {elapsed * 1000 * 1000 / len(posts):8.2f} ms / 1000 posts')
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,19 @@ from functools import wraps
 import jwt
 from datetime import datetime, timedelta
 from database.models import Post, Activity, Offer, Category, Media, db, ApiToken, Setting
+from database.queries import (published_posts, with_post_relations, activities_with_post, offers_with_post,
+                              categories_with_post_counts)
+from database.pagination import keyset_filter, keyset_page, InvalidCursor
+from services.cache import response_cache
+from services.counters import view_counter
+from services.media_index import media_index
+from services.post_search import filter_search, search_snippets, search_terms
+from services.rendering import markdown_renderer
+from services.scheduler import publish_scheduler
+from services.tokens import token_cache, last_used_tracker
+from services.serializers import (serialize_post, serialize_post_detail, serialize_activity, serialize_offer,
+                                  serialize_category, POST_SUMMARY_FIELDS, ACTIVITY_SUMMARY_FIELDS,
+                                  OFFER_SUMMARY_FIELDS)
 
 api_bp = Blueprint('api', __name__)
 
@@ -24,25 +37,67 @@ def token_required(f):
         if not token:
             return jsonify({'error': 'Token API manquant'}), 401
         
-        # Vérifier le token dans la base de données
-        api_token = ApiToken.query.filter_by(token=token, is_active=True).first()
-        if not api_token:
-            return jsonify({'error': 'Token API invalide'}), 401
+        # Vérifier le token (cache mémoire, puis base de données)
+        cached_token = token_cache.get(token)
+        if cached_token is None:
+            api_token = ApiToken.query.filter_by(token=token, is_active=True).first()
+            if not api_token:
+                return jsonify({'error': 'Token API invalide'}), 401
+            cached_token = token_cache.set(token, api_token)
         
         # Vérifier l'expiration
-        if api_token.expires_at and api_token.expires_at < datetime.utcnow():
+        now = datetime.utcnow()
+        if cached_token['expires_at'] and cached_token['expires_at'] < now:
             return jsonify({'error': 'Token API expiré'}), 401
         
-        # Mettre à jour la dernière utilisation
-        api_token.last_used = datetime.utcnow()
-        db.session.commit()
+        # Mettre à jour la dernière utilisation (écrite par lots en tâche de fond)
+        last_used_tracker.touch(cached_token['id'], now)
         
         return f(*args, **kwargs)
     
     return decorated
 
+class InvalidFields(ValueError):
+    """Paramètre fields= ou view= invalide"""
+
+def requested_fields(serializer, summary_fields):
+    """Champs demandés par fields= ou view=summary (None pour la vue complète)"""
+    if request.args.get('fields'):
+        fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+        unknown = [field for field in fields if field not in serializer.spec]
+        if unknown:
+            raise InvalidFields('Champs inconnus : ' + ', '.join(unknown))
+        return fields
+    
+    view = request.args.get('view', 'full')
+    if view == 'summary':
+        return list(summary_fields)
+    if view != 'full':
+        raise InvalidFields(f'Vue inconnue : {view}')
+    return None
+
+def last_modified_of(items):
+    """Date de dernière modification la plus récente parmi des objets"""
+    dates = [item.updated_at for item in items if item.updated_at]
+    return max(dates) if dates else None
+
+def cursor_meta(query, columns, limit, next_cursor):
+    """Métadonnées d'une page en mode curseur (total exact seulement sur demande)
+
+    Le total compte les mêmes lignes que keyset_page : clé de tri non nulle.
+    """
+    meta = {
+        'limit': limit,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    }
+    if request.args.get('with_total', '').lower() in ('1', 'true', 'yes'):
+        meta['total'] = keyset_filter(query, columns).count()
+    return meta
+
 @api_bp.route('/posts')
 @cross_origin()
+@response_cache.cached
 def get_posts():
     """API pour récupérer les posts"""
     post_type = request.args.get('type', 'all')
@@ -50,8 +105,15 @@ def get_posts():
     limit = request.args.get('limit', 10, type=int)
     offset = request.args.get('offset', 0, type=int)
     featured = request.args.get('featured', False, type=bool)
+    cursor = request.args.get('cursor')
+    
+    try:
+        fields = requested_fields(serialize_post, POST_SUMMARY_FIELDS)
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+    serializer = serialize_post.only(fields) if fields else serialize_post
     
-    query = Post.query.filter_by(status='published')
+    query = published_posts()
     
     if post_type != 'all':
         query = query.filter_by(post_type=post_type)
@@ -62,169 +124,222 @@ def get_posts():
     if featured:
         query = query.filter_by(is_featured=True)
     
-    total = query.count()
-    posts = query.order_by(Post.published_at.desc()).offset(offset).limit(limit).all()
-    
-    return jsonify({
-        'success': True,
-        'data': [{
-            'id': post.id,
-            'title': post.title,
-            'slug': post.slug,
-            'excerpt': post.excerpt,
-            'content': post.content_html,
-            'post_type': post.post_type,
-            'featured_image': f"/media/{post.featured_image}" if post.featured_image else None,
-            'published_at': post.published_at.isoformat() if post.published_at else None,
-            'author': post.author.username if post.author else None,
-            'category': {
-                'name': post.category_ref.name,
-                'slug': post.category_ref.slug,
-                'color': post.category_ref.color
-            } if post.category_ref else None,
-            'tags': [tag.name for tag in post.tags],
-            'activity': {
-                'activity_type': post.activity.activity_type,
-                'start_date': post.activity.start_date.isoformat() if post.activity and post.activity.start_date else None,
-                'end_date': post.activity.end_date.isoformat() if post.activity and post.activity.end_date else None,
-                'location': post.activity.location,
-                'is_online': post.activity.is_online,
-                'status': post.activity.status
-            } if post.activity else None,
-            'offer': {
-                'offer_type': post.offer.offer_type,
-                'contract_type': post.offer.contract_type,
-                'location': post.offer.location,
-                'salary_range': post.offer.salary_range,
-                'application_deadline': post.offer.application_deadline.isoformat() if post.offer and post.offer.application_deadline else None,
-                'status': post.offer.status
-            } if post.offer else None
-        } for post in posts],
-        'meta': {
+    if cursor is not None:
+        sort_key = (Post.published_at, Post.id)
+        try:
+            posts, next_cursor = keyset_page(with_post_relations(query, fields), sort_key,
+                                             cursor, limit, descending=True)
+        except InvalidCursor:
+            return jsonify({'error': 'Curseur invalide'}), 400
+        meta = cursor_meta(query, sort_key, limit, next_cursor)
+    else:
+        total = query.count()
+        posts = with_post_relations(query, fields).order_by(Post.published_at.desc()).offset(offset).limit(limit).all()
+        meta = {
             'total': total,
             'limit': limit,
             'offset': offset,
             'has_more': offset + len(posts) < total
         }
+    
+    response = jsonify({
+        'success': True,
+        'data': serializer.many(posts),
+        'meta': meta
     })
+    response.last_modified = last_modified_of(posts)
+    return response
+
+@api_bp.route('/posts/batch', methods=['GET', 'POST'])
+@cross_origin()
+@response_cache.cached
+def get_posts_batch():
+    """API pour récupérer plusieurs posts par slug ou id en un seul appel"""
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        data = {} if data is None else data
+        # Objet JSON attendu, avec des listes (une chaîne serait lue caractère par caractère)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Identifiants invalides'}), 400
+        slugs = data.get('slugs') or []
+        ids = data.get('ids') or []
+        if not (isinstance(slugs, list) and isinstance(ids, list)
+                and all(isinstance(slug, str) for slug in slugs)):
+            return jsonify({'error': 'Identifiants invalides'}), 400
+    else:
+        slugs = [s for s in request.args.get('slugs', '').split(',') if s]
+        ids = [i for i in request.args.get('ids', '').split(',') if i]
+    
+    try:
+        slugs = [slug.strip() for slug in slugs]
+        ids = [int(post_id) for post_id in ids]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Identifiants invalides'}), 400
+    
+    max_items = current_app.config['API_BATCH_MAX_ITEMS']
+    if not slugs and not ids:
+        return jsonify({'error': 'Aucun slug ni id fourni'}), 400
+    if len(slugs) + len(ids) > max_items:
+        return jsonify({'error': f'Maximum {max_items} éléments par appel'}), 400
+    
+    # Une seule requête IN, relations chargées comme pour get_post
+    posts = with_post_relations(published_posts().filter(
+        db.or_(Post.slug.in_(slugs), Post.id.in_(ids))
+    )).all()
+    
+    found_slugs = {post.slug for post in posts}
+    found_ids = {post.id for post in posts}
+    
+    response = jsonify({
+        'success': True,
+        'data': {post.slug: serialize_post_detail(post) for post in posts},
+        'missing': {
+            'slugs': [slug for slug in slugs if slug not in found_slugs],
+            'ids': [post_id for post_id in ids if post_id not in found_ids]
+        }
+    })
+    response.last_modified = last_modified_of(posts)
+    return response
 
 @api_bp.route('/posts/<slug>')
 @cross_origin()
 def get_post(slug):
     """API pour récupérer un post spécifique"""
-    post = Post.query.filter_by(slug=slug, status='published').first_or_404()
+    response = post_detail(slug)
     
-    # Incrémenter le compteur de vues
-    post.views += 1
-    db.session.commit()
+    # Compter la vue en mémoire : écrite en base par lots, hors requête
+    view_counter.increment(slug)
     
-    return jsonify({
+    return response
+
+@response_cache.cached
+def post_detail(slug):
+    """Réponse JSON d'un post publié (mise en cache, hors compteur de vues)"""
+    post = with_post_relations(published_posts().filter_by(slug=slug)).first_or_404()
+    
+    response = jsonify({
         'success': True,
-        'data': {
-            'id': post.id,
-            'title': post.title,
-            'slug': post.slug,
-            'excerpt': post.excerpt,
-            'content': post.content_html,
-            'post_type': post.post_type,
-            'featured_image': f"/media/{post.featured_image}" if post.featured_image else None,
-            'published_at': post.published_at.isoformat() if post.published_at else None,
-            'author': {
-                'username': post.author.username,
-                'first_name': post.author.first_name,
-                'last_name': post.author.last_name
-            } if post.author else None,
-            'category': {
-                'name': post.category_ref.name,
-                'slug': post.category_ref.slug,
-                'color': post.category_ref.color
-            } if post.category_ref else None,
-            'tags': [tag.name for tag in post.tags],
-            'activity': {
-                'activity_type': post.activity.activity_type,
-                'start_date': post.activity.start_date.isoformat() if post.activity and post.activity.start_date else None,
-                'end_date': post.activity.end_date.isoformat() if post.activity and post.activity.end_date else None,
-                'location': post.activity.location,
-                'is_online': post.activity.is_online,
-                'registration_url': post.activity.registration_url,
-                'status': post.activity.status
-            } if post.activity else None,
-            'offer': {
-                'offer_type': post.offer.offer_type,
-                'contract_type': post.offer.contract_type,
-                'location': post.offer.location,
-                'salary_range': post.offer.salary_range,
-                'experience_required': post.offer.experience_required,
-                'application_deadline': post.offer.application_deadline.isoformat() if post.offer and post.offer.application_deadline else None,
-                'start_date': post.offer.start_date.isoformat() if post.offer and post.offer.start_date else None,
-                'is_remote': post.offer.is_remote,
-                'status': post.offer.status
-            } if post.offer else None,
-            'views': post.views,
-            'likes': post.likes
+        'data': serialize_post_detail(post)
+    })
+    response.last_modified = last_modified_of([post])
+    return response
+
+@api_bp.route('/search')
+@cross_origin()
+@response_cache.cached
+def search_posts():
+    """API de recherche plein texte dans les posts publiés, classés par pertinence"""
+    q = request.args.get('q', '')
+    post_type = request.args.get('type', 'all')
+    limit = request.args.get('limit', 10, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    
+    if not search_terms(q):
+        return jsonify({'error': 'Paramètre q manquant'}), 400
+    
+    # Vue résumée par défaut : le contenu complet se lit sur /api/posts/<slug>
+    try:
+        fields = requested_fields(serialize_post, POST_SUMMARY_FIELDS)
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+    if 'fields' not in request.args and 'view' not in request.args:
+        fields = list(POST_SUMMARY_FIELDS)
+    serializer = serialize_post.only(fields) if fields else serialize_post
+    
+    query = published_posts()
+    if post_type != 'all':
+        query = query.filter_by(post_type=post_type)
+    query, rank = filter_search(query, q)
+    order = [Post.published_at.desc(), Post.id.desc()]
+    if rank is not None:
+        order.insert(0, rank)
+    
+    total = query.count()
+    posts = with_post_relations(query, fields).order_by(*order).offset(offset).limit(limit).all()
+    snippets = search_snippets(q, [post.id for post in posts])
+    
+    data = serializer.many(posts)
+    for item, post in zip(data, posts):
+        item['highlight'] = snippets.get(post.id)
+    
+    response = jsonify({
+        'success': True,
+        'data': data,
+        'meta': {
+            'query': q,
+            'total': total,
+            'limit': limit,
+            'offset': offset,
+            'has_more': offset + len(posts) < total
         }
     })
+    response.last_modified = last_modified_of(posts)
+    return response
 
 @api_bp.route('/activities')
 @cross_origin()
+@response_cache.cached
 def get_activities():
     """API pour récupérer les activités"""
     status = request.args.get('status', 'upcoming')
     limit = request.args.get('limit', 10, type=int)
     offset = request.args.get('offset', 0, type=int)
+    cursor = request.args.get('cursor')
+    
+    try:
+        fields = requested_fields(serialize_activity, ACTIVITY_SUMMARY_FIELDS)
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+    serializer = serialize_activity.only(fields) if fields else serialize_activity
     
     query = Activity.query
     
+    # Statut tenu à jour par le planificateur : pas de filtre sur l'heure courante
     if status != 'all':
         query = query.filter_by(status=status)
     
-    # Filtrer pour les activités futures ou en cours
-    if status == 'upcoming':
-        query = query.filter(Activity.start_date >= datetime.utcnow())
-    elif status == 'ongoing':
-        query = query.filter(
-            Activity.start_date <= datetime.utcnow(),
-            Activity.end_date >= datetime.utcnow()
-        )
-    
-    total = query.count()
-    activities = query.order_by(Activity.start_date).offset(offset).limit(limit).all()
-    
-    return jsonify({
-        'success': True,
-        'data': [{
-            'id': activity.id,
-            'title': activity.title,
-            'slug': activity.slug,
-            'description': activity.description,
-            'activity_type': activity.activity_type,
-            'start_date': activity.start_date.isoformat() if activity.start_date else None,
-            'end_date': activity.end_date.isoformat() if activity.end_date else None,
-            'location': activity.location,
-            'is_online': activity.is_online,
-            'registration_url': activity.registration_url,
-            'max_participants': activity.max_participants,
-            'current_participants': activity.current_participants,
-            'status': activity.status,
-            'featured_image': f"/media/{activity.post.featured_image}" if activity.post and activity.post.featured_image else None,
-            'post_slug': activity.post.slug if activity.post else None
-        } for activity in activities],
-        'meta': {
+    if cursor is not None:
+        sort_key = (Activity.start_date, Activity.id)
+        try:
+            activities, next_cursor = keyset_page(activities_with_post(query, fields), sort_key,
+                                                  cursor, limit)
+        except InvalidCursor:
+            return jsonify({'error': 'Curseur invalide'}), 400
+        meta = cursor_meta(query, sort_key, limit, next_cursor)
+    else:
+        total = query.count()
+        activities = activities_with_post(query, fields).order_by(Activity.start_date).offset(offset).limit(limit).all()
+        meta = {
             'total': total,
             'limit': limit,
             'offset': offset,
             'has_more': offset + len(activities) < total
         }
+    
+    response = jsonify({
+        'success': True,
+        'data': serializer.many(activities),
+        'meta': meta
     })
+    response.last_modified = last_modified_of(activities)
+    return response
 
 @api_bp.route('/offers')
 @cross_origin()
+@response_cache.cached
 def get_offers():
     """API pour récupérer les offres"""
     offer_type = request.args.get('type', 'all')
     status = request.args.get('status', 'open')
     limit = request.args.get('limit', 10, type=int)
     offset = request.args.get('offset', 0, type=int)
+    cursor = request.args.get('cursor')
+    
+    try:
+        fields = requested_fields(serialize_offer, OFFER_SUMMARY_FIELDS)
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+    serializer = serialize_offer.only(fields) if fields else serialize_offer
     
     query = Offer.query
     
@@ -234,55 +349,42 @@ def get_offers():
     if status != 'all':
         query = query.filter_by(status=status)
     
-    total = query.count()
-    offers = query.order_by(Offer.created_at.desc()).offset(offset).limit(limit).all()
-    
-    return jsonify({
-        'success': True,
-        'data': [{
-            'id': offer.id,
-            'title': offer.title,
-            'slug': offer.slug,
-            'description': offer.description,
-            'offer_type': offer.offer_type,
-            'contract_type': offer.contract_type,
-            'location': offer.location,
-            'salary_range': offer.salary_range,
-            'experience_required': offer.experience_required,
-            'application_deadline': offer.application_deadline.isoformat() if offer.application_deadline else None,
-            'start_date': offer.start_date.isoformat() if offer.start_date else None,
-            'is_remote': offer.is_remote,
-            'status': offer.status,
-            'views': offer.views,
-            'applications_count': offer.applications_count,
-            'featured_image': f"/media/{offer.post.featured_image}" if offer.post and offer.post.featured_image else None,
-            'post_slug': offer.post.slug if offer.post else None
-        } for offer in offers],
-        'meta': {
+    if cursor is not None:
+        sort_key = (Offer.created_at, Offer.id)
+        try:
+            offers, next_cursor = keyset_page(offers_with_post(query, fields), sort_key,
+                                              cursor, limit, descending=True)
+        except InvalidCursor:
+            return jsonify({'error': 'Curseur invalide'}), 400
+        meta = cursor_meta(query, sort_key, limit, next_cursor)
+    else:
+        total = query.count()
+        offers = offers_with_post(query, fields).order_by(Offer.created_at.desc()).offset(offset).limit(limit).all()
+        meta = {
             'total': total,
             'limit': limit,
             'offset': offset,
             'has_more': offset + len(offers) < total
         }
+    
+    response = jsonify({
+        'success': True,
+        'data': serializer.many(offers),
+        'meta': meta
     })
+    response.last_modified = last_modified_of(offers)
+    return response
 
 @api_bp.route('/categories')
 @cross_origin()
+@response_cache.cached
 def get_categories():
     """API pour récupérer les catégories"""
-    categories = Category.query.filter_by(is_active=True).all()
+    categories = categories_with_post_counts()
     
     return jsonify({
         'success': True,
-        'data': [{
-            'id': cat.id,
-            'name': cat.name,
-            'slug': cat.slug,
-            'description': cat.description,
-            'color': cat.color,
-            'icon': cat.icon,
-            'post_count': cat.posts.filter_by(status='published').count()
-        } for cat in categories]
+        'data': [dict(serialize_category(cat), post_count=post_count) for cat, post_count in categories]
     })
 
 @api_bp.route('/sync', methods=['POST'])
@@ -314,5 +416,9 @@ def api_health():
         'service': 'labmath-admin-api',
         'version': '1.0.0',
         'timestamp': datetime.utcnow().isoformat(),
-        'database': 'connected' if db.session.query('1').from_statement(db.text('SELECT 1')).first() else 'disconnected'
+        'database': 'connected' if db.session.execute(db.text('SELECT 1')).scalar() else 'disconnected',
+        'view_counter': view_counter.stats(),
+        'media_index': media_index.stats(),
+        'markdown_cache': markdown_renderer.stats(),
+        'scheduler': publish_scheduler.stats()
     })
\ No newline at end of file
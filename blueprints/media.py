@@ -1,84 +1,119 @@
-from flask import Blueprint, request, jsonify, send_file, current_app
-from flask_login import login_required
+from flask import Blueprint, request, jsonify, current_app, abort, redirect
+from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import LimitedStream
+import click
+from datetime import date
 import os
-from PIL import Image
-import magic
+import mimetypes
+import zipfile
 from database.models import db, Media as MediaModel
-from datetime import datetime
+from services.serializers import serialize_media
+from services.blobs import backfill_blobs, reuse_processing, store_upload
+from services.media_delivery import is_fingerprinted, send_media
+from services.media_import import import_archive, import_directory, import_uploads
+from services.media_index import media_index
+from services.media_search import install_search_index, search_media
+from services.reconcile import reconcile_storage
+from services.storage import StorageError, storage
+from services.uploads import (UploadError, abort_upload, finish_direct_upload, finish_upload, load_upload,
+                              start_direct_upload, start_upload, write_chunk)
+from services.media_processing import media_processor, thumbnail_target
+from services.renditions import (get_or_create_rendition, rendition_formats, rendition_path, rendition_targets,
+                                 rendition_widths, storage_key)
 
 media_bp = Blueprint('media', __name__, template_folder='../templates')
 
+# Champs renvoyés après un upload
+UPLOAD_FIELDS = ('id', 'filename', 'url', 'thumbnail_url', 'mime_type', 'file_size', 'created_at',
+                 'processing_status')
+
+# Champs renvoyés par le suivi du traitement
+STATUS_FIELDS = ('id', 'processing_status', 'mime_type', 'file_type', 'width', 'height', 'thumbnail_url')
+
 def allowed_file(filename):
     """Vérifier les extensions autorisées"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
-def generate_thumbnail(input_path, output_path, size=(300, 200)):
-    """Générer une miniature pour une image"""
-    try:
-        with Image.open(input_path) as img:
-            img.thumbnail(size)
-            img.save(output_path)
-        return True
-    except Exception as e:
-        print(f"Erreur génération thumbnail: {e}")
-        return False
-
-def save_media_file(file, folder='images'):
-    """Sauvegarder un fichier média"""
+def save_media_file(file):
+    """Sauvegarder un fichier média, stocké une seule fois par contenu"""
     if not file or not allowed_file(file.filename):
         return None
     
     filename = secure_filename(file.filename)
-    unique_filename = f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{filename}"
-    upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], folder)
+    ext = os.path.splitext(filename)[1].lower()
+    
+    # Empreinte calculée pendant l'écriture : un contenu déjà connu n'est pas
+    # stocké une seconde fois, seule une référence est ajoutée au blob
+    blob = store_upload(file, ext)
     
-    # Créer le dossier s'il n'existe pas
-    os.makedirs(upload_path, exist_ok=True)
+    # Type MIME provisoire d'après l'extension : la détection par le contenu
+    # et la miniature sont faites par le pool de traitement des médias
+    mime_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
     
-    file_path = os.path.join(upload_path, unique_filename)
-    file.save(file_path)
+    return blob_file_info(blob, filename, mime_type)
+
+def blob_file_info(blob, original_filename, mime_type):
+    """Informations d'un fichier stocké, au format attendu par register_media"""
+    return {
+        'filename': os.path.basename(blob.file_path),
+        'original_filename': original_filename,
+        'file_path': blob.file_path,
+        'thumbnail_path': None,
+        'file_size': blob.file_size,
+        'mime_type': mime_type,
+        'blob': blob
+    }
+
+def register_media(file_info):
+    """Créer la ligne Media d'un fichier stocké et lancer son traitement"""
+    media = MediaModel(
+        filename=file_info['filename'],
+        original_filename=file_info['original_filename'],
+        file_path=file_info['file_path'].replace('\\', '/'),
+        thumbnail_path=file_info['thumbnail_path'].replace('\\', '/') if file_info['thumbnail_path'] else None,
+        file_size=file_info['file_size'],
+        mime_type=file_info['mime_type'],
+        file_type=file_info['mime_type'].split('/')[0],
+        uploaded_by=current_user.id if current_user.is_authenticated else None,
+        blob_id=file_info['blob'].id,
+        processing_status='processing'
+    )
     
-    # Détecter le type MIME
-    mime_type = magic.from_file(file_path, mime=True)
+    # Contenu déjà traité pour un autre média : rien à recalculer
+    reused = reuse_processing(media)
+    db.session.add(media)
+    db.session.commit()
     
-    # Générer une miniature pour les images
-    thumbnail_path = None
-    if mime_type.startswith('image/'):
-        thumb_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'thumbnails')
-        os.makedirs(thumb_dir, exist_ok=True)
-        thumbnail_path = os.path.join(thumb_dir, unique_filename)
-        generate_thumbnail(file_path, thumbnail_path)
+    if not reused:
+        # Type MIME, dimensions, miniature et déclinaisons sont calculés hors de la requête
+        renditions = rendition_targets(storage_key(media)) if current_app.config['MEDIA_RENDITIONS_ON_UPLOAD'] else ()
+        media_processor.submit(media.id, media.file_path, thumbnail_target(media.filename), renditions)
+        db.session.refresh(media)
     
+    return media
+
+def upload_response(media):
+    status_code = 202 if media.processing_status == 'processing' else 200
+    return jsonify(serialize_media.only(UPLOAD_FIELDS)(media)), status_code
+
+def search_filters(default_type):
+    """Filtres de recherche communs à la médiathèque et à son API"""
     return {
-        'filename': unique_filename,
-        'original_filename': filename,
-        'file_path': file_path,
-        'thumbnail_path': thumbnail_path,
-        'file_size': os.path.getsize(file_path),
-        'mime_type': mime_type
+        'q': request.args.get('q') or request.args.get('search', ''),
+        'file_type': request.args.get('type', default_type),
+        'date_from': request.args.get('date_from', type=date.fromisoformat),
+        'date_to': request.args.get('date_to', type=date.fromisoformat),
+        'uploaded_by': request.args.get('uploaded_by', type=int),
+        'page': request.args.get('page', 1, type=int)
     }
 
 @media_bp.route('/media')
 @login_required
 def media_library():
     """Bibliothèque des médias"""
-    page = request.args.get('page', 1, type=int)
-    file_type = request.args.get('type', 'all')
-    search = request.args.get('search', '')
-    
-    query = MediaModel.query
-    
-    if file_type != 'all':
-        query = query.filter(MediaModel.file_type == file_type)
-    
-    if search:
-        query = query.filter(MediaModel.filename.ilike(f'%{search}%'))
-    
-    media_items = query.order_by(MediaModel.created_at.desc()).paginate(
-        page=page, per_page=24, error_out=False
-    )
+    media_items = search_media(**search_filters(default_type='all'), per_page=24)
     
     return media_items
 
@@ -98,60 +133,223 @@ def upload_media():
         return jsonify({'error': 'Type de fichier non autorisé'}), 400
     
     # Créer l'entrée en base de données
-    media = MediaModel(
-        filename=file_info['filename'],
-        original_filename=file_info['original_filename'],
-        file_path=file_info['file_path'].replace('\\', '/'),
-        thumbnail_path=file_info['thumbnail_path'].replace('\\', '/') if file_info['thumbnail_path'] else None,
-        file_size=file_info['file_size'],
-        mime_type=file_info['mime_type'],
-        file_type=file_info['mime_type'].split('/')[0],
-        uploaded_by=current_user.id if current_user.is_authenticated else None
-    )
+    return upload_response(register_media(file_info))
+
+def import_summary(results):
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return summary
+
+@media_bp.route('/media/upload/batch', methods=['POST'])
+@login_required
+def upload_media_batch():
+    """Uploader plusieurs fichiers en une requête, avec un résultat par fichier"""
+    files = [file for file in request.files.getlist('files') if file.filename]
+    if not files:
+        return jsonify({'error': 'Aucun fichier sélectionné'}), 400
     
-    # Pour les images, récupérer les dimensions
-    if media.file_type == 'image':
-        try:
-            with Image.open(file_info['file_path']) as img:
-                media.width, media.height = img.size
-        except:
-            pass
+    results = import_uploads(files, uploaded_by=current_user.id,
+                             batch_size=current_app.config['MEDIA_IMPORT_BATCH_SIZE'])
+    return jsonify({'results': results, 'summary': import_summary(results)})
+
+# Upload par morceaux (reprise possible) pour les fichiers volumineux :
+# POST /media/uploads ouvre l'upload, PUT /media/uploads/<id>?offset=N envoie
+# un morceau, POST /media/uploads/<id>/complete crée le média.
+
+def upload_error(e):
+    payload = {'error': str(e)}
+    if e.offset is not None:
+        payload['offset'] = e.offset
+    return jsonify(payload), e.status
+
+def upload_state(state):
+    return {
+        'upload_id': state['id'],
+        'filename': state['filename'],
+        'size': state['size'],
+        'offset': state['offset'],
+        'chunk_size': current_app.config['MEDIA_UPLOAD_CHUNK_SIZE']
+    }
+
+@media_bp.route('/media/uploads', methods=['POST'])
+@login_required
+def start_chunked_upload():
+    """Ouvrir un upload par morceaux"""
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'Type de fichier non autorisé'}), 400
+    if not isinstance(data.get('size'), int):
+        return jsonify({'error': 'Taille du fichier requise'}), 400
     
-    db.session.add(media)
-    db.session.commit()
+    try:
+        state = start_upload(filename, data['size'], current_user.id)
+    except UploadError as e:
+        return upload_error(e)
+    return jsonify(upload_state(state)), 201
+
+@media_bp.route('/media/uploads/<upload_id>', methods=['GET'])
+@login_required
+def chunked_upload_status(upload_id):
+    """Offset courant d'un upload, pour reprendre après une coupure"""
+    try:
+        state = load_upload(upload_id, current_user.id)
+    except UploadError as e:
+        return upload_error(e)
+    return jsonify(upload_state(state))
+
+@media_bp.route('/media/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id):
+    """Recevoir un morceau, écrit directement dans le fichier partiel"""
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Paramètre offset requis'}), 400
     
-    return jsonify({
-        'id': media.id,
-        'filename': media.filename,
-        'url': f"/media/{media.id}/file",
-        'thumbnail_url': f"/media/{media.id}/thumbnail" if media.thumbnail_path else None,
-        'mime_type': media.mime_type,
-        'file_size': media.file_size,
-        'created_at': media.created_at.isoformat()
-    })
+    try:
+        state = write_chunk(upload_id, current_user.id, offset, request.stream, request.content_length)
+    except UploadError as e:
+        return upload_error(e)
+    return jsonify(upload_state(state))
 
-@media_bp.route('/media/<int:media_id>/file')
-def get_media_file(media_id):
-    """Récupérer un fichier média"""
+@media_bp.route('/media/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_chunked_upload(upload_id):
+    """Terminer un upload par morceaux et créer le média"""
+    data = request.get_json(silent=True) or {}
+    try:
+        state, blob, mime_type = finish_upload(upload_id, current_user.id, data.get('sha256'))
+    except UploadError as e:
+        return upload_error(e)
+    
+    return upload_response(register_media(blob_file_info(blob, state['filename'], mime_type)))
+
+@media_bp.route('/media/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_chunked_upload(upload_id):
+    """Abandonner un upload par morceaux"""
+    try:
+        abort_upload(upload_id, current_user.id)
+    except UploadError as e:
+        return upload_error(e)
+    return jsonify({'success': True})
+
+# Upload direct vers le stockage : POST /media/uploads/direct renvoie une URL
+# présignée, le client y envoie le fichier (PUT) puis confirme avec le jeton
+# reçu ; les octets ne passent pas par les workers gunicorn.
+
+@media_bp.route('/media/uploads/direct', methods=['POST'])
+@login_required
+def start_direct_upload_route():
+    """Préparer un upload direct (URL présignée)"""
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'Type de fichier non autorisé'}), 400
+    if not isinstance(data.get('size'), int):
+        return jsonify({'error': 'Taille du fichier requise'}), 400
+    
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    try:
+        upload = start_direct_upload(filename, data['size'], data.get('sha256'), content_type, current_user.id)
+    except UploadError as e:
+        return upload_error(e)
+    return jsonify(upload), 201
+
+@media_bp.route('/media/uploads/direct/complete', methods=['POST'])
+@login_required
+def complete_direct_upload():
+    """Confirmer un upload direct et créer le média"""
+    data = request.get_json(silent=True) or {}
+    try:
+        filename, blob, mime_type = finish_direct_upload(data.get('token') or '', current_user.id)
+    except UploadError as e:
+        return upload_error(e)
+    
+    return upload_response(register_media(blob_file_info(blob, filename, mime_type)))
+
+@media_bp.route('/media/storage/<path:key>', methods=['GET', 'PUT'])
+def presigned_storage(key):
+    """URLs présignées du stockage local : mêmes échanges client qu'avec S3"""
+    if storage.remote:
+        return 'Not found', 404
+    try:
+        claims = storage.driver.verify(key, request.method, request.args.get('token', ''))
+        path = storage.driver.path(key)
+    except StorageError:
+        return jsonify({'error': 'Lien invalide ou expiré'}), 403
+    
+    if request.method == 'GET':
+        if not os.path.exists(path):
+            return 'File not found', 404
+        return send_media(path)
+    
+    if request.content_length != claims['n']:
+        return jsonify({'error': 'Taille différente de celle annoncée'}), 400
+    # La taille signée remplace la limite globale des requêtes (MAX_CONTENT_LENGTH,
+    # appliquée par request.stream) : lecture directe bornée à claims['n'] octets
+    storage.driver.put(key, LimitedStream(request.environ['wsgi.input'], claims['n']))
+    return '', 200
+
+@media_bp.route('/media/<int:media_id>/status')
+@login_required
+def media_status(media_id):
+    """Suivre le traitement d'un média uploadé"""
     media = MediaModel.query.get_or_404(media_id)
+    return jsonify(serialize_media.only(STATUS_FIELDS)(media))
+
+def serve_stored(path, mimetype=None, immutable=False):
+    """Servir un fichier stocké : redirection vers une URL présignée (S3) ou envoi local"""
+    url = storage.url(path, mimetype)
+    if url is not None:
+        # Redirection réutilisable tant que l'URL présignée reste valide
+        response = redirect(url)
+        response.cache_control.private = True
+        response.cache_control.max_age = storage.presign_expire // 2
+        return response
     
-    if not os.path.exists(media.file_path):
+    if not os.path.exists(path):
         return 'File not found', 404
-    
-    return send_file(media.file_path)
+    return send_media(path, mimetype=mimetype, immutable=immutable)
+
+@media_bp.route('/media/<int:media_id>/file')
+def get_media_file(media_id):
+    """Récupérer un fichier média"""
+    media = media_index.get(media_id) or abort(404)
+    return serve_stored(media.file_path, media.mime_type, immutable=is_fingerprinted(media))
 
 @media_bp.route('/media/<int:media_id>/thumbnail')
 def get_media_thumbnail(media_id):
     """Récupérer la miniature d'un média"""
-    media = MediaModel.query.get_or_404(media_id)
+    media = media_index.get(media_id) or abort(404)
+    
+    if not storage.is_available(media.thumbnail_path):
+        # Retourner l'original si pas de miniature (sans cache long : la
+        # miniature peut encore être en cours de génération)
+        return serve_stored(media.file_path, media.mime_type)
     
-    if not media.thumbnail_path or not os.path.exists(media.thumbnail_path):
-        # Retourner l'original si pas de miniature
-        if os.path.exists(media.file_path):
-            return send_file(media.file_path)
+    return serve_stored(media.thumbnail_path, immutable=is_fingerprinted(media))
+
+@media_bp.route('/media/<int:media_id>/rendition/<int:width>.<fmt>')
+def get_media_rendition(media_id, width, fmt):
+    """Récupérer une déclinaison d'image, générée à la première demande"""
+    if width not in rendition_widths() or fmt not in rendition_formats():
+        return 'Rendition not found', 404
+    
+    entry = media_index.get(media_id) or abort(404)
+    if entry.file_type != 'image' or not storage.is_available(entry.file_path):
         return 'File not found', 404
     
-    return send_file(media.thumbnail_path)
+    # Jamais d'agrandissement : l'original est déjà la meilleure version
+    if entry.width and width >= entry.width:
+        return serve_stored(entry.file_path, entry.mime_type, immutable=is_fingerprinted(entry))
+    
+    # Déclinaison déjà stockée : servie sans requête en base
+    path = rendition_path(entry.storage_key, width, fmt)
+    if not storage.exists(path):
+        path = get_or_create_rendition(db.session.get(MediaModel, media_id), width, fmt).file_path
+    return serve_stored(path, f'image/{fmt}', immutable=is_fingerprinted(entry))
 
 @media_bp.route('/media/<int:media_id>', methods=['DELETE'])
 @login_required
@@ -159,14 +357,16 @@ def delete_media(media_id):
     """Supprimer un média"""
     media = MediaModel.query.get_or_404(media_id)
     
-    # Supprimer les fichiers physiques
-    try:
-        if os.path.exists(media.file_path):
-            os.remove(media.file_path)
-        if media.thumbnail_path and os.path.exists(media.thumbnail_path):
-            os.remove(media.thumbnail_path)
-    except Exception as e:
-        current_app.logger.error(f"Erreur suppression fichier: {e}")
+    # Supprimer les fichiers physiques ; ceux d'un contenu partagé sont
+    # effacés avec la dernière référence, après le commit (services.blobs)
+    if media.blob_id is None:
+        try:
+            storage.remove(media.file_path)
+            if media.thumbnail_path:
+                storage.remove(media.thumbnail_path)
+            storage.remove_tree(os.path.join(current_app.config['UPLOAD_FOLDER'], 'renditions', str(media.id)))
+        except Exception as e:
+            current_app.logger.error(f"Erreur suppression fichier: {e}")
     
     # Supprimer de la base
     db.session.delete(media)
@@ -178,34 +378,71 @@ def delete_media(media_id):
 @login_required
 def api_media_list():
     """API pour la liste des médias"""
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
-    file_type = request.args.get('type', 'image')
-    
-    query = MediaModel.query
-    
-    if file_type != 'all':
-        query = query.filter(MediaModel.file_type == file_type)
-    
-    media_items = query.order_by(MediaModel.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    per_page = min(request.args.get('per_page', 20, type=int), 100)
+    media_items = search_media(**search_filters(default_type='image'), per_page=per_page)
     
     return jsonify({
-        'items': [{
-            'id': item.id,
-            'filename': item.filename,
-            'original_filename': item.original_filename,
-            'url': f"/media/{item.id}/file",
-            'thumbnail_url': f"/media/{item.id}/thumbnail" if item.thumbnail_path else None,
-            'file_type': item.file_type,
-            'mime_type': item.mime_type,
-            'file_size': item.file_size,
-            'created_at': item.created_at.isoformat(),
-            'description': item.description,
-            'alt_text': item.alt_text
-        } for item in media_items.items],
+        'items': serialize_media.many(media_items.items),
         'total': media_items.total,
         'pages': media_items.pages,
         'current_page': media_items.page
-    })
\ No newline at end of file
+    })
+
+@media_bp.cli.command('backfill-blobs')
+@click.option('--batch-size', default=100, show_default=True, help='Lignes traitées par transaction')
+@click.option('--dry-run', is_flag=True, help='Compter sans rien modifier')
+def backfill_blobs_command(batch_size, dry_run):
+    """Convertir les médias existants au stockage par contenu (dédoublonné)"""
+    stats = backfill_blobs(batch_size=batch_size, dry_run=dry_run)
+    click.echo(f"{stats['files']} fichier(s) : {stats['blobs_created']} blob(s) créé(s), "
+               f"{stats['deduplicated']} doublon(s), {stats['bytes_reclaimed']} octet(s) récupéré(s), "
+               f"{stats['missing']} fichier(s) introuvable(s)" + (' [simulation]' if dry_run else ''))
+
+@media_bp.cli.command('import')
+@click.argument('path', type=click.Path(exists=True))
+@click.option('--batch-size', default=None, type=int, help='Fichiers insérés par transaction')
+@click.option('--user-id', default=None, type=int, help='Auteur enregistré pour les médias importés')
+def import_media_command(path, batch_size, user_id):
+    """Importer un dossier (récursivement) ou une archive zip dans la médiathèque"""
+    batch_size = batch_size or current_app.config['MEDIA_IMPORT_BATCH_SIZE']
+    if os.path.isdir(path):
+        results = import_directory(path, uploaded_by=user_id, batch_size=batch_size)
+    elif zipfile.is_zipfile(path):
+        results = import_archive(path, uploaded_by=user_id, batch_size=batch_size)
+    else:
+        raise click.BadParameter('dossier ou archive zip attendu', param_hint='PATH')
+    
+    # Attendre miniatures et déclinaisons avant la fin du processus
+    media_processor.wait()
+    
+    for result in results:
+        detail = f"#{result['media_id']}" if 'media_id' in result else result.get('error', '')
+        click.echo(f"{result['status']:<9} {result['name']} {detail}")
+    click.echo(', '.join(f'{count} {status}' for status, count in import_summary(results).items()) or 'Aucun fichier')
+
+@media_bp.cli.command('search-index')
+def search_index_command():
+    """Créer (ou reconstruire) l'index de recherche de la médiathèque"""
+    with db.engine.begin() as connection:
+        installed = install_search_index(connection, rebuild=True)
+    click.echo('Index de recherche à jour' if installed else 'Aucun index disponible pour cette base : recherche par ILIKE')
+
+@media_bp.cli.command('reconcile')
+@click.option('--dry-run/--apply', default=True, show_default=True,
+              help='Rapporter les écarts sans rien supprimer, ou supprimer les orphelins')
+@click.option('--rate', default=0, type=float, show_default=True, help='Opérations disque par seconde (0 : illimité)')
+@click.option('--batch-size', default=500, show_default=True, help='Fichiers et lignes vérifiés par requête')
+@click.option('--min-age', default=3600, show_default=True, help='Âge minimal (secondes) d\'un orphelin supprimé')
+def reconcile_command(dry_run, rate, batch_size, min_age):
+    """Comparer uploads/ et la base : fichiers orphelins récupérés, fichiers manquants signalés"""
+    report = reconcile_storage(dry_run=dry_run, rate=rate, batch_size=batch_size, min_age=min_age)
+    for path in report['orphan_samples']:
+        click.echo(f'orphelin  {path}')
+    for missing in report['missing_samples']:
+        click.echo(f'manquant  {missing}')
+    missing = ', '.join(f'{name} {count}' for name, count in report['missing'].items())
+    click.echo(f"{report['scanned_files']} fichier(s) analysé(s) ({report['scanned_bytes']} octets) : "
+               f"{report['orphan_files']} orphelin(s) ({report['orphan_bytes']} octets), "
+               f"{report['reclaimed_files']} supprimé(s) ({report['reclaimed_bytes']} octets), "
+               f"{report['errors']} erreur(s) ; fichiers manquants : {missing}"
+               + (' [simulation]' if dry_run else ''))
@@ -1,14 +1,19 @@
 from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
+import click
 from datetime import datetime
 import os
-import markdown
-from bleach import clean
 from slugify import slugify
 
-from database.models import db, Post, Category, Tag, PostMedia, Activity, Offer, post_tags
-from .media import allowed_file, save_media_file, generate_thumbnail
+from database.models import db, Post, Category, PostMedia, Activity, Offer, post_tags
+from .media import allowed_file, save_media_file
+from services.media_processing import media_processor
+from services.post_search import filter_search, install_search_index, search_snippets
+from services.rendering import markdown_renderer
+from services.scheduler import publication_status, publish_scheduler
+from services.storage import storage
+from services.tags import parse_tag_names, set_post_tags
 
 posts_bp = Blueprint('posts', __name__, template_folder='../templates')
 
@@ -29,12 +34,16 @@ def posts_list():
     if status != 'all':
         query = query.filter_by(status=status)
     
-    if search:
-        query = query.filter(Post.title.ilike(f'%{search}%'))
+    # Recherche plein texte : les plus pertinents d'abord, extraits surlignés
+    query, rank = filter_search(query, search)
+    order = [Post.created_at.desc()]
+    if rank is not None:
+        order.insert(0, rank)
     
-    posts = query.order_by(Post.created_at.desc()).paginate(
+    posts = query.order_by(*order).paginate(
         page=page, per_page=current_app.config['ITEMS_PER_PAGE'], error_out=False
     )
+    snippets = search_snippets(search, [post.id for post in posts.items])
     
     categories = Category.query.filter_by(is_active=True).all()
     
@@ -43,19 +52,35 @@ def posts_list():
                          categories=categories,
                          post_type=post_type,
                          status=status,
-                         search=search)
+                         search=search,
+                         snippets=snippets)
+
+def form_published_at():
+    """Date de publication saisie (champ datetime-local), None si vide
+
+    Lève ValueError si la date est invalide.
+    """
+    value = request.form.get('published_at')
+    return datetime.fromisoformat(value.replace('T', ' ')) if value else None
 
 @posts_bp.route('/posts/create', methods=['GET', 'POST'])
 @login_required
 def create_post():
     """Créer un nouveau post"""
     if request.method == 'POST':
+        try:
+            published_at = form_published_at()
+        except ValueError:
+            flash('Date de publication invalide.', 'danger')
+            return redirect(url_for('posts.create_post'))
+        
         title = request.form.get('title')
         content = request.form.get('content')
         excerpt = request.form.get('excerpt')
         post_type = request.form.get('post_type', 'article')
         category_id = request.form.get('category_id')
-        status = request.form.get('status', 'draft')
+        # Date future : le post est programmé et publié par le planificateur
+        status, published_at = publication_status(request.form.get('status', 'draft'), published_at)
         is_featured = request.form.get('is_featured') == 'on'
         allow_comments = request.form.get('allow_comments') == 'on'
         
@@ -66,6 +91,7 @@ def create_post():
             excerpt=excerpt,
             post_type=post_type,
             status=status,
+            published_at=published_at,
             is_featured=is_featured,
             allow_comments=allow_comments,
             user_id=current_user.id,
@@ -73,23 +99,15 @@ def create_post():
         )
         
         # Générer le HTML sécurisé
-        post.content_html = clean(markdown.markdown(content))
+        post.content_html = markdown_renderer.render(content)
         
-        if status == 'published' and not post.published_at:
-            post.published_at = datetime.utcnow()
+        db.session.add(post)
         
         # Gérer les tags
-        tags_input = request.form.get('tags', '')
-        if tags_input:
-            tag_names = [t.strip() for t in tags_input.split(',') if t.strip()]
-            for tag_name in tag_names:
-                tag = Tag.query.filter_by(name=tag_name).first()
-                if not tag:
-                    tag = Tag(name=tag_name)
-                    db.session.add(tag)
-                post.tags.append(tag)
+        tag_names = parse_tag_names(request.form.get('tags', ''))
+        if tag_names:
+            set_post_tags(post, tag_names)
         
-        db.session.add(post)
         db.session.commit()
         
         # Gérer l'image principale
@@ -102,10 +120,11 @@ def create_post():
                 
                 file_path = os.path.join(upload_path, unique_filename)
                 file.save(file_path)
+                storage.publish(file_path)
                 
-                # Générer une miniature
+                # Générer une miniature (en tâche de fond)
                 thumb_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'thumbnails', unique_filename)
-                generate_thumbnail(file_path, thumb_path)
+                media_processor.submit(None, file_path, thumb_path)
                 
                 post.featured_image = unique_filename
                 db.session.commit()
@@ -130,32 +149,29 @@ def edit_post(post_id):
     post = Post.query.get_or_404(post_id)
     
     if request.method == 'POST':
+        try:
+            published_at = form_published_at()
+        except ValueError:
+            flash('Date de publication invalide.', 'danger')
+            return redirect(url_for('posts.edit_post', post_id=post.id))
+        
         post.title = request.form.get('title')
+        content_changed = request.form.get('content') != post.content
         post.content = request.form.get('content')
         post.excerpt = request.form.get('excerpt')
         post.post_type = request.form.get('post_type')
         post.category_id = request.form.get('category_id')
-        post.status = request.form.get('status')
+        post.status, post.published_at = publication_status(request.form.get('status'),
+                                                             published_at or post.published_at)
         post.is_featured = request.form.get('is_featured') == 'on'
         post.allow_comments = request.form.get('allow_comments') == 'on'
         
-        # Mettre à jour le HTML
-        post.content_html = clean(markdown.markdown(post.content))
+        # Mettre à jour le HTML (inutile si le contenu n'a pas changé)
+        if content_changed or post.content_html is None:
+            post.content_html = markdown_renderer.render(post.content)
         
-        if post.status == 'published' and not post.published_at:
-            post.published_at = datetime.utcnow()
-        
-        # Mettre à jour les tags
-        tags_input = request.form.get('tags', '')
-        post.tags.clear()
-        if tags_input:
-            tag_names = [t.strip() for t in tags_input.split(',') if t.strip()]
-            for tag_name in tag_names:
-                tag = Tag.query.filter_by(name=tag_name).first()
-                if not tag:
-                    tag = Tag(name=tag_name)
-                    db.session.add(tag)
-                post.tags.append(tag)
+        # Mettre à jour les tags (seule la différence est écrite)
+        set_post_tags(post, parse_tag_names(request.form.get('tags', '')))
         
         db.session.commit()
         flash('Post mis à jour avec succès !', 'success')
@@ -276,5 +292,35 @@ def delete_post(post_id):
 def preview_post():
     """Prévisualiser un post en markdown"""
     content = request.json.get('content', '')
-    html = clean(markdown.markdown(content))
-    return jsonify({'html': html})
\ No newline at end of file
+    html = markdown_renderer.render(content)
+    return jsonify({'html': html})
+
+@posts_bp.route('/api/posts/preview/blocks', methods=['POST'])
+@login_required
+def preview_post_blocks():
+    """Prévisualiser un post par blocs : seuls les blocs absents chez le client sont rendus
+
+    Le client envoie le texte et les identifiants des blocs qu'il affiche
+    (`known`) ; la réponse donne l'ordre des blocs et le HTML des nouveaux.
+    """
+    data = request.get_json(silent=True) or {}
+    blocks = markdown_renderer.render_blocks(data.get('content', ''), data.get('known') or ())
+    return jsonify({
+        'blocks': [block_id for block_id, _ in blocks],
+        'html': {block_id: html for block_id, html in blocks if html is not None}
+    })
+
+@posts_bp.cli.command('search-index')
+def search_index_command():
+    """Créer (ou reconstruire) l'index de recherche des posts"""
+    with db.engine.begin() as connection:
+        installed = install_search_index(connection, rebuild=True)
+    click.echo('Index de recherche à jour' if installed else 'Aucun index disponible pour cette base : recherche par ILIKE')
+
+@posts_bp.cli.command('publish-scheduled')
+def publish_scheduled_command():
+    """Publier les posts programmés échus, fermer les offres expirées et avancer les activités"""
+    counts = publish_scheduler.run(force=True)
+    for name, count in counts.items():
+        click.echo(f'{name:<22} {count}')
+    click.echo(f"Prochaine échéance : {publish_scheduler.stats()['next_due'] or 'aucune'}")
\ No newline at end of file
@@ -24,12 +24,78 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx'}
     
+    # Traitement des médias (miniatures, dimensions, type MIME) hors requête
+    MEDIA_WORKERS = int(os.environ.get('MEDIA_WORKERS', 2))  # 0 : traitement immédiat
+    MEDIA_PROCESSING_RETRIES = 2
+    MEDIA_PROCESSING_STALE_AFTER = 600  # secondes avant remise en file
+    
+    # Déclinaisons responsive des images (srcset), les formats absents de Pillow sont ignorés
+    MEDIA_RENDITION_WIDTHS = (320, 640, 1024, 1600)
+    MEDIA_RENDITION_FORMATS = ('webp', 'avif')
+    MEDIA_RENDITION_QUALITY = 80
+    MEDIA_RENDITIONS_ON_UPLOAD = True  # sinon générées à la première demande
+    
+    # Upload par morceaux : chaque requête reste sous MAX_CONTENT_LENGTH
+    MEDIA_UPLOAD_MAX_SIZE = int(os.environ.get('MEDIA_UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024))  # 2GB
+    MEDIA_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+    MEDIA_UPLOAD_EXPIRE = 24 * 3600  # secondes avant purge d'un upload abandonné
+    MEDIA_IMPORT_BATCH_SIZE = 100  # fichiers par insertion groupée (upload multiple, import CLI)
+    
+    # Service des fichiers : URLs versionnées (?v=) cachées un an ; le serveur
+    # frontal peut transmettre les octets (X-Accel-Redirect nginx, X-Sendfile Apache)
+    MEDIA_CACHE_MAX_AGE = 31536000
+    MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT')  # ex. /protected-uploads/
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', 'False').lower() == 'true'
+    
+    # Index en mémoire des chemins de médias (routes de fichiers sans requête SQL)
+    MEDIA_INDEX_MAX_ENTRIES = 4096
+    MEDIA_INDEX_TTL = 300  # secondes, borne la désynchronisation entre workers
+    MEDIA_INDEX_WARM = 500  # médias récents préchargés au démarrage
+    
+    # Stockage des fichiers : local (UPLOAD_FOLDER) ou s3 (AWS, MinIO... ; nécessite boto3).
+    # Avec s3, le disque local ne sert que de cache de travail et les fichiers
+    # sont lus et envoyés directement par les clients via des URLs présignées
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+    STORAGE_PRESIGN_EXPIRE = int(os.environ.get('STORAGE_PRESIGN_EXPIRE', 3600))  # secondes
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # ex. http://localhost:9000 pour MinIO
+    S3_REGION = os.environ.get('S3_REGION', 'us-east-1')
+    S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID')
+    S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY')
+    S3_PREFIX = os.environ.get('S3_PREFIX', '')
+    
+    # Cache du rendu Markdown (clé : empreinte du contenu, jamais périmée)
+    MARKDOWN_CACHE_MAX_ENTRIES = 256
+    MARKDOWN_CACHE_TTL = 24 * 3600  # secondes, libère les brouillons abandonnés
+    MARKDOWN_BLOCK_CACHE_MAX_ENTRIES = 4096  # blocs de la prévisualisation incrémentale
+    
     # Session
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
     
     # API
     API_VERSION = 'v1'
     
+    # Cache des réponses de l'API publique : memory, redis ou none
+    API_CACHE_BACKEND = os.environ.get('API_CACHE_BACKEND', 'memory')
+    API_CACHE_TTL = int(os.environ.get('API_CACHE_TTL', 300))  # secondes
+    API_CACHE_MAX_ENTRIES = int(os.environ.get('API_CACHE_MAX_ENTRIES', 1024))
+    API_CACHE_REDIS_URL = os.environ.get('REDIS_URL')
+    API_BATCH_MAX_ITEMS = 50  # slugs/ids par appel à /api/posts/batch
+    
+    # Tâches de fond et compteurs de vues
+    BACKGROUND_TASKS_ENABLED = True
+    VIEW_COUNTER_FLUSH_INTERVAL = int(os.environ.get('VIEW_COUNTER_FLUSH_INTERVAL', 30))  # secondes
+    VIEW_COUNTER_MAX_KEYS = 10000
+    
+    # Publication programmée des posts, fermeture des offres et statut des activités
+    SCHEDULER_INTERVAL = 30  # secondes entre deux passages
+    SCHEDULER_BATCH_SIZE = 100  # posts publiés par transaction
+    SCHEDULER_REFRESH = 300  # relecture de la prochaine échéance (changements des autres workers)
+    
+    # Tokens API : durée du cache de validation et écriture de last_used
+    API_TOKEN_CACHE_TTL = 60  # secondes
+    API_TOKEN_LAST_USED_INTERVAL = 300  # au plus une écriture par token sur cette durée
+    
     # Site principal
     MAIN_SITE_URL = os.environ.get('MAIN_SITE_URL', 'https://labmath-scsmaubmar-org.onrender.com')
     
@@ -60,6 +126,9 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    BACKGROUND_TASKS_ENABLED = False
+    MEDIA_WORKERS = 0
+    MEDIA_INDEX_WARM = 0
 
 config = {
     'development': DevelopmentConfig,
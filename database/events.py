@@ -0,0 +1,58 @@
+import logging
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# (modèles surveillés, fonction appelée après commit)
+_commit_handlers = []
+
+def on_commit(*models):
+    """Décorateur : appeler la fonction après chaque commit modifiant ces modèles
+
+    La fonction reçoit la liste des changements sous forme de tuples
+    (classe du modèle, identifiant, opération) où l'opération vaut
+    'insert', 'update' ou 'delete'. Les objets eux-mêmes ne sont pas
+    transmis : après le commit ils sont expirés ou détachés.
+    """
+    def decorator(f):
+        _commit_handlers.append((models, f))
+        return f
+    return decorator
+
+def _record(session, instances, operation):
+    changes = session.info.setdefault('pending_changes', [])
+    for obj in instances:
+        state = inspect(obj)
+        # Objets insérés : clé d'identité attribuée après after_flush, mais
+        # clé primaire déjà renseignée par l'INSERT
+        identity = state.identity or tuple(state.mapper.primary_key_from_instance(obj))
+        if all(value is None for value in identity):
+            continue
+        pk = identity[0] if len(identity) == 1 else identity
+        changes.append((type(obj), pk, operation))
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    # Dans after_flush, new/dirty/deleted reflètent encore l'état d'avant le flush
+    _record(session, session.new, 'insert')
+    _record(session, [obj for obj in session.dirty if session.is_modified(obj)], 'update')
+    _record(session, session.deleted, 'delete')
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_changes(session):
+    changes = session.info.pop('pending_changes', None)
+    if not changes:
+        return
+    for models, handler in _commit_handlers:
+        matching = [change for change in changes if issubclass(change[0], models)]
+        if not matching:
+            continue
+        try:
+            handler(matching)
+        except Exception:
+            logger.exception('Erreur dans le hook après commit %s', handler.__name__)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('pending_changes', None)
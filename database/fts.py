@@ -0,0 +1,5 @@
+# Utilitaires communs aux index plein texte (médiathèque, posts)
+
+def fts5_available(connection):
+    """Le SQLite de `connection` est-il compilé avec FTS5 ?"""
+    return bool(connection.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar())
@@ -65,6 +65,10 @@ class Category(db.Model):
 class Post(db.Model):
     """Articles/Publications"""
     __tablename__ = 'posts'
+    __table_args__ = (
+        # Pagination par curseur sur (published_at, id)
+        db.Index('ix_posts_status_published_at_id', 'status', 'published_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -73,7 +77,7 @@ class Post(db.Model):
     content = db.Column(db.Text, nullable=False)
     content_html = db.Column(db.Text)  # HTML généré pour performance
     post_type = db.Column(db.String(20), nullable=False)  # article, activity, announcement, offer
-    status = db.Column(db.String(20), default='draft')  # draft, published, archived
+    status = db.Column(db.String(20), default='draft')  # draft, scheduled, published, archived
     featured_image = db.Column(db.String(300))
     views = db.Column(db.Integer, default=0)
     likes = db.Column(db.Integer, default=0)
@@ -90,6 +94,8 @@ class Post(db.Model):
     # Relations
     media = db.relationship('PostMedia', backref='post', lazy='dynamic', cascade='all, delete-orphan')
     tags = db.relationship('Tag', secondary='post_tags', backref='posts', lazy='dynamic')
+    # Vue en lecture seule des tags, chargeable en amont (selectinload) par l'API
+    tag_list = db.relationship('Tag', secondary='post_tags', viewonly=True)
     
     def __init__(self, **kwargs):
         super(Post, self).__init__(**kwargs)
@@ -139,15 +145,34 @@ class PostMedia(db.Model):
     order = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    # Clé étrangère
+    # Clés étrangères
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
+    blob_id = db.Column(db.Integer, db.ForeignKey('media_blobs.id'), index=True)
     
     def __repr__(self):
         return f'<PostMedia {self.filename}>'
 
+class MediaBlob(db.Model):
+    """Contenu d'un fichier stocké une seule fois, adressé par son empreinte SHA-256"""
+    __tablename__ = 'media_blobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)
+    file_size = db.Column(db.Integer)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # lignes Media/PostMedia qui l'utilisent
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<MediaBlob {self.sha256[:12]} x{self.ref_count}>'
+
 class Media(db.Model):
     """Médias de la bibliothèque"""
     __tablename__ = 'media'
+    __table_args__ = (
+        # Filtres de la médiathèque (type, période) triés par date
+        db.Index('ix_media_file_type_created_at', 'file_type', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(300), nullable=False)
@@ -162,15 +187,48 @@ class Media(db.Model):
     description = db.Column(db.Text)
     alt_text = db.Column(db.String(300))
     is_public = db.Column(db.Boolean, default=True)
-    uploaded_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    processing_status = db.Column(db.String(20), default='ready')  # processing, ready, failed
+    processing_claimed_at = db.Column(db.DateTime)  # dernière remise en file (requeue_stale)
+    uploaded_by = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    blob_id = db.Column(db.Integer, db.ForeignKey('media_blobs.id'), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Relations
+    blob = db.relationship('MediaBlob')
+    renditions = db.relationship('MediaRendition', backref='media', cascade='all, delete-orphan')
+    
     def __repr__(self):
         return f'<Media {self.filename}>'
 
+class MediaRendition(db.Model):
+    """Déclinaisons d'une image (largeurs et formats pour srcset)"""
+    __tablename__ = 'media_renditions'
+    __table_args__ = (
+        db.UniqueConstraint('media_id', 'width', 'format', name='uq_media_renditions_media_width_format'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer)
+    format = db.Column(db.String(10), nullable=False)  # webp, avif, jpeg
+    file_path = db.Column(db.String(500), nullable=False)
+    file_size = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Clé étrangère
+    media_id = db.Column(db.Integer, db.ForeignKey('media.id', ondelete='CASCADE'), nullable=False)
+    
+    def __repr__(self):
+        return f'<MediaRendition {self.media_id} {self.width}w {self.format}>'
+
 class Activity(db.Model):
     """Activités du laboratoire (liées aux posts)"""
     __tablename__ = 'activities'
+    __table_args__ = (
+        db.Index('ix_activities_start_date_id', 'start_date', 'id'),
+        # Transitions datées du planificateur
+        db.Index('ix_activities_status_start_date', 'status', 'start_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -193,7 +251,7 @@ class Activity(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), unique=True)
     
     # Relation
-    post = db.relationship('Post', backref='activity', uselist=False)
+    post = db.relationship('Post', backref=db.backref('activity', uselist=False))
     
     def __init__(self, **kwargs):
         super(Activity, self).__init__(**kwargs)
@@ -206,6 +264,11 @@ class Activity(db.Model):
 class Offer(db.Model):
     """Offres (emplois, stages, appels d'offres)"""
     __tablename__ = 'offers'
+    __table_args__ = (
+        db.Index('ix_offers_created_at_id', 'created_at', 'id'),
+        # Fermeture automatique à la date limite
+        db.Index('ix_offers_status_application_deadline', 'status', 'application_deadline'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -229,7 +292,7 @@ class Offer(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), unique=True)
     
     # Relation
-    post = db.relationship('Post', backref='offer', uselist=False)
+    post = db.relationship('Post', backref=db.backref('offer', uselist=False))
     
     def __init__(self, **kwargs):
         super(Offer, self).__init__(**kwargs)
@@ -0,0 +1,75 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+class InvalidCursor(ValueError):
+    """Curseur de pagination illisible ou incompatible"""
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+def _load_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+def encode_cursor(values):
+    """Encoder les valeurs de la clé de tri en curseur opaque"""
+    raw = json.dumps([_dump_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, size):
+    """Décoder un curseur opaque en valeurs de la clé de tri"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != size:
+            raise InvalidCursor('taille de curseur inattendue')
+        values = [_load_value(v) for v in values]
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e))
+    # Clés de tri : dates et identifiants seulement (bool est un int pour Python)
+    if not all(isinstance(v, (datetime, int)) and not isinstance(v, bool) for v in values):
+        raise InvalidCursor('valeur de curseur inattendue')
+    return values
+
+def _seek_condition(columns, values, descending):
+    """Condition « strictement après » sur un tuple de colonnes"""
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        after = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal, after))
+    return or_(*clauses)
+
+def keyset_filter(query, columns):
+    """Lignes paginables par clé : celles dont aucune colonne de tri n'est nulle"""
+    return query.filter(*[column.isnot(None) for column in columns])
+
+def keyset_page(query, columns, cursor=None, limit=10, descending=False):
+    """Récupérer une page par recherche de clé (keyset) plutôt que par OFFSET
+
+    `columns` est la clé de tri, terminée par une colonne unique (l'id). Le
+    coût d'une page ne dépend pas de sa profondeur : la base parcourt l'index
+    à partir du dernier élément vu au lieu de compter les lignes sautées.
+    Retourne les éléments et le curseur de la page suivante (ou None).
+    """
+    query = keyset_filter(query, columns)
+
+    if cursor:
+        values = decode_cursor(cursor, len(columns))
+        query = query.filter(_seek_condition(columns, values, descending))
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+    items = query.order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column in columns])
+
+    return items, next_cursor
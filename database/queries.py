@@ -0,0 +1,111 @@
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload, load_only
+from database.models import db, Post, Activity, Offer, Category
+
+# Colonnes et relations à charger pour chaque champ exposé par l'API
+POST_COLUMNS = {
+    'id': Post.id,
+    'title': Post.title,
+    'slug': Post.slug,
+    'excerpt': Post.excerpt,
+    'content': Post.content_html,
+    'post_type': Post.post_type,
+    'featured_image': Post.featured_image,
+    'published_at': Post.published_at,
+    'views': Post.views,
+    'likes': Post.likes
+}
+
+POST_RELATIONS = {
+    'author': lambda: joinedload(Post.author),
+    'category': lambda: joinedload(Post.category_ref),
+    'activity': lambda: joinedload(Post.activity),
+    'offer': lambda: joinedload(Post.offer),
+    'tags': lambda: selectinload(Post.tag_list)
+}
+
+ACTIVITY_COLUMNS = {
+    name: getattr(Activity, name) for name in (
+        'id', 'title', 'slug', 'description', 'activity_type', 'start_date', 'end_date', 'location',
+        'is_online', 'registration_url', 'max_participants', 'current_participants', 'status'
+    )
+}
+
+OFFER_COLUMNS = {
+    name: getattr(Offer, name) for name in (
+        'id', 'title', 'slug', 'description', 'offer_type', 'contract_type', 'location', 'salary_range',
+        'experience_required', 'application_deadline', 'start_date', 'is_remote', 'status', 'views',
+        'applications_count'
+    )
+}
+
+# Champs servis par le post lié d'une activité ou d'une offre
+LINKED_POST_FIELDS = ('featured_image', 'post_slug')
+
+def linked_post(relationship):
+    """Post lié joint avec ses seules colonnes servies (ni contenu ni HTML)"""
+    return joinedload(relationship).load_only(Post.slug, Post.featured_image)
+
+def projection(fields, columns, relations, always):
+    """Options de chargement limitées aux champs demandés
+
+    Seules les colonnes nécessaires sont sélectionnées (load_only) et les
+    relations non demandées ne sont ni jointes ni chargées. `always` liste
+    les colonnes requises par le tri, la pagination et Last-Modified.
+    """
+    selected = list(always) + [columns[field] for field in fields if field in columns]
+    options = [load_only(*dict.fromkeys(selected))]
+    options += [relations[field]() for field in fields if field in relations]
+    return options
+
+def with_post_relations(query, fields=None):
+    """Charger en amont les relations d'une requête de posts
+
+    Auteur, catégorie, activité et offre sont joints à la requête principale,
+    les tags sont chargés par une seule requête IN supplémentaire : une page
+    de posts coûte donc toujours deux requêtes, quelle que soit sa taille.
+    Avec `fields`, seules les colonnes et relations de ces champs sont chargées.
+    """
+    if fields is None:
+        return query.options(*[loader() for loader in POST_RELATIONS.values()])
+    return query.options(*projection(fields, POST_COLUMNS, POST_RELATIONS,
+                                     (Post.id, Post.published_at, Post.updated_at)))
+
+def published_posts():
+    """Requête de base des posts publiés"""
+    return Post.query.filter_by(status='published')
+
+def activities_with_post(query=None, fields=None):
+    """Activités avec leur post lié chargé dans la même requête"""
+    query = query if query is not None else Activity.query
+    if fields is None:
+        return query.options(linked_post(Activity.post))
+    options = projection(fields, ACTIVITY_COLUMNS, {}, (Activity.id, Activity.start_date, Activity.updated_at))
+    if any(field in fields for field in LINKED_POST_FIELDS):
+        options.append(linked_post(Activity.post))
+    return query.options(*options)
+
+def offers_with_post(query=None, fields=None):
+    """Offres avec leur post lié chargé dans la même requête"""
+    query = query if query is not None else Offer.query
+    if fields is None:
+        return query.options(linked_post(Offer.post))
+    options = projection(fields, OFFER_COLUMNS, {}, (Offer.id, Offer.created_at, Offer.updated_at))
+    if any(field in fields for field in LINKED_POST_FIELDS):
+        options.append(linked_post(Offer.post))
+    return query.options(*options)
+
+def categories_with_post_counts():
+    """Catégories actives avec leur nombre de posts publiés, en une requête
+
+    Les comptes sont agrégés par un GROUP BY joint en LEFT OUTER JOIN, au
+    lieu d'un COUNT par catégorie. Retourne des tuples (catégorie, nombre).
+    """
+    counts = db.session.query(
+        Post.category_id.label('category_id'),
+        func.count(Post.id).label('post_count')
+    ).filter(Post.status == 'published').group_by(Post.category_id).subquery()
+
+    return db.session.query(Category, func.coalesce(counts.c.post_count, 0)).outerjoin(
+        counts, counts.c.category_id == Category.id
+    ).filter(Category.is_active.is_(True)).all()
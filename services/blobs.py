@@ -0,0 +1,330 @@
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from flask import current_app
+from sqlalchemy import bindparam, event, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database.models import db, Media, MediaBlob, MediaRendition, PostMedia
+from services.renditions import rendition_path
+from services.storage import StorageError, storage
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+def blob_folder():
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'blobs')
+
+def blob_path(sha256, ext):
+    """Chemin d'un contenu : blobs/ab/cd/<empreinte><ext> (répertoires de taille bornée)"""
+    return os.path.join(blob_folder(), sha256[:2], sha256[2:4], f'{sha256}{ext}').replace('\\', '/')
+
+def temp_path():
+    tmp_dir = os.path.join(blob_folder(), 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    return os.path.join(tmp_dir, uuid.uuid4().hex)
+
+def write_stream(stream):
+    """Écrire un flux dans un fichier temporaire en calculant son empreinte au passage
+
+    Retourne (empreinte, chemin temporaire, taille) : le contenu n'est lu
+    qu'une fois et jamais chargé entièrement en mémoire.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = temp_path()
+    try:
+        with open(tmp_path, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return digest.hexdigest(), tmp_path, size
+
+def hash_file(path):
+    """Empreinte SHA-256 d'un fichier existant, lue par morceaux"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _place(tmp_path, blob, created):
+    """Installer le fichier temporaire comme contenu du blob, sauf s'il est déjà stocké"""
+    if not created and storage.exists(blob.file_path):
+        os.remove(tmp_path)
+        return
+    os.makedirs(os.path.dirname(blob.file_path), exist_ok=True)
+    os.replace(tmp_path, blob.file_path)
+    storage.publish(blob.file_path)
+
+def acquire_blob(sha256, tmp_path, size, ext):
+    """Prendre une référence sur le contenu `sha256`, créé au besoin
+
+    Le fichier temporaire devient le blob s'il n'existe pas encore, sinon il
+    est supprimé ; `tmp_path` None : contenu déjà placé par l'appelant.
+    L'incrément du compteur est ajouté à la session courante : il est validé
+    dans la même transaction que la ligne qui référence le blob.
+    """
+    blob = MediaBlob.query.filter_by(sha256=sha256).first()
+    created = blob is None
+    if blob is None:
+        blob = MediaBlob(sha256=sha256, file_path=blob_path(sha256, ext), file_size=size, ref_count=0)
+        try:
+            # Point de sauvegarde : un conflit n'annule pas le reste de la transaction
+            with db.session.begin_nested():
+                db.session.add(blob)
+        except IntegrityError:
+            # Même contenu inséré en parallèle : réutiliser la ligne existante
+            blob = MediaBlob.query.filter_by(sha256=sha256).one()
+            created = False
+
+    if tmp_path is not None:
+        _place(tmp_path, blob, created)
+
+    # Incrément fait par la base pour rester juste entre workers
+    blob.ref_count = MediaBlob.ref_count + 1
+    db.session.flush()
+    return blob
+
+def acquire_blobs(staged):
+    """Version par lot de `acquire_blob` : quelques requêtes quelle que soit la taille du lot
+
+    `staged` liste des tuples (empreinte, chemin temporaire, taille, extension),
+    éventuellement avec plusieurs fois la même empreinte. Retourne un dict
+    empreinte -> blob, chaque occurrence ayant ajouté une référence.
+    """
+    counts = {}
+    for sha256, _, _, _ in staged:
+        counts[sha256] = counts.get(sha256, 0) + 1
+
+    blobs = {blob.sha256: blob for blob in MediaBlob.query.filter(MediaBlob.sha256.in_(counts)).all()}
+    new_blobs = []
+    for sha256, _, size, ext in staged:
+        if sha256 not in blobs:
+            blobs[sha256] = MediaBlob(sha256=sha256, file_path=blob_path(sha256, ext), file_size=size, ref_count=0)
+            new_blobs.append(blobs[sha256])
+    if new_blobs:
+        try:
+            with db.session.begin_nested():
+                db.session.add_all(new_blobs)
+        except IntegrityError:
+            # Contenu inséré en parallèle : repli sur le chemin unitaire, seul
+            # le point de sauvegarde est annulé
+            return {sha256: acquire_blob(sha256, tmp_path, size, ext) for sha256, tmp_path, size, ext in staged}
+
+    created = {blob.sha256 for blob in new_blobs}
+    placed = set()
+    for sha256, tmp_path, _, _ in staged:
+        if sha256 in placed:
+            os.remove(tmp_path)
+            continue
+        _place(tmp_path, blobs[sha256], sha256 in created)
+        placed.add(sha256)
+
+    table = MediaBlob.__table__
+    db.session.execute(
+        table.update()
+        .where(table.c.id == bindparam('b_id'))
+        .values(ref_count=table.c.ref_count + bindparam('b_count')),
+        [{'b_id': blobs[sha256].id, 'b_count': count} for sha256, count in counts.items()]
+    )
+    for blob in blobs.values():
+        db.session.expire(blob, ['ref_count'])
+    return blobs
+
+def store_upload(file, ext):
+    """Stocker un fichier uploadé par contenu et retourner son blob référencé"""
+    sha256, tmp_path, size = write_stream(file.stream)
+    try:
+        return acquire_blob(sha256, tmp_path, size, ext)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def blob_files(sha256, file_path):
+    """Fichiers dérivés d'un blob : contenu, miniature et dossier des déclinaisons"""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    return (
+        file_path,
+        os.path.join(upload_folder, 'thumbnails', os.path.basename(file_path)),
+        os.path.join(upload_folder, 'renditions', sha256)
+    )
+
+def remove_blob_files(sha256, file_path):
+    content, thumbnail, renditions = blob_files(sha256, file_path)
+    for remove, path in ((storage.remove, content), (storage.remove, thumbnail), (storage.remove_tree, renditions)):
+        try:
+            remove(path)
+        except (OSError, StorageError) as e:
+            logger.error('Erreur suppression fichier %s: %s', path, e)
+
+# Libération des références : faite au flush pour couvrir toutes les
+# suppressions (route, cascade depuis un post, script), les fichiers n'étant
+# effacés qu'après le commit.
+
+@event.listens_for(Session, 'after_flush')
+def _release_blobs(session, flush_context):
+    released = {}
+    for obj in session.deleted:
+        if isinstance(obj, (Media, PostMedia)) and obj.blob_id is not None:
+            released[obj.blob_id] = released.get(obj.blob_id, 0) + 1
+    if not released:
+        return
+
+    blobs = MediaBlob.__table__
+    connection = session.connection()
+    for blob_id, count in released.items():
+        connection.execute(
+            blobs.update().where(blobs.c.id == blob_id).values(ref_count=blobs.c.ref_count - count)
+        )
+    orphans = connection.execute(
+        select(blobs.c.id, blobs.c.sha256, blobs.c.file_path)
+        .where(blobs.c.id.in_(released), blobs.c.ref_count <= 0)
+    ).all()
+    if orphans:
+        connection.execute(blobs.delete().where(blobs.c.id.in_([row.id for row in orphans])))
+        session.info.setdefault('orphan_blobs', []).extend((row.sha256, row.file_path) for row in orphans)
+
+@event.listens_for(Session, 'after_commit')
+def _remove_orphan_files(session):
+    for sha256, file_path in session.info.pop('orphan_blobs', ()):
+        remove_blob_files(sha256, file_path)
+
+@event.listens_for(Session, 'after_rollback')
+def _keep_orphan_files(session):
+    session.info.pop('orphan_blobs', None)
+
+# Champs calculés par le pool de traitement, identiques pour un même contenu
+PROCESSED_FIELDS = ('mime_type', 'file_type', 'width', 'height', 'thumbnail_path')
+
+def reuse_processing(media):
+    """Reprendre les résultats d'un doublon déjà traité, sans nouveau job
+
+    Retourne False si aucun média prêt ne partage ce contenu.
+    """
+    source = Media.query.filter(
+        Media.blob_id == media.blob_id,
+        Media.processing_status == 'ready'
+    ).order_by(Media.id).first()
+    if source is None:
+        return False
+
+    for field in PROCESSED_FIELDS:
+        setattr(media, field, getattr(source, field))
+    media.processing_status = 'ready'
+    for rendition in source.renditions:
+        media.renditions.append(MediaRendition(
+            width=rendition.width,
+            height=rendition.height,
+            format=rendition.format,
+            file_path=rendition.file_path,
+            file_size=rendition.file_size
+        ))
+    return True
+
+def link_or_copy(src, dst):
+    # Lien physique si possible : pas de copie des octets sur le même disque
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def _adopt(src, dst):
+    """Placer `src` en `dst` si la cible n'existe pas encore"""
+    if src and os.path.exists(src) and not os.path.exists(dst):
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp_path = temp_path()
+        link_or_copy(src, tmp_path)
+        os.replace(tmp_path, dst)
+
+def backfill_blobs(batch_size=100, dry_run=False):
+    """Convertir les fichiers existants au stockage par contenu
+
+    Les lignes Media et PostMedia sans blob sont parcourues par lots (ordre
+    des identifiants, mémoire constante). Chaque fichier est rattaché au blob
+    de son contenu ; miniature et déclinaisons suivent. Les anciens fichiers
+    ne sont supprimés qu'après le commit du lot.
+    """
+    stats = {'files': 0, 'blobs_created': 0, 'deduplicated': 0, 'bytes_reclaimed': 0, 'missing': 0}
+    seen = set()
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+
+    for model in (Media, PostMedia):
+        last_id = 0
+        while True:
+            rows = model.query.filter(model.blob_id.is_(None), model.id > last_id) \
+                .order_by(model.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            superseded = []
+
+            for row in rows:
+                if not row.file_path or not os.path.exists(row.file_path):
+                    stats['missing'] += 1
+                    continue
+
+                sha256 = hash_file(row.file_path)
+                size = os.path.getsize(row.file_path)
+                stats['files'] += 1
+                if sha256 in seen or MediaBlob.query.filter_by(sha256=sha256).first() is not None:
+                    stats['deduplicated'] += 1
+                    stats['bytes_reclaimed'] += size
+                else:
+                    stats['blobs_created'] += 1
+                seen.add(sha256)
+                if dry_run:
+                    continue
+
+                tmp_path = temp_path()
+                link_or_copy(row.file_path, tmp_path)
+                blob = acquire_blob(sha256, tmp_path, size, os.path.splitext(row.file_path)[1].lower())
+                superseded.append(row.file_path)
+
+                if row.thumbnail_path:
+                    thumbnail_path = os.path.join(upload_folder, 'thumbnails',
+                                                  os.path.basename(blob.file_path)).replace('\\', '/')
+                    _adopt(row.thumbnail_path, thumbnail_path)
+                    if row.thumbnail_path != thumbnail_path:
+                        superseded.append(row.thumbnail_path)
+                    row.thumbnail_path = thumbnail_path
+
+                if model is Media:
+                    for rendition in row.renditions:
+                        target = rendition_path(sha256, rendition.width, rendition.format)
+                        _adopt(rendition.file_path, target)
+                        if rendition.file_path != target:
+                            superseded.append(rendition.file_path)
+                        rendition.file_path = target
+                    row.filename = os.path.basename(blob.file_path)
+                    superseded.append(os.path.join(upload_folder, 'renditions', str(row.id)))
+
+                row.blob_id = blob.id
+                row.file_path = blob.file_path
+
+            if not dry_run:
+                db.session.commit()
+                for path in superseded:
+                    try:
+                        if os.path.isdir(path):
+                            shutil.rmtree(path)
+                        elif os.path.exists(path):
+                            os.remove(path)
+                    except OSError as e:
+                        logger.error('Erreur suppression fichier %s: %s', path, e)
+            db.session.expunge_all()
+
+    return stats
@@ -0,0 +1,195 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request
+
+from database.events import on_commit
+from database.models import Post, Category, Tag, Activity, Offer
+
+try:
+    import redis
+except ImportError:  # backend partagé optionnel
+    redis = None
+
+class LRUCache:
+    """Cache en mémoire du processus, borné en taille, avec expiration"""
+
+    def __init__(self, max_entries=1024, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl or self.default_ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr(self, key):
+        # Les compteurs (versions) ne sont jamais évincés par le LRU
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def get_counter(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+class RedisCache:
+    """Cache partagé entre workers, sur un client compatible Redis
+
+    Tout objet exposant get/set(ex=)/delete/incr convient, ce qui permet de
+    remplacer le serveur par un substitut local en développement.
+    """
+
+    def __init__(self, client, prefix='labmath:', default_ttl=300):
+        self.client = client
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl or self.default_ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+    def get_counter(self, key):
+        return int(self.client.get(self.prefix + key) or 0)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+def add_validators(response):
+    """Ajouter un ETag fort et forcer la revalidation par le client"""
+    if not response.get_etag()[0]:
+        response.add_etag()
+    response.cache_control.no_cache = True
+    return response
+
+class ResponseCache:
+    """Cache versionné des réponses de l'API publique
+
+    Chaque clé inclut un numéro de version du contenu : un commit touchant un
+    post, une catégorie, un tag, une activité ou une offre incrémente la
+    version, ce qui rend caduques toutes les entrées d'un coup. Avec le
+    backend mémoire, les autres workers ne voient l'invalidation qu'à
+    l'expiration du TTL ; le backend Redis la partage immédiatement.
+    """
+
+    VERSION_KEY = 'api:version'
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('API_CACHE_BACKEND', 'memory')
+        ttl = app.config.get('API_CACHE_TTL', 300)
+
+        if backend == 'redis':
+            if redis is None:
+                raise RuntimeError("Le backend de cache 'redis' nécessite le paquet redis")
+            client = redis.Redis.from_url(app.config['API_CACHE_REDIS_URL'])
+            self.backend = RedisCache(client, default_ttl=ttl)
+        elif backend == 'memory':
+            self.backend = LRUCache(app.config.get('API_CACHE_MAX_ENTRIES', 1024), ttl)
+        else:
+            self.backend = None
+
+        app.extensions['response_cache'] = self
+
+    def version(self):
+        return self.backend.get_counter(self.VERSION_KEY)
+
+    def invalidate(self):
+        """Rendre caduques toutes les réponses en cache"""
+        if self.backend is not None:
+            self.backend.incr(self.VERSION_KEY)
+
+    def make_key(self):
+        args = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+        return f'api:{self.version()}:{request.path}?{args}'
+
+    def cached(self, f):
+        """Décorateur : servir la réponse JSON depuis le cache si possible
+
+        Les réponses portent un ETag fort (empreinte du corps, calculée une
+        seule fois par version du contenu) et, si la vue l'a renseigné, un
+        Last-Modified. Une requête conditionnelle qui correspond à l'entrée
+        en cache reçoit un 304 sans requête SQL ni sérialisation.
+        """
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            # Seules les lectures sont mises en cache : la clé ignore le corps de la requête
+            if self.backend is None or request.method not in ('GET', 'HEAD'):
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code == 200:
+                    add_validators(response).make_conditional(request)
+                return response
+
+            key = self.make_key()
+            entry = self.backend.get(key)
+            if entry is not None:
+                response = current_app.response_class(entry['body'], mimetype=entry['mimetype'])
+                response.set_etag(entry['etag'])
+                response.last_modified = entry['last_modified']
+                add_validators(response)
+                response.headers['X-Cache'] = 'HIT'
+                return response.make_conditional(request)
+
+            response = current_app.make_response(f(*args, **kwargs))
+            response.headers['X-Cache'] = 'MISS'
+            if response.status_code == 200 and not response.direct_passthrough:
+                add_validators(response)
+                self.backend.set(key, {
+                    'body': response.get_data(),
+                    'mimetype': response.mimetype,
+                    'etag': response.get_etag()[0],
+                    'last_modified': response.last_modified
+                })
+                response.make_conditional(request)
+            return response
+
+        return decorated
+
+response_cache = ResponseCache()
+
+@on_commit(Post, Category, Tag, Activity, Offer)
+def _invalidate_content(changes):
+    response_cache.invalidate()
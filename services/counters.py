@@ -0,0 +1,90 @@
+import logging
+import threading
+from collections import defaultdict
+from sqlalchemy import bindparam, func, select
+
+from database.models import db, Post, Offer
+
+logger = logging.getLogger(__name__)
+
+class ViewCounter:
+    """Accumulateur de vues en mémoire, vidé périodiquement en base
+
+    Une lecture publique ne fait plus qu'incrémenter un compteur local. Le
+    vidage écrit les totaux agrégés par post en `UPDATE ... SET views =
+    views + n` : l'opération est atomique côté base, donc sûre même avec
+    plusieurs workers qui vident chacun leur propre tampon. La vue d'un post
+    lié à une offre compte aussi pour `offers.views`.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._pending = defaultdict(int)
+        self._lock = threading.Lock()
+        self.flushed = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+
+    def increment(self, slug, count=1):
+        with self._lock:
+            if slug not in self._pending and len(self._pending) >= self.max_keys:
+                self.dropped += count
+                return
+            self._pending[slug] += count
+
+    def _requeue(self, pending):
+        with self._lock:
+            for slug, count in pending.items():
+                if slug not in self._pending and len(self._pending) >= self.max_keys:
+                    self.dropped += count
+                else:
+                    self._pending[slug] += count
+
+    def flush(self):
+        """Écrire les vues accumulées ; retourne le nombre de vues écrites"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+        if not pending:
+            return 0
+
+        params = [{'b_slug': slug, 'b_count': count} for slug, count in pending.items()]
+        posts = Post.__table__
+        offers = Offer.__table__
+        post_id = select(posts.c.id).where(posts.c.slug == bindparam('b_slug')).scalar_subquery()
+
+        try:
+            db.session.execute(
+                posts.update()
+                .where(posts.c.slug == bindparam('b_slug'))
+                .values(views=func.coalesce(posts.c.views, 0) + bindparam('b_count')),
+                params
+            )
+            db.session.execute(
+                offers.update()
+                .where(offers.c.post_id == post_id)
+                .values(views=func.coalesce(offers.c.views, 0) + bindparam('b_count')),
+                params
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self.failed_flushes += 1
+            logger.exception('Échec du vidage des compteurs de vues')
+            self._requeue(pending)
+            return 0
+
+        total = sum(pending.values())
+        self.flushed += total
+        return total
+
+    def stats(self):
+        with self._lock:
+            pending = sum(self._pending.values())
+        return {
+            'pending': pending,
+            'flushed': self.flushed,
+            'failed_flushes': self.failed_flushes,
+            'dropped': self.dropped
+        }
+
+view_counter = ViewCounter()
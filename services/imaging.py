@@ -0,0 +1,89 @@
+import hashlib
+import os
+import magic
+from PIL import Image, features
+
+# Ce module ne dépend ni de Flask ni de la base : ses fonctions sont
+# exécutées dans les processus du pool de traitement des médias.
+
+# Formats de déclinaison : nom court -> (format Pillow, module requis)
+RENDITION_FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'avif': ('AVIF', 'avif'),
+    'jpeg': ('JPEG', None)
+}
+
+def supported_formats(formats):
+    """Formats de déclinaison réellement disponibles dans ce Pillow"""
+    supported = []
+    for fmt in formats:
+        if fmt not in RENDITION_FORMATS:
+            continue
+        module = RENDITION_FORMATS[fmt][1]
+        if module is None or features.check(module):
+            supported.append(fmt)
+    return supported
+
+def render_rendition(img, output_path, width, fmt, quality=80):
+    """Écrire une déclinaison de `img` à la largeur donnée (jamais agrandie)"""
+    target_width = min(width, img.width)
+    height = max(1, round(img.height * target_width / img.width))
+    resized = img if target_width == img.width else img.resize((target_width, height), Image.LANCZOS)
+
+    if resized.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        resized = resized.convert('RGBA' if 'transparency' in resized.info else 'RGB')
+    if fmt == 'jpeg' and resized.mode != 'RGB':
+        resized = resized.convert('RGB')
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = f'{output_path}.tmp'
+    resized.save(tmp_path, RENDITION_FORMATS[fmt][0], quality=quality)
+    os.replace(tmp_path, output_path)
+
+    return {
+        'width': width,
+        'height': height,
+        'format': fmt,
+        'file_path': output_path,
+        'file_size': os.path.getsize(output_path)
+    }
+
+def process_file(file_path, thumbnail_path=None, size=(300, 200), renditions=(), quality=80):
+    """Analyser un fichier uploadé : type MIME, dimensions, déclinaisons et miniature
+
+    `renditions` liste des tuples (largeur, format, chemin) ; les largeurs
+    supérieures ou égales à celle de l'image sont ignorées. Les erreurs sont
+    propagées pour que l'appelant puisse réessayer.
+    """
+    mime_type = magic.from_file(file_path, mime=True)
+    result = {
+        'mime_type': mime_type,
+        'file_type': mime_type.split('/')[0],
+        'width': None,
+        'height': None,
+        'thumbnail_path': None,
+        'renditions': []
+    }
+
+    if mime_type.startswith('image/'):
+        with Image.open(file_path) as img:
+            result['width'], result['height'] = img.size
+            for width, fmt, output_path in renditions:
+                if width < img.width:
+                    result['renditions'].append(render_rendition(img, output_path, width, fmt, quality))
+            if thumbnail_path:
+                img.thumbnail(size)
+                img.save(thumbnail_path)
+                result['thumbnail_path'] = thumbnail_path
+
+    return result
+
+def file_digest(file_path):
+    """Empreinte SHA-256 et taille d'un fichier, lu par blocs (imports en masse)"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return file_path, digest.hexdigest(), size
@@ -0,0 +1,53 @@
+import hashlib
+import mimetypes
+import os
+from flask import current_app, request, send_file
+
+def fingerprint(media):
+    """Empreinte courte du contenu servi, utilisée comme version dans les URLs
+
+    Calculée sans accès disque ni requête : le chemin d'un blob contient
+    l'empreinte SHA-256 de son contenu, et les anciens fichiers (nom
+    horodaté) ne sont jamais réécrits en place.
+    """
+    return hashlib.md5(f'{media.file_path}|{media.file_size}'.encode('utf-8')).hexdigest()[:12]
+
+def media_url(media):
+    return f'/media/{media.id}/file?v={fingerprint(media)}'
+
+def thumbnail_url(media):
+    if not media.thumbnail_path:
+        return None
+    return f'/media/{media.id}/thumbnail?v={fingerprint(media)}'
+
+def is_fingerprinted(media):
+    """La requête vise-t-elle la version courante du fichier ?"""
+    return request.args.get('v') == fingerprint(media)
+
+def send_media(path, mimetype=None, immutable=False):
+    """Servir un fichier média avec validateurs, Range et cache HTTP
+
+    Une URL versionnée (?v=) est cachée un an sans revalidation ; sinon le
+    client revalide à chaque fois (ETag/Last-Modified, réponse 304). Avec
+    MEDIA_ACCEL_REDIRECT, seul l'en-tête X-Accel-Redirect est renvoyé et
+    nginx transmet le fichier ; USE_X_SENDFILE fait de même pour Apache.
+    """
+    accel_prefix = current_app.config.get('MEDIA_ACCEL_REDIRECT')
+    if accel_prefix:
+        relative = os.path.relpath(path, current_app.config['UPLOAD_FOLDER']).replace('\\', '/')
+        response = current_app.response_class(
+            mimetype=mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        )
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{relative}"
+    else:
+        response = send_file(path, mimetype=mimetype, conditional=True)
+
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['MEDIA_CACHE_MAX_AGE']
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,183 @@
+import mimetypes
+import os
+import zipfile
+from flask import current_app
+from sqlalchemy.orm import selectinload
+from werkzeug.utils import secure_filename
+
+from database.models import db, Media, MediaRendition
+from services.blobs import PROCESSED_FIELDS, link_or_copy, temp_path, acquire_blobs, write_stream
+from services.imaging import file_digest
+from services.media_processing import media_processor, thumbnail_target
+from services.renditions import rendition_targets
+
+class SkipEntry(Exception):
+    """Élément ignoré à l'import, raison en message"""
+
+def _allowed(filename):
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
+
+def _staged(name, sha256, tmp_path, size):
+    return {'name': name, 'sha256': sha256, 'tmp_path': tmp_path, 'size': size}
+
+def stage_stream(name, stream):
+    """Copier un flux dans la zone temporaire des blobs, empreinte calculée au passage"""
+    sha256, tmp_path, size = write_stream(stream)
+    return _staged(name, sha256, tmp_path, size)
+
+def import_batch(staged, uploaded_by=None):
+    """Créer les médias d'un lot de fichiers déjà copiés en zone temporaire
+
+    Références des blobs, insertion des lignes Media et commit sont faits
+    une fois pour tout le lot. Un contenu déjà traité reprend les résultats
+    existants ; un contenu nouveau n'est traité qu'une fois, même s'il
+    apparaît plusieurs fois dans le lot.
+    """
+    if not staged:
+        return []
+
+    blobs = acquire_blobs([
+        (item['sha256'], item['tmp_path'], item['size'], os.path.splitext(item['name'])[1].lower())
+        for item in staged
+    ])
+    known = set()
+    ready = {}
+    for media in Media.query.options(selectinload(Media.renditions)).filter(
+        Media.blob_id.in_([blob.id for blob in blobs.values()])
+    ).order_by(Media.id):
+        known.add(media.blob_id)
+        if media.processing_status == 'ready':
+            ready.setdefault(media.blob_id, media)
+
+    rows = []
+    for item in staged:
+        blob = blobs[item['sha256']]
+        mime_type = mimetypes.guess_type(item['name'])[0] or 'application/octet-stream'
+        media = Media(
+            filename=os.path.basename(blob.file_path),
+            original_filename=item['name'],
+            file_path=blob.file_path,
+            file_size=blob.file_size,
+            mime_type=mime_type,
+            file_type=mime_type.split('/')[0],
+            uploaded_by=uploaded_by,
+            blob_id=blob.id,
+            processing_status='processing'
+        )
+        source = ready.get(blob.id)
+        if source is not None:
+            for field in PROCESSED_FIELDS:
+                setattr(media, field, getattr(source, field))
+            media.processing_status = 'ready'
+            media.renditions = [
+                MediaRendition(width=r.width, height=r.height, format=r.format,
+                               file_path=r.file_path, file_size=r.file_size)
+                for r in source.renditions
+            ]
+        rows.append(media)
+
+    db.session.add_all(rows)
+    db.session.commit()
+
+    # Un seul job par contenu à traiter, partagé par ses doublons du lot
+    jobs = {}
+    for media in rows:
+        if media.processing_status == 'processing':
+            jobs.setdefault(media.blob_id, []).append(media)
+    with_renditions = current_app.config['MEDIA_RENDITIONS_ON_UPLOAD']
+    sha_by_id = {blob.id: sha256 for sha256, blob in blobs.items()}
+    for blob_id, group in jobs.items():
+        first = group[0]
+        media_processor.submit(
+            first.id, first.file_path, thumbnail_target(first.filename),
+            rendition_targets(sha_by_id[blob_id]) if with_renditions else (),
+            duplicates=[media.id for media in group[1:]]
+        )
+
+    results = []
+    for item, media in zip(staged, rows):
+        results.append({
+            'name': item['name'],
+            'status': 'duplicate' if media.blob_id in known else 'created',
+            'media_id': media.id
+        })
+        known.add(media.blob_id)
+    return results
+
+def _skipped(name, reason):
+    return {'name': name, 'status': 'skipped', 'error': reason}
+
+def _import_into(results, slots, batch, uploaded_by):
+    for slot, result in zip(slots, import_batch(batch, uploaded_by)):
+        results[slot] = result
+
+def _run_batches(entries, batch_size, uploaded_by):
+    """Importer des éléments (nom, fonction de copie) par lots, résultats dans l'ordre d'entrée"""
+    results = []
+    batch, slots = [], []
+    for name, stage in entries:
+        filename = secure_filename(os.path.basename(name))
+        if not filename or not _allowed(filename):
+            results.append(_skipped(name, 'Type de fichier non autorisé'))
+            continue
+        try:
+            batch.append(stage(filename))
+        except SkipEntry as e:
+            results.append(_skipped(name, str(e)))
+            continue
+        except Exception as e:
+            results.append({'name': name, 'status': 'error', 'error': str(e)})
+            continue
+        slots.append(len(results))
+        results.append(None)
+        if len(batch) >= batch_size:
+            _import_into(results, slots, batch, uploaded_by)
+            batch, slots = [], []
+    _import_into(results, slots, batch, uploaded_by)
+    return results
+
+def import_uploads(files, uploaded_by=None, batch_size=100):
+    """Importer les fichiers d'une requête multi-fichiers"""
+    return _run_batches(
+        ((file.filename or '', lambda name, file=file: stage_stream(name, file.stream)) for file in files),
+        batch_size, uploaded_by
+    )
+
+def import_archive(path, uploaded_by=None, batch_size=100):
+    """Importer le contenu d'une archive zip, membre par membre (jamais extraite en entier)"""
+    max_size = current_app.config['MEDIA_UPLOAD_MAX_SIZE']
+    with zipfile.ZipFile(path) as archive:
+        def stage(info):
+            def copy(name):
+                if info.file_size > max_size:
+                    raise SkipEntry('Fichier trop volumineux')
+                with archive.open(info) as stream:
+                    return stage_stream(name, stream)
+            return copy
+
+        # Résultats dans l'ordre des membres de l'archive, ignorés compris
+        members = (info for info in archive.infolist()
+                   if not info.is_dir() and not info.filename.startswith('__MACOSX/'))
+        return _run_batches(((info.filename, stage(info)) for info in members), batch_size, uploaded_by)
+
+def import_directory(path, uploaded_by=None, batch_size=100):
+    """Importer récursivement un dossier : empreintes calculées en parallèle par le pool"""
+    paths = sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+    candidates = [p for p in paths if _allowed(secure_filename(os.path.basename(p)) or '')]
+    digests = {p: (sha256, size) for p, sha256, size in media_processor.map(file_digest, candidates, chunksize=8)}
+
+    def stage(file_path):
+        def copy(name):
+            tmp_path = temp_path()
+            link_or_copy(file_path, tmp_path)
+            sha256, size = digests[file_path]
+            return _staged(name, sha256, tmp_path, size)
+        return copy
+
+    entries = ((os.path.relpath(p, path), stage(p)) for p in paths)
+    return _run_batches(entries, batch_size, uploaded_by)
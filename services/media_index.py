@@ -0,0 +1,97 @@
+import logging
+from collections import namedtuple
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload
+
+from database.events import on_commit
+from database.models import db, Media
+from services.cache import LRUCache
+from services.media_delivery import fingerprint
+from services.renditions import storage_key
+
+logger = logging.getLogger(__name__)
+
+# Ce qu'il faut pour servir un média : mêmes noms d'attributs que Media,
+# pour que fingerprint() et les URLs s'appliquent aussi à une entrée
+MediaEntry = namedtuple('MediaEntry', [
+    'id', 'file_path', 'thumbnail_path', 'mime_type', 'file_type', 'width', 'file_size',
+    'fingerprint', 'storage_key'
+])
+
+class MediaIndex:
+    """Index en mémoire id -> chemins d'un média, borné (LRU) et expirant
+
+    Les routes de fichiers n'interrogent la base qu'en cas d'absence dans
+    l'index. Un commit touchant un Media retire son entrée dans ce worker ;
+    dans les autres, l'entrée expire au plus tard après `ttl` secondes (un
+    fichier supprimé entre-temps donne de toute façon une 404).
+    """
+
+    def __init__(self, max_entries=4096, ttl=300):
+        self._cache = LRUCache(max_entries, ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self._cache = LRUCache(app.config['MEDIA_INDEX_MAX_ENTRIES'], app.config['MEDIA_INDEX_TTL'])
+        app.extensions['media_index'] = self
+        if app.config['MEDIA_INDEX_WARM']:
+            with app.app_context():
+                try:
+                    self.warm(app.config['MEDIA_INDEX_WARM'])
+                except SQLAlchemyError as e:
+                    # Base pas encore créée (scripts d'initialisation)
+                    logger.warning('Index des médias non préchargé : %s', e)
+                finally:
+                    db.session.remove()
+
+    @staticmethod
+    def _entry(media):
+        return MediaEntry(
+            id=media.id,
+            file_path=media.file_path,
+            thumbnail_path=media.thumbnail_path,
+            mime_type=media.mime_type,
+            file_type=media.file_type,
+            width=media.width,
+            file_size=media.file_size,
+            fingerprint=fingerprint(media),
+            storage_key=storage_key(media)
+        )
+
+    def get(self, media_id):
+        """Entrée d'un média, lue en base au premier accès (None s'il n'existe pas)"""
+        entry = self._cache.get(media_id)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        media = db.session.get(Media, media_id)
+        if media is None:
+            return None
+        entry = self._entry(media)
+        self._cache.set(media_id, entry)
+        return entry
+
+    def warm(self, limit):
+        """Précharger les médias les plus récents en une requête"""
+        recent = Media.query.options(joinedload(Media.blob)).order_by(Media.id.desc()).limit(limit).all()
+        for media in reversed(recent):
+            self._cache.set(media.id, self._entry(media))
+        return len(recent)
+
+    def invalidate(self, media_ids):
+        for media_id in media_ids:
+            self._cache.delete(media_id)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+media_index = MediaIndex()
+
+@on_commit(Media)
+def _invalidate_media(changes):
+    media_index.invalidate(pk for _, pk, _ in changes)
@@ -0,0 +1,227 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from functools import partial
+from flask import current_app
+from sqlalchemy import func
+
+from database.models import db, Media
+from services.imaging import process_file
+from services.renditions import record_renditions, rendition_targets, storage_key
+from services.storage import storage
+
+logger = logging.getLogger(__name__)
+
+def thumbnail_target(filename):
+    """Chemin de la miniature d'un fichier uploadé (dossier créé au besoin)"""
+    thumb_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'thumbnails')
+    os.makedirs(thumb_dir, exist_ok=True)
+    return os.path.join(thumb_dir, filename).replace('\\', '/')
+
+def process_stored(driver, file_path, thumbnail_path=None, renditions=(), quality=80):
+    """Traiter un fichier du stockage, dans le pool : copie locale, traitement, publication
+
+    Avec un stockage distant, le fichier est téléchargé par le processus du
+    pool, les dérivés y sont envoyés puis toutes les copies locales libérées.
+    """
+    driver.fetch(driver.key(file_path), file_path)
+    result = process_file(file_path, thumbnail_path, renditions=renditions, quality=quality)
+    outputs = [result['thumbnail_path']] + [rendition['file_path'] for rendition in result['renditions']]
+    for path in filter(None, outputs):
+        driver.put(driver.key(path), path)
+    for path in [file_path] + outputs:
+        if path:
+            driver.evict(path)
+    return result
+
+class MediaProcessor:
+    """File de traitement des médias servie par un pool de processus
+
+    Détection du type MIME, lecture des dimensions et génération de la
+    miniature sortent de la requête d'upload : la ligne Media est créée en
+    statut 'processing' puis mise à jour à la fin du traitement ('ready'),
+    ou marquée 'failed' après épuisement des tentatives. La table media sert
+    de file durable : les lignes restées en 'processing' (worker redémarré,
+    job perdu) sont remises en file par `requeue_stale`.
+
+    Les déclinaisons demandées (`renditions`) sont produites dans le même
+    job, à partir de l'image déjà décodée, puis enregistrées avec le média.
+
+    Avec MEDIA_WORKERS = 0, le traitement est exécuté immédiatement dans le
+    processus courant, ce qui convient aux tests et au développement local.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.workers = 2
+        self.retries = 2
+        self.stale_after = 600
+        self.quality = 80
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._futures = set()
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('MEDIA_WORKERS', 2)
+        self.retries = app.config.get('MEDIA_PROCESSING_RETRIES', 2)
+        self.stale_after = app.config.get('MEDIA_PROCESSING_STALE_AFTER', 600)
+        self.quality = app.config.get('MEDIA_RENDITION_QUALITY', 80)
+        app.extensions['media_processor'] = self
+
+    def _get_executor(self, reset=False):
+        # Un pool par processus : celui du parent n'est pas utilisable après un fork
+        with self._lock:
+            if reset or self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, media_id, file_path, thumbnail_path=None, renditions=(), attempt=1, duplicates=()):
+        """Mettre un fichier en file (media_id None : miniature seule, sans ligne à mettre à jour)
+
+        `duplicates` liste d'autres médias de même contenu, mis à jour avec
+        le même résultat sans second traitement.
+        """
+        job = {
+            'media_id': media_id,
+            'file_path': file_path,
+            'thumbnail_path': thumbnail_path,
+            'renditions': list(renditions),
+            'duplicates': list(duplicates),
+            'attempt': attempt
+        }
+        task = partial(process_stored, storage.driver, file_path, thumbnail_path,
+                       renditions=job['renditions'], quality=self.quality)
+        if media_id is not None:
+            self._in_flight.add(media_id)
+
+        if self.workers <= 0:
+            try:
+                result = task()
+            except Exception as e:
+                self._failed(job, e)
+            else:
+                self._done(job, result)
+            return
+
+        try:
+            future = self._get_executor().submit(task)
+        except BrokenProcessPool:
+            # Un processus du pool est mort : repartir d'un pool neuf
+            future = self._get_executor(reset=True).submit(task)
+        self._futures.add(future)
+        future.add_done_callback(partial(self._on_future_done, job))
+
+    def _on_future_done(self, job, future):
+        try:
+            error = future.exception()
+            if error is None:
+                self._done(job, future.result())
+            else:
+                self._failed(job, error)
+        finally:
+            self._futures.discard(future)
+
+    def map(self, func, items, chunksize=1):
+        """Appliquer une fonction (importable) à chaque élément, en parallèle dans le pool"""
+        if self.workers <= 0:
+            return [func(item) for item in items]
+        return list(self._get_executor().map(func, items, chunksize=chunksize))
+
+    def wait(self, timeout=None):
+        """Attendre la fin des traitements en cours, nouvelles tentatives comprises
+
+        Utile aux commandes CLI, dont le processus ne doit pas s'arrêter avant
+        la mise à jour des médias. Retourne False si le délai est dépassé.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._futures:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            wait(list(self._futures), timeout=remaining)
+            # Laisser les callbacks (mise à jour, nouvelle tentative) se terminer
+            time.sleep(0.01)
+        return True
+
+    def _update(self, media_ids, renditions=(), **values):
+        with self.app.app_context():
+            for media_id in media_ids:
+                media = db.session.get(Media, media_id)
+                if media is None:
+                    continue
+                for key, value in values.items():
+                    setattr(media, key, value)
+                if renditions:
+                    record_renditions(media_id, renditions)
+            db.session.commit()
+
+    def _done(self, job, result):
+        self._in_flight.discard(job['media_id'])
+        if job['media_id'] is None:
+            return
+        try:
+            self._update([job['media_id']] + job['duplicates'], processing_status='ready', **result)
+        except Exception:
+            logger.exception('Échec de la mise à jour du média %s', job['media_id'])
+
+    def _failed(self, job, error):
+        if job['attempt'] <= self.retries:
+            logger.warning('Traitement de %s échoué (tentative %s) : %s', job['file_path'], job['attempt'], error)
+            self.submit(job['media_id'], job['file_path'], job['thumbnail_path'],
+                        job['renditions'], job['attempt'] + 1, job['duplicates'])
+            return
+
+        self._in_flight.discard(job['media_id'])
+        logger.error('Traitement de %s abandonné : %s', job['file_path'], error)
+        if job['media_id'] is not None:
+            try:
+                self._update([job['media_id']] + job['duplicates'], processing_status='failed')
+            except Exception:
+                logger.exception('Échec de la mise à jour du média %s', job['media_id'])
+
+    def requeue_stale(self, limit=100):
+        """Remettre en file les médias restés trop longtemps en traitement
+
+        Tous les workers exécutent cette tâche : chaque ligne est d'abord
+        réclamée par un UPDATE conditionnel sur son statut et sa dernière
+        tentative, et seul le worker dont l'UPDATE l'a modifiée la remet en
+        file. Une ligne réclamée attend de nouveau `stale_after` secondes.
+        """
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=self.stale_after)
+        media_table = Media.__table__
+        last_attempt = func.coalesce(media_table.c.processing_claimed_at, media_table.c.created_at)
+        stale = Media.query.filter(
+            Media.processing_status == 'processing',
+            last_attempt < cutoff
+        ).order_by(Media.id).limit(limit).all()
+
+        jobs = []
+        for media in stale:
+            if media.id in self._in_flight:
+                continue
+            claimed = db.session.execute(
+                media_table.update()
+                .where(media_table.c.id == media.id, media_table.c.processing_status == 'processing',
+                       last_attempt < cutoff)
+                .values(processing_claimed_at=now)
+            ).rowcount
+            if not claimed:
+                continue
+            renditions = rendition_targets(storage_key(media)) if self.app.config.get('MEDIA_RENDITIONS_ON_UPLOAD') else ()
+            jobs.append((media.id, media.file_path, thumbnail_target(media.filename), renditions))
+        db.session.commit()
+
+        for job in jobs:
+            self.submit(*job)
+        return len(jobs)
+
+media_processor = MediaProcessor()
@@ -0,0 +1,155 @@
+import re
+from datetime import datetime, time, timedelta
+from sqlalchemy import bindparam, column, event, literal_column, or_, table, text
+
+from database.fts import fts5_available
+from database.models import db, Media
+
+# Index de recherche de la médiathèque (nom d'origine, nom stocké,
+# description, texte alternatif) :
+#  - PostgreSQL : index GIN tsvector pour les mots et pg_trgm pour les
+#    sous-chaînes (ILIKE '%...%' indexé), sur une expression sans colonne
+#    supplémentaire à synchroniser ;
+#  - SQLite : table FTS5 à contenu externe tenue à jour par des triggers ;
+#  - autre base ou FTS5 absent : repli sur ILIKE, sans index.
+
+MEDIA_DOCUMENT = (
+    "coalesce(original_filename, '') || ' ' || coalesce(filename, '') || ' ' || "
+    "coalesce(description, '') || ' ' || coalesce(alt_text, '')"
+)
+MEDIA_TSVECTOR = f"to_tsvector('simple', {MEDIA_DOCUMENT})"
+
+POSTGRES_DDL = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    f'CREATE INDEX IF NOT EXISTS ix_media_search_trgm ON media USING gin (({MEDIA_DOCUMENT}) gin_trgm_ops)',
+    f'CREATE INDEX IF NOT EXISTS ix_media_search_tsv ON media USING gin ({MEDIA_TSVECTOR})',
+)
+
+_FTS_COLUMNS = 'original_filename, filename, description, alt_text'
+_FTS_NEW = 'new.id, new.original_filename, new.filename, new.description, new.alt_text'
+_FTS_OLD = "'delete', old.id, old.original_filename, old.filename, old.description, old.alt_text"
+
+SQLITE_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS media_fts USING fts5({_FTS_COLUMNS}, content='media', "
+    "content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f'CREATE TRIGGER IF NOT EXISTS media_fts_insert AFTER INSERT ON media BEGIN '
+    f'INSERT INTO media_fts(rowid, {_FTS_COLUMNS}) VALUES ({_FTS_NEW}); END',
+    f'CREATE TRIGGER IF NOT EXISTS media_fts_delete AFTER DELETE ON media BEGIN '
+    f'INSERT INTO media_fts(media_fts, rowid, {_FTS_COLUMNS}) VALUES ({_FTS_OLD}); END',
+    f'CREATE TRIGGER IF NOT EXISTS media_fts_update AFTER UPDATE OF {_FTS_COLUMNS} ON media BEGIN '
+    f'INSERT INTO media_fts(media_fts, rowid, {_FTS_COLUMNS}) VALUES ({_FTS_OLD}); '
+    f'INSERT INTO media_fts(rowid, {_FTS_COLUMNS}) VALUES ({_FTS_NEW}); END',
+)
+
+SQLITE_DROP = (
+    'DROP TRIGGER IF EXISTS media_fts_insert',
+    'DROP TRIGGER IF EXISTS media_fts_delete',
+    'DROP TRIGGER IF EXISTS media_fts_update',
+    'DROP TABLE IF EXISTS media_fts',
+)
+
+media_fts = table('media_fts', column('rowid'), column('rank'))
+
+# Moteur -> backend détecté ('postgresql', 'fts5' ou 'like')
+_backends = {}
+
+def install_search_index(connection, rebuild=False):
+    """Créer l'index de recherche (idempotent) ; `rebuild` réindexe les lignes existantes"""
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        for statement in POSTGRES_DDL:
+            connection.exec_driver_sql(statement)
+    elif dialect == 'sqlite' and fts5_available(connection):
+        for statement in SQLITE_DDL:
+            connection.exec_driver_sql(statement)
+        if rebuild:
+            connection.exec_driver_sql("INSERT INTO media_fts(media_fts) VALUES ('rebuild')")
+    else:
+        return False
+    _backends.pop(connection.engine, None)
+    return True
+
+@event.listens_for(Media.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    install_search_index(connection)
+
+@event.listens_for(Media.__table__, 'before_drop')
+def _drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        for statement in SQLITE_DROP:
+            connection.exec_driver_sql(statement)
+    _backends.pop(connection.engine, None)
+
+def search_backend():
+    """Backend utilisable sur la base courante (détecté une fois par moteur)"""
+    engine = db.engine
+    if engine not in _backends:
+        backend = 'like'
+        if engine.dialect.name == 'postgresql':
+            backend = 'postgresql'
+        elif engine.dialect.name == 'sqlite':
+            with engine.connect() as connection:
+                exists = connection.exec_driver_sql(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'media_fts'"
+                ).scalar()
+            if exists:
+                backend = 'fts5'
+        _backends[engine] = backend
+    return _backends[engine]
+
+def search_terms(q):
+    """Mots de la recherche, sans ponctuation (les noms de fichiers sont découpés sur _ . -)"""
+    return re.findall(r'[^\W_]+', q or '')
+
+def _filter_search(query, q, backend):
+    terms = search_terms(q)
+    if not terms:
+        return query, None
+
+    if backend == 'fts5':
+        # Chaque mot en préfixe, tous requis : "img"* "2023"*
+        match = ' '.join(f'"{term}"*' for term in terms)
+        query = query.join(media_fts, media_fts.c.rowid == Media.id) \
+            .filter(text('media_fts MATCH :match').bindparams(match=match))
+        return query, media_fts.c.rank
+
+    if backend == 'postgresql':
+        tsquery = text("to_tsquery('simple', :tsquery)").bindparams(tsquery=' & '.join(f'{t}:*' for t in terms))
+        tsvector = literal_column(MEDIA_TSVECTOR)
+        document = literal_column(f'({MEDIA_DOCUMENT})')
+        pattern = '%' + re.sub(r'([\\%_])', r'\\\1', q.strip()) + '%'
+        query = query.filter(or_(tsvector.op('@@')(tsquery), document.ilike(bindparam('pattern', pattern), escape='\\')))
+        return query, db.func.ts_rank(tsvector, tsquery).desc()
+
+    for term in terms:
+        pattern = f'%{term}%'
+        query = query.filter(or_(
+            Media.original_filename.ilike(pattern),
+            Media.filename.ilike(pattern),
+            Media.description.ilike(pattern),
+            Media.alt_text.ilike(pattern)
+        ))
+    return query, None
+
+def search_media(q=None, file_type=None, date_from=None, date_to=None, uploaded_by=None,
+                 page=1, per_page=24):
+    """Rechercher dans la médiathèque, résultats classés par pertinence puis date
+
+    `date_from`/`date_to` sont des dates incluses ; `file_type` None ou
+    'all' désactive le filtre. Retourne une pagination Flask-SQLAlchemy.
+    """
+    query = Media.query
+    if file_type and file_type != 'all':
+        query = query.filter(Media.file_type == file_type)
+    if uploaded_by is not None:
+        query = query.filter(Media.uploaded_by == uploaded_by)
+    if date_from is not None:
+        query = query.filter(Media.created_at >= datetime.combine(date_from, time.min))
+    if date_to is not None:
+        query = query.filter(Media.created_at < datetime.combine(date_to + timedelta(days=1), time.min))
+
+    query, rank = _filter_search(query, q, search_backend())
+    order = [Media.created_at.desc(), Media.id.desc()]
+    if rank is not None:
+        order.insert(0, rank)
+    return query.order_by(*order).paginate(page=page, per_page=per_page, error_out=False)
@@ -0,0 +1,304 @@
+import html
+import re
+import unicodedata
+from itertools import chain
+from markupsafe import escape
+from sqlalchemy import bindparam, column, event, or_, select, table, text
+from sqlalchemy.orm import Session
+
+from database.fts import fts5_available
+from database.models import db, Post, Category, Tag, post_tags
+
+# Recherche plein texte des posts (titre, extrait, contenu, tags, catégorie) :
+#  - PostgreSQL : table post_search (tsvector pondéré, config 'french' avec
+#    racinisation) indexée en GIN ;
+#  - SQLite : table FTS5, mots préfixés à défaut de racinisation française ;
+#  - autre base ou FTS5 absent : repli sur ILIKE, sans index.
+# Tags et catégorie vivant dans d'autres tables, l'index n'est pas tenu par
+# des triggers mais réécrit au flush pour les posts touchés, dans la même
+# transaction que la modification.
+
+# Document d'un post, `aggregate` concaténant les noms de ses tags
+_DOCUMENT = (
+    "SELECT p.id, p.title, coalesce(p.excerpt, '') AS excerpt, p.content, "
+    "coalesce((SELECT {aggregate} FROM post_tags pt JOIN tags t ON t.id = pt.tag_id "
+    "WHERE pt.post_id = p.id), '') AS tags, coalesce(c.name, '') AS category "
+    "FROM posts p LEFT JOIN categories c ON c.id = p.category_id"
+)
+POSTGRES_TAGS = "string_agg(t.name, ' ')"
+SQLITE_TAGS = "group_concat(t.name, ' ')"
+
+POSTGRES_DDL = (
+    'CREATE TABLE IF NOT EXISTS post_search (post_id INTEGER PRIMARY KEY, document tsvector NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS ix_post_search_document ON post_search USING gin (document)',
+)
+# Poids : titre (A) > extrait et tags (B) > catégorie (C) > contenu (D)
+POSTGRES_INDEX = (
+    "INSERT INTO post_search (post_id, document) SELECT d.id, "
+    "setweight(to_tsvector('french', d.title), 'A') || "
+    "setweight(to_tsvector('french', d.excerpt || ' ' || d.tags), 'B') || "
+    "setweight(to_tsvector('french', d.category), 'C') || "
+    "setweight(to_tsvector('french', d.content), 'D') "
+    f'FROM ({_DOCUMENT.format(aggregate=POSTGRES_TAGS)}) AS d'
+)
+
+_FTS_COLUMNS = 'title, excerpt, content, tags, category'
+SQLITE_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5({_FTS_COLUMNS}, "
+    "tokenize='unicode61 remove_diacritics 2')",
+)
+SQLITE_INDEX = (
+    f'INSERT INTO posts_fts (rowid, {_FTS_COLUMNS}) SELECT id, {_FTS_COLUMNS} '
+    f'FROM ({_DOCUMENT.format(aggregate=SQLITE_TAGS)})'
+)
+# Poids bm25 des colonnes, dans l'ordre de _FTS_COLUMNS
+SQLITE_RANK = 'bm25(posts_fts, 10.0, 4.0, 1.0, 4.0, 2.0)'
+
+SQLITE_DROP = ('DROP TABLE IF EXISTS posts_fts',)
+POSTGRES_DROP = ('DROP TABLE IF EXISTS post_search',)
+
+posts_fts = table('posts_fts', column('rowid'))
+post_search = table('post_search', column('post_id'), column('document'))
+
+# Moteur -> backend détecté ('postgresql', 'fts5' ou 'like')
+_backends = {}
+
+def _index_statements(dialect, post_ids=None):
+    """Requêtes de réindexation de tous les posts, ou seulement de `post_ids`"""
+    if dialect == 'postgresql':
+        delete, insert, key = 'DELETE FROM post_search', POSTGRES_INDEX, 'post_id'
+    else:
+        delete, insert, key = 'DELETE FROM posts_fts', SQLITE_INDEX, 'rowid'
+    if post_ids is None:
+        return [text(delete), text(insert)]
+    ids = bindparam('ids', list(post_ids), expanding=True)
+    return [text(f'{delete} WHERE {key} IN :ids').bindparams(ids),
+            text(f'{insert} WHERE id IN :ids').bindparams(ids)]
+
+def index_posts(connection, post_ids=None, batch_size=500):
+    """Réécrire l'index des posts donnés (tous si None) ; les posts disparus en sont retirés"""
+    dialect = 'postgresql' if connection.dialect.name == 'postgresql' else 'sqlite'
+    if post_ids is None:
+        batches = [None]
+    else:
+        post_ids = sorted(post_ids)
+        batches = [post_ids[i:i + batch_size] for i in range(0, len(post_ids), batch_size)]
+    for batch in batches:
+        for statement in _index_statements(dialect, batch):
+            connection.execute(statement)
+
+def install_search_index(connection, rebuild=False):
+    """Créer l'index de recherche des posts (idempotent) ; `rebuild` réindexe tous les posts"""
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        statements = POSTGRES_DDL
+    elif dialect == 'sqlite' and fts5_available(connection):
+        statements = SQLITE_DDL
+    else:
+        return False
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+    if rebuild:
+        index_posts(connection)
+    _backends.pop(connection.engine, None)
+    return True
+
+@event.listens_for(Post.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    install_search_index(connection)
+
+@event.listens_for(Post.__table__, 'before_drop')
+def _drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        statements = SQLITE_DROP
+    elif connection.dialect.name == 'postgresql':
+        statements = POSTGRES_DROP
+    else:
+        statements = ()
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+    _backends.pop(connection.engine, None)
+
+def _detect_backend(connection):
+    if connection.dialect.name == 'postgresql':
+        found = connection.exec_driver_sql("SELECT to_regclass('post_search')").scalar()
+        return 'postgresql' if found else 'like'
+    if connection.dialect.name == 'sqlite':
+        found = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'posts_fts'"
+        ).scalar()
+        return 'fts5' if found else 'like'
+    return 'like'
+
+def search_backend(connection=None):
+    """Backend utilisable sur la base courante (détecté une fois par moteur)"""
+    engine = db.engine if connection is None else connection.engine
+    if engine not in _backends:
+        if connection is None:
+            with engine.connect() as connection:
+                _backends[engine] = _detect_backend(connection)
+        else:
+            _backends[engine] = _detect_backend(connection)
+    return _backends[engine]
+
+# Élisions françaises (l', d', qu'...) : sans elles, « l » deviendrait un préfixe de recherche
+_ELISION = re.compile(r"\b(?:[cdjlmnst]|qu)['’]", re.IGNORECASE)
+
+def search_terms(q):
+    """Mots de la recherche, sans ponctuation ni élisions"""
+    return re.findall(r'[^\W_]+', _ELISION.sub(' ', q or ''))
+
+def _tsquery(terms):
+    return text("to_tsquery('french', :tsquery)").bindparams(tsquery=' & '.join(f'{t}:*' for t in terms))
+
+def _fts_match(terms):
+    # Chaque mot en préfixe, tous requis : "équation"* "chaleur"*
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def filter_search(query, q):
+    """Restreindre une requête de posts à la recherche `q`
+
+    Retourne (requête, critère de tri par pertinence), le critère valant
+    None sans recherche ou sans index. Les mots sont tous requis, cherchés
+    dans le titre, l'extrait, le contenu, les tags et la catégorie.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return query, None
+
+    backend = search_backend()
+    if backend == 'fts5':
+        query = query.join(posts_fts, posts_fts.c.rowid == Post.id) \
+            .filter(text('posts_fts MATCH :match').bindparams(match=_fts_match(terms)))
+        return query, text(SQLITE_RANK)
+
+    if backend == 'postgresql':
+        tsquery = _tsquery(terms)
+        query = query.join(post_search, post_search.c.post_id == Post.id) \
+            .filter(post_search.c.document.op('@@')(tsquery))
+        return query, db.func.ts_rank(post_search.c.document, tsquery).desc()
+
+    for term in terms:
+        pattern = f'%{term}%'
+        query = query.filter(or_(
+            Post.title.ilike(pattern),
+            Post.excerpt.ilike(pattern),
+            Post.content.ilike(pattern),
+            Post.tag_list.any(Tag.name.ilike(pattern)),
+            Post.category_ref.has(Category.name.ilike(pattern))
+        ))
+    return query, None
+
+def _accent_variants():
+    """Lettre de base -> la lettre et ses variantes accentuées, en minuscules"""
+    variants = {}
+    for code in range(0xC0, 0x250):
+        letter = chr(code).lower()
+        base = unicodedata.normalize('NFD', letter)[0]
+        if base != letter:
+            variants[base] = variants.get(base, base) + letter
+    return variants
+
+_VARIANTS = _accent_variants()
+
+def _term_pattern(term):
+    """Motif d'un mot insensible aux accents : « theoreme » trouve « théorème »"""
+    letters = (unicodedata.normalize('NFD', letter)[0] for letter in term.lower())
+    return ''.join(f'[{_VARIANTS[letter]}]' if letter in _VARIANTS else re.escape(letter) for letter in letters)
+
+# Balises HTML, et balises non autorisées que bleach a échappées (<p>, <h1>, <pre>…) ;
+# deux motifs à préfixe littéral, bien plus rapides qu'une alternative
+_TAG = re.compile(r'<[^>]*>')
+_ESCAPED_TAG = re.compile(r'&lt;/?[a-zA-Z][a-zA-Z0-9]*(?:\s.*?)?&gt;')
+
+def _plain_text(content_html, limit=None):
+    """Texte brut d'un HTML nettoyé par bleach : balises retirées, entités décodées
+
+    Avec `limit`, seuls les `limit` premiers caractères du HTML sont convertis.
+    """
+    if limit is not None and len(content_html) > limit:
+        content_html = content_html[:limit]
+        # Pas de balise coupée en fin de texte
+        if content_html.rfind('<') > content_html.rfind('>'):
+            content_html = content_html[:content_html.rfind('<')]
+    return ' '.join(html.unescape(_ESCAPED_TAG.sub(' ', _TAG.sub(' ', content_html))).split())
+
+def _snippet_of(content, pattern, size=200, scan=20000):
+    """Extrait HTML échappé autour de la première occurrence, mots trouvés entre <mark>
+
+    La première occurrence n'est cherchée que dans les `scan` premiers
+    caractères : un mot présent seulement dans le titre ou les tags ne fait
+    pas parcourir tout un long article, l'extrait en reprend alors le début.
+    """
+    match = pattern.search(content, 0, scan)
+    start = max(0, match.start() - size // 4) if match else 0
+    end = min(len(content), start + size)
+    # Ne pas couper de mot aux bords de l'extrait
+    if start > 0:
+        space = content.find(' ', start, match.start())
+        start = space + 1 if space != -1 else start
+    if end < len(content):
+        space = content.rfind(' ', start, end)
+        end = space if space > (match.end() if match else start) else end
+
+    parts, last = ['…' if start > 0 else ''], start
+    for found in pattern.finditer(content, start, end):
+        parts.append(str(escape(content[last:found.start()])))
+        parts.append(f'<mark>{escape(found.group(0))}</mark>')
+        last = found.end()
+    parts.append(str(escape(content[last:end])))
+    parts.append('…' if end < len(content) else '')
+    return ''.join(parts)
+
+def search_snippets(q, post_ids, size=200):
+    """Extraits surlignés des posts trouvés : dict id -> HTML
+
+    Calculés en Python pour la seule page affichée, en une requête : les
+    fonctions d'extrait des bases (snippet de FTS5, ts_headline) relisent
+    chaque occurrence de chaque document et coûtent bien plus cher sur de
+    longs articles. L'extrait est tiré du HTML rendu ramené au texte brut,
+    sans la syntaxe Markdown du contenu source.
+    """
+    terms = search_terms(q)
+    if not terms or not post_ids:
+        return {}
+    # Mots en préfixe, sans accents : comme dans l'index
+    pattern = re.compile(r'\b(?:' + '|'.join(map(_term_pattern, terms)) + r')\w*', re.IGNORECASE)
+    rows = db.session.execute(
+        select(Post.id, Post.excerpt, Post.content, Post.content_html).where(Post.id.in_(list(post_ids)))
+    ).all()
+    snippets = {}
+    for row in rows:
+        # HTML plus long que son texte : le double couvre la zone parcourue par _snippet_of
+        content = _plain_text(row.content_html, 40000) if row.content_html else row.content
+        snippets[row.id] = _snippet_of(' '.join(filter(None, (row.excerpt, content))), pattern, size)
+    return snippets
+
+@event.listens_for(Session, 'after_flush')
+def _sync_search_index(session, flush_context):
+    # Dans after_flush, new/dirty/deleted reflètent encore l'état d'avant le flush
+    post_ids, category_ids, tag_ids = set(), set(), set()
+    modified = [obj for obj in session.dirty if session.is_modified(obj)]
+    for obj in chain(session.new, session.deleted, modified):
+        if isinstance(obj, Post):
+            post_ids.add(obj.id)
+    # Catégorie ou tag renommé (colonnes seulement : un ajout dans la
+    # collection `posts` d'un tag concerne déjà le post lui-même)
+    for obj in modified:
+        if isinstance(obj, (Category, Tag)) and session.is_modified(obj, include_collections=False):
+            (category_ids if isinstance(obj, Category) else tag_ids).add(obj.id)
+    if not (post_ids or category_ids or tag_ids):
+        return
+
+    connection = session.connection()
+    if search_backend(connection) == 'like':
+        return
+    # Tous les posts qui les portent
+    if category_ids:
+        posts = Post.__table__
+        post_ids.update(connection.execute(select(posts.c.id).where(posts.c.category_id.in_(category_ids))).scalars())
+    if tag_ids:
+        post_ids.update(connection.execute(
+            select(post_tags.c.post_id).where(post_tags.c.tag_id.in_(tag_ids))
+        ).scalars())
+    index_posts(connection, post_ids)
@@ -0,0 +1,192 @@
+import logging
+import os
+import time
+from flask import current_app
+from sqlalchemy import select
+
+from database.models import db, Media, MediaBlob, MediaRendition, Post, PostMedia
+from services.storage import storage
+
+logger = logging.getLogger(__name__)
+
+# Seuls dossiers où l'application écrit des médias : uploads/chunked (purge
+# dédiée) et tout fichier posé à la main ailleurs ne sont jamais parcourus
+MANAGED_FOLDERS = ('blobs', 'images', 'documents', 'thumbnails', 'renditions')
+
+MAX_SAMPLES = 20
+
+class RateLimiter:
+    """Limiteur d'opérations disque par seconde (0 : illimité)"""
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self._next = time.monotonic()
+
+    def wait(self):
+        if not self.rate:
+            return
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+        self._next = max(self._next, now) + 1.0 / self.rate
+
+def _walk(folder, limiter):
+    """Parcourir un dossier sans jamais lister un répertoire entier en mémoire
+
+    Les fichiers et dossiers cachés (.gitkeep, .DS_Store…) sont ignorés :
+    l'application n'en crée jamais.
+    """
+    try:
+        entries = os.scandir(folder)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            limiter.wait()
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk(entry.path, limiter)
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                yield entry.path.replace('\\', '/'), stat.st_size, stat.st_mtime
+
+def _rendition_key(path, upload_folder):
+    # renditions/<empreinte ou id du média>/<largeur>.<format>
+    parts = os.path.relpath(path, upload_folder).replace('\\', '/').split('/')
+    return parts[1] if len(parts) == 3 and parts[0] == 'renditions' else None
+
+def _in(column, values):
+    values = list(values)
+    if not values:
+        return set()
+    return set(db.session.execute(select(column).where(column.in_(values))).scalars())
+
+def _referenced(paths, upload_folder):
+    """Parmi `paths`, ceux encore utilisés par la base (quelques requêtes IN par lot)"""
+    referenced = set()
+    for column in (Media.file_path, Media.thumbnail_path, PostMedia.file_path, PostMedia.thumbnail_path,
+                   MediaBlob.file_path, MediaRendition.file_path):
+        referenced |= _in(column, paths)
+
+    # Images à la une des posts : uploads/images/<nom> et sa miniature
+    names = {os.path.basename(path): path for path in paths
+             if os.path.basename(os.path.dirname(path)) in ('images', 'thumbnails')}
+    for name in _in(Post.featured_image, names):
+        referenced |= {path for path in paths if os.path.basename(path) == name}
+
+    # Déclinaisons : gardées tant que leur blob ou leur média existe
+    keys = {}
+    for path in paths:
+        key = _rendition_key(path, upload_folder)
+        if key is not None:
+            keys.setdefault(key, []).append(path)
+    live = _in(MediaBlob.sha256, keys)
+    live |= {str(media_id) for media_id in _in(Media.id, [int(key) for key in keys if key.isdigit()])}
+    for key in live:
+        referenced.update(keys[key])
+    return referenced
+
+def _remove_empty_parents(path, upload_folder):
+    parent = os.path.dirname(path)
+    root = os.path.abspath(upload_folder)
+    while os.path.abspath(parent) != root and os.path.abspath(parent).startswith(root):
+        try:
+            os.rmdir(parent)
+        except OSError:
+            break
+        parent = os.path.dirname(parent)
+
+def _missing_files(report, limiter, batch_size):
+    """Lignes qui pointent vers un fichier absent (parcours par identifiant croissant)"""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    sources = (
+        ('media', Media, (Media.file_path, Media.thumbnail_path)),
+        ('post_media', PostMedia, (PostMedia.file_path, PostMedia.thumbnail_path)),
+        ('posts', Post, (Post.featured_image,))
+    )
+    for name, model, columns in sources:
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                select(model.id, *columns).where(model.id > last_id).order_by(model.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            for row in rows:
+                for value in row[1:]:
+                    if not value:
+                        continue
+                    path = os.path.join(upload_folder, 'images', value) if model is Post else value
+                    limiter.wait()
+                    if not storage.exists(path):
+                        report['missing'][name] += 1
+                        if len(report['missing_samples']) < MAX_SAMPLES:
+                            report['missing_samples'].append(f'{name}#{row[0]}: {path}')
+
+def reconcile_storage(dry_run=True, rate=0, batch_size=500, min_age=3600):
+    """Comparer le dossier d'uploads et la base, et récupérer l'espace orphelin
+
+    Fichiers et lignes sont parcourus par lots de `batch_size` : la mémoire
+    utilisée ne dépend pas de la taille de la médiathèque. Un fichier plus
+    récent que `min_age` secondes n'est jamais supprimé (upload ou
+    traitement en cours). `rate` limite les opérations disque par seconde.
+    Sans `dry_run`, les orphelins sont supprimés ; les fichiers manquants
+    sont seulement signalés.
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    limiter = RateLimiter(rate)
+    cutoff = time.time() - min_age
+    report = {
+        'dry_run': dry_run,
+        'scanned_files': 0,
+        'scanned_bytes': 0,
+        'orphan_files': 0,
+        'orphan_bytes': 0,
+        'reclaimed_files': 0,
+        'reclaimed_bytes': 0,
+        'errors': 0,
+        'missing': {'media': 0, 'post_media': 0, 'posts': 0},
+        'orphan_samples': [],
+        'missing_samples': []
+    }
+
+    def check(batch):
+        referenced = _referenced([path for path, _, _ in batch], upload_folder)
+        for path, size, mtime in batch:
+            if path in referenced or mtime > cutoff:
+                continue
+            report['orphan_files'] += 1
+            report['orphan_bytes'] += size
+            if len(report['orphan_samples']) < MAX_SAMPLES:
+                report['orphan_samples'].append(path)
+            if dry_run:
+                continue
+            limiter.wait()
+            try:
+                os.remove(path)
+            except OSError as e:
+                report['errors'] += 1
+                logger.error('Erreur suppression fichier %s: %s', path, e)
+                continue
+            report['reclaimed_files'] += 1
+            report['reclaimed_bytes'] += size
+            _remove_empty_parents(path, upload_folder)
+        db.session.rollback()
+
+    for folder in MANAGED_FOLDERS:
+        batch = []
+        for path, size, mtime in _walk(os.path.join(upload_folder, folder), limiter):
+            report['scanned_files'] += 1
+            report['scanned_bytes'] += size
+            batch.append((path, size, mtime))
+            if len(batch) >= batch_size:
+                check(batch)
+                batch = []
+        if batch:
+            check(batch)
+
+    _missing_files(report, limiter, batch_size)
+    db.session.rollback()
+    return report
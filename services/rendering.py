@@ -0,0 +1,142 @@
+import hashlib
+import re
+import threading
+import markdown
+from bleach.sanitizer import Cleaner
+
+from services.cache import LRUCache
+
+# Ouverture d'un bloc où les lignes vides ne coupent pas : code clôturé ou formule $$
+_FENCE = re.compile(r'^\s{0,3}(`{3,}|~{3,}|\$\$)')
+# Blocs que Python-Markdown fusionne par-dessus une ligne vide : listes et citations
+_CONTINUED = (re.compile(r'^\s{0,3}([*+-]|\d+[.)])\s'), re.compile(r'^\s{0,3}>'))
+# Définition de lien par référence : utilisable depuis n'importe quel bloc
+_REFERENCE = re.compile(r'^\s{0,3}\[[^\]]+\]:\s*\S', re.MULTILINE)
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def split_blocks(text):
+    """Découper un texte Markdown en blocs de premier niveau, rendus séparément
+
+    Une ligne vide ne coupe ni un bloc de code (clôturé ou indenté), ni une
+    formule $$...$$, ni une liste aérée ou une suite de citations. Retourne None si le texte définit
+    des liens par référence : un bloc dépend alors d'un autre.
+    """
+    if _REFERENCE.search(text):
+        return None
+
+    blocks, current = [], []
+    fence = None
+    after_blank = False
+    kind = None
+    for line in text.replace('\r\n', '\n').split('\n'):
+        if fence is not None:
+            current.append(line)
+            if line.strip().startswith(fence):
+                fence = None
+            continue
+        if not line.strip():
+            if current:
+                current.append(line)
+                after_blank = True
+            continue
+
+        # Après une ligne vide, seule une ligne indentée ou la suite d'une
+        # liste ou d'une citation prolonge le bloc courant
+        if after_blank and line[0] not in ' \t' and not (kind and kind.match(line)):
+            blocks.append('\n'.join(current).rstrip())
+            current = []
+        if not current:
+            kind = next((pattern for pattern in _CONTINUED if pattern.match(line)), None)
+        current.append(line)
+        after_blank = False
+
+        match = _FENCE.match(line)
+        if match:
+            rest = line.strip()[len(match.group(1)):]
+            # $$...$$ sur une seule ligne : rien à attendre
+            if not (match.group(1) == '$$' and rest.endswith('$$')):
+                fence = match.group(1)
+    if current:
+        blocks.append('\n'.join(current).rstrip())
+    return blocks
+
+class MarkdownRenderer:
+    """Rendu Markdown -> HTML nettoyé, avec convertisseur réutilisé et cache par contenu
+
+    Ni markdown.Markdown ni le Cleaner de bleach ne sont sûrs entre threads :
+    chaque thread garde sa paire, remise à zéro entre deux documents, au
+    lieu d'en construire une à chaque appel. Le HTML est mis en cache sous
+    l'empreinte SHA-256 du texte : un même contenu n'est rendu qu'une fois
+    par worker, quel que soit le post ou la requête qui le demande.
+    """
+
+    def __init__(self, max_entries=256, ttl=86400, max_blocks=4096):
+        self._cache = LRUCache(max_entries, ttl)
+        self._blocks = LRUCache(max_blocks, ttl)
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self._cache = LRUCache(app.config['MARKDOWN_CACHE_MAX_ENTRIES'], app.config['MARKDOWN_CACHE_TTL'])
+        self._blocks = LRUCache(app.config['MARKDOWN_BLOCK_CACHE_MAX_ENTRIES'], app.config['MARKDOWN_CACHE_TTL'])
+        app.extensions['markdown_renderer'] = self
+
+    def _pipeline(self):
+        local = self._local
+        if not hasattr(local, 'markdown'):
+            local.markdown = markdown.Markdown()
+            local.cleaner = Cleaner()
+        return local.markdown, local.cleaner
+
+    def convert(self, text):
+        """Rendre un texte sans passer par le cache"""
+        converter, cleaner = self._pipeline()
+        return cleaner.clean(converter.reset().convert(text or ''))
+
+    def _cached(self, cache, text, key):
+        html = cache.get(key)
+        if html is not None:
+            self.hits += 1
+            return html
+        self.misses += 1
+        html = self.convert(text)
+        cache.set(key, html)
+        return html
+
+    def render(self, text):
+        """HTML nettoyé d'un texte Markdown, depuis le cache si possible"""
+        text = text or ''
+        return self._cached(self._cache, text, content_hash(text))
+
+    def render_blocks(self, text, known=()):
+        """Rendu bloc par bloc : liste de (identifiant, HTML) dans l'ordre du texte
+
+        Chaque bloc est mis en cache sous son empreinte ; le HTML des blocs
+        dont l'identifiant figure dans `known` (déjà affichés par le client)
+        n'est pas calculé et vaut None. Joints par des sauts de ligne, les
+        fragments donnent le même HTML que `render`, aux lignes vides près
+        entre deux blocs.
+        """
+        text = text or ''
+        blocks = split_blocks(text)
+        if blocks is None:
+            blocks = [text]
+        known = set(known)
+        rendered = []
+        for block in blocks:
+            key = content_hash(block)
+            block_id = key[:16]
+            rendered.append((block_id, None if block_id in known else self._cached(self._blocks, block, key)))
+        return rendered
+
+    def clear(self):
+        self._cache.clear()
+        self._blocks.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+markdown_renderer = MarkdownRenderer()
@@ -0,0 +1,140 @@
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+from flask import current_app
+from PIL import Image
+from sqlalchemy.exc import IntegrityError
+
+from database.models import db, MediaRendition
+from services.imaging import render_rendition, supported_formats
+from services.media_delivery import fingerprint, media_url
+from services.storage import storage
+
+try:
+    import fcntl
+except ImportError:  # Windows : verrou limité au processus
+    fcntl = None
+
+# Verrous répartis par clé : le nombre de verrous reste borné
+_LOCK_STRIPES = [threading.Lock() for _ in range(64)]
+
+@contextmanager
+def single_flight(key, lock_path):
+    """Exécuter un bloc une seule fois à la fois pour une clé donnée
+
+    Verrou de thread pour les requêtes du même worker, puis verrou de
+    fichier pour celles des autres workers gunicorn.
+    """
+    with _LOCK_STRIPES[zlib.crc32(key.encode('utf-8')) % len(_LOCK_STRIPES)]:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def rendition_widths():
+    return tuple(current_app.config['MEDIA_RENDITION_WIDTHS'])
+
+def rendition_formats():
+    return supported_formats(current_app.config['MEDIA_RENDITION_FORMATS'])
+
+def storage_key(media):
+    """Dossier des déclinaisons : empreinte du contenu, partagée par les doublons"""
+    return media.blob.sha256 if media.blob_id is not None else str(media.id)
+
+def rendition_path(key, width, fmt):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'renditions', key,
+                        f'{width}.{fmt}').replace('\\', '/')
+
+def rendition_targets(key):
+    """Toutes les déclinaisons configurées d'un média : (largeur, format, chemin)"""
+    return [(width, fmt, rendition_path(key, width, fmt))
+            for width in rendition_widths() for fmt in rendition_formats()]
+
+def rendition_url(media, width, fmt):
+    return f'/media/{media.id}/rendition/{width}.{fmt}?v={fingerprint(media)}'
+
+def record_renditions(media_id, renditions):
+    """Enregistrer (ou mettre à jour) les déclinaisons générées d'un média"""
+    existing = {
+        (r.width, r.format): r
+        for r in MediaRendition.query.filter_by(media_id=media_id).all()
+    }
+    for info in renditions:
+        rendition = existing.get((info['width'], info['format']))
+        if rendition is None:
+            rendition = MediaRendition(media_id=media_id, width=info['width'], format=info['format'])
+            db.session.add(rendition)
+        rendition.height = info['height']
+        rendition.file_path = info['file_path']
+        rendition.file_size = info['file_size']
+
+def get_or_create_rendition(media, width, fmt):
+    """Déclinaison d'un média, générée à la première demande
+
+    La génération est protégée par `single_flight` : des requêtes
+    simultanées pour la même déclinaison attendent la première au lieu de
+    refaire le travail, puis servent le fichier produit. Avec un stockage
+    distant, l'original est téléchargé le temps du rendu et la déclinaison
+    publiée avant d'être enregistrée.
+    """
+    rendition = MediaRendition.query.filter_by(media_id=media.id, width=width, format=fmt).first()
+    if rendition is not None and storage.is_available(rendition.file_path):
+        return rendition
+
+    output_path = rendition_path(storage_key(media), width, fmt)
+    with single_flight(output_path, f'{output_path}.lock'):
+        # Une autre requête a pu terminer pendant l'attente du verrou (en
+        # stockage distant, sa copie locale est déjà libérée : seule la
+        # ligne enregistrée en témoigne)
+        if storage.remote:
+            rendition = MediaRendition.query.filter_by(media_id=media.id, width=width, format=fmt).first()
+            if rendition is not None:
+                return rendition
+        if not os.path.exists(output_path):
+            storage.localize(media.file_path)
+            with Image.open(media.file_path) as img:
+                info = render_rendition(img, output_path, width, fmt,
+                                        current_app.config['MEDIA_RENDITION_QUALITY'])
+            storage.publish(output_path, f'image/{fmt}')
+        else:
+            with Image.open(output_path) as img:
+                info = {
+                    'width': width,
+                    'height': img.height,
+                    'format': fmt,
+                    'file_path': output_path,
+                    'file_size': os.path.getsize(output_path)
+                }
+
+        try:
+            record_renditions(media.id, [info])
+            db.session.commit()
+        except IntegrityError:
+            # Ligne insérée en parallèle par un autre worker
+            db.session.rollback()
+        storage.evict(output_path)
+        storage.evict(media.file_path)
+
+    return MediaRendition.query.filter_by(media_id=media.id, width=width, format=fmt).first()
+
+def srcset_for(media):
+    """Attributs srcset par format, prêts pour <picture>/<img>
+
+    Seules les largeurs inférieures à l'image d'origine sont proposées ;
+    l'original complète la liste à sa largeur réelle.
+    """
+    if media.file_type != 'image' or not media.width:
+        return None
+    widths = [width for width in rendition_widths() if width < media.width]
+    original = f'{media_url(media)} {media.width}w'
+    return {
+        fmt: ', '.join([f'{rendition_url(media, width, fmt)} {width}w' for width in widths] + [original])
+        for fmt in rendition_formats()
+    }
@@ -0,0 +1,174 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import func, select
+
+from database.events import on_commit
+from database.models import db, Post, Activity, Offer
+from services.cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+def publication_status(status, published_at, now=None):
+    """Statut effectif d'un post et sa date de publication
+
+    Une publication datée dans le futur devient 'scheduled' et un post
+    programmé dont la date est passée est publié tout de suite. Sans date,
+    une publication est datée de maintenant et une programmation ramenée
+    au brouillon.
+    """
+    now = now or datetime.utcnow()
+    if status not in ('published', 'scheduled'):
+        return status, published_at
+    if published_at is None:
+        return ('published', now) if status == 'published' else ('draft', None)
+    return ('scheduled' if published_at > now else 'published'), published_at
+
+class PublishScheduler:
+    """Publication programmée des posts et transitions datées des offres et activités
+
+    Chaque file est lue par un index (statut, date) : posts 'scheduled' par
+    published_at, offres ouvertes par date limite, activités par date de
+    début. La prochaine échéance est gardée en mémoire ; tant qu'elle n'est
+    pas atteinte, un passage de la tâche ne fait aucune requête. Un commit
+    touchant un post, une offre ou une activité la fait recalculer dans ce
+    worker, les autres la relisent au plus tard après `refresh` secondes.
+
+    Les mises à jour sont conditionnelles (WHERE status = ...) : plusieurs
+    workers peuvent exécuter la tâche sans publier deux fois. Chaque worker
+    dont l'échéance connue est passée invalide le cache des réponses, même
+    si un autre a fait les mises à jour : le cache mémoire est propre à
+    chaque processus. Une échéance créée et traitée ailleurs avant la
+    relecture reste servie au plus API_CACHE_TTL secondes.
+    """
+
+    def __init__(self, batch_size=100, refresh=300):
+        self.batch_size = batch_size
+        self.refresh = refresh
+        self._next_due = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.skipped = 0
+
+    def init_app(self, app):
+        self.batch_size = app.config['SCHEDULER_BATCH_SIZE']
+        self.refresh = app.config['SCHEDULER_REFRESH']
+        app.extensions['publish_scheduler'] = self
+
+    def invalidate(self):
+        self._checked_at = None
+
+    def next_due(self):
+        """Prochaine échéance enregistrée en base (None : rien de programmé)"""
+        posts, offers, activities = Post.__table__, Offer.__table__, Activity.__table__
+        dates = db.session.execute(select(
+            select(func.min(posts.c.published_at))
+            .where(posts.c.status == 'scheduled').scalar_subquery(),
+            select(func.min(offers.c.application_deadline))
+            .where(offers.c.status == 'open').scalar_subquery(),
+            select(func.min(activities.c.start_date))
+            .where(activities.c.status == 'upcoming').scalar_subquery(),
+            select(func.min(func.coalesce(activities.c.end_date, activities.c.start_date)))
+            .where(activities.c.status == 'ongoing').scalar_subquery()
+        )).one()
+        return min(filter(None, dates), default=None)
+
+    def publish_due(self, now):
+        """Publier les posts programmés échus, par lots dans l'ordre de publication"""
+        posts = Post.__table__
+        published = 0
+        while True:
+            ids = db.session.execute(
+                select(posts.c.id)
+                .where(posts.c.status == 'scheduled', posts.c.published_at <= now)
+                .order_by(posts.c.published_at, posts.c.id)
+                .limit(self.batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            result = db.session.execute(
+                posts.update()
+                .where(posts.c.id.in_(ids), posts.c.status == 'scheduled')
+                .values(status='published', updated_at=now)
+            )
+            db.session.commit()
+            published += result.rowcount
+            if len(ids) < self.batch_size:
+                break
+        return published
+
+    def close_offers(self, now):
+        """Fermer les offres ouvertes dont la date limite est passée"""
+        offers = Offer.__table__
+        result = db.session.execute(
+            offers.update()
+            .where(offers.c.status == 'open', offers.c.application_deadline <= now)
+            .values(status='closed', updated_at=now)
+        )
+        db.session.commit()
+        return result.rowcount
+
+    def advance_activities(self, now):
+        """Faire passer les activités de 'upcoming' à 'ongoing' puis 'completed'
+
+        Une activité sans date de fin est terminée dès son début passé ;
+        les activités annulées ne sont pas touchées.
+        """
+        activities = Activity.__table__
+        completed = db.session.execute(
+            activities.update()
+            .where(activities.c.status.in_(('upcoming', 'ongoing')),
+                   func.coalesce(activities.c.end_date, activities.c.start_date) < now)
+            .values(status='completed', updated_at=now)
+        ).rowcount
+        started = db.session.execute(
+            activities.update()
+            .where(activities.c.status == 'upcoming', activities.c.start_date <= now,
+                   activities.c.end_date >= now)
+            .values(status='ongoing', updated_at=now)
+        ).rowcount
+        db.session.commit()
+        return {'activities_started': started, 'activities_completed': completed}
+
+    def run(self, now=None, force=False):
+        """Exécuter les publications et transitions échues
+
+        Retourne les compteurs, ou None si la prochaine échéance connue
+        n'est pas encore atteinte (aucune requête).
+        """
+        now = now or datetime.utcnow()
+        with self._lock:
+            fresh = self._checked_at is not None and time.monotonic() - self._checked_at < self.refresh
+            if not force and fresh and (self._next_due is None or self._next_due > now):
+                self.skipped += 1
+                return None
+
+            passed = self._next_due is not None and self._next_due <= now
+            counts = {'posts_published': self.publish_due(now), 'offers_closed': self.close_offers(now)}
+            counts.update(self.advance_activities(now))
+            if any(counts.values()):
+                logger.info('Programmation : %s', counts)
+            # Mises à jour hors ORM : les hooks après commit ne les voient pas.
+            # Échéance passée : mise à jour ici ou par un autre worker
+            if passed or any(counts.values()):
+                response_cache.invalidate()
+
+            self._next_due = self.next_due()
+            self._checked_at = time.monotonic()
+            self.runs += 1
+            return counts
+
+    def stats(self):
+        return {
+            'runs': self.runs,
+            'skipped': self.skipped,
+            'next_due': self._next_due.isoformat() if self._next_due else None
+        }
+
+publish_scheduler = PublishScheduler()
+
+@on_commit(Post, Activity, Offer)
+def _reschedule(changes):
+    publish_scheduler.invalidate()
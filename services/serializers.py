@@ -0,0 +1,297 @@
+import itertools
+from flask.json.provider import DefaultJSONProvider
+
+from services.media_delivery import media_url, thumbnail_url
+from services.renditions import srcset_for
+
+try:
+    import orjson
+except ImportError:  # encodeur rapide optionnel, repli sur json
+    orjson = None
+
+class DateTime:
+    """Champ date/heure sérialisé en ISO 8601"""
+    def __init__(self, path):
+        self.path = path
+
+class Format:
+    """Champ mis en forme par un gabarit, None si la valeur est vide"""
+    def __init__(self, path, template):
+        self.path = path
+        self.template = template
+
+class Nested:
+    """Objet lié sérialisé avec sa propre spécification, None s'il est absent"""
+    def __init__(self, path, spec):
+        self.path = path
+        self.serializer = Serializer(spec)
+
+class Pluck:
+    """Liste d'un attribut des éléments d'une collection"""
+    def __init__(self, path, attr):
+        self.path = path
+        self.attr = attr
+
+class Custom:
+    """Champ calculé par une fonction de l'objet"""
+    def __init__(self, func):
+        self.func = func
+
+def _compile(spec):
+    """Générer une fonction objet -> dict à partir d'une spécification
+
+    Le code est produit une seule fois : à l'exécution il ne reste que des
+    accès d'attributs et un littéral de dict, sans introspection ni boucle
+    sur la spécification.
+    """
+    names = itertools.count()
+    namespace = {}
+    lines = []
+    prefixes = {}
+
+    def local(expr):
+        name = f'_v{next(names)}'
+        lines.append(f'    {name} = {expr}')
+        return name
+
+    def resolve(path):
+        parts = path.split('.')
+        owner = 'obj'
+        for i, part in enumerate(parts[:-1]):
+            prefix = '.'.join(parts[:i + 1])
+            if prefix not in prefixes:
+                expr = f'{owner}.{part}' if owner == 'obj' else f'({owner}.{part} if {owner} is not None else None)'
+                prefixes[prefix] = local(expr)
+            owner = prefixes[prefix]
+        if owner == 'obj':
+            return f'obj.{parts[-1]}'
+        return f'({owner}.{parts[-1]} if {owner} is not None else None)'
+
+    items = []
+    for key, field in spec.items():
+        if isinstance(field, str):
+            expr = resolve(field)
+        elif isinstance(field, DateTime):
+            value = local(resolve(field.path))
+            expr = f'({value}.isoformat() if {value} is not None else None)'
+        elif isinstance(field, Format):
+            value = local(resolve(field.path))
+            template = f'_t{next(names)}'
+            namespace[template] = field.template
+            expr = f'({template}.format({value}) if {value} else None)'
+        elif isinstance(field, Nested):
+            value = local(resolve(field.path))
+            nested = f'_s{next(names)}'
+            namespace[nested] = field.serializer.func
+            expr = f'({nested}({value}) if {value} is not None else None)'
+        elif isinstance(field, Pluck):
+            value = local(resolve(field.path))
+            expr = f'([item.{field.attr} for item in {value}] if {value} is not None else [])'
+        elif isinstance(field, Custom):
+            func = f'_f{next(names)}'
+            namespace[func] = field.func
+            expr = f'{func}(obj)'
+        else:
+            raise TypeError(f'Champ de sérialisation inconnu pour {key!r}: {field!r}')
+        items.append(f'{key!r}: {expr}')
+
+    source = 'def serialize(obj):\n' + '\n'.join(lines) + ('\n' if lines else '')
+    source += '    return {' + ', '.join(items) + '}\n'
+    exec(compile(source, '<serializer>', 'exec'), namespace)
+    return namespace['serialize']
+
+class Serializer:
+    """Sérialiseur déclaratif compilé d'un modèle vers un dict JSON"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.func = _compile(spec)
+        self._subsets = {}
+
+    def __call__(self, obj):
+        return self.func(obj)
+
+    def many(self, objs):
+        func = self.func
+        return [func(obj) for obj in objs]
+
+    def only(self, fields):
+        """Sérialiseur restreint aux champs demandés (compilé une fois par sous-ensemble)"""
+        key = tuple(field for field in self.spec if field in fields)
+        if key not in self._subsets:
+            self._subsets[key] = Serializer({field: self.spec[field] for field in key})
+        return self._subsets[key]
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Fournisseur JSON de Flask utilisant orjson s'il est installé
+
+    Le format des dates, les clés triées et la gestion des types spéciaux
+    restent ceux du fournisseur par défaut ; sans orjson, ou en mode
+    d'affichage indenté, on délègue simplement à json.
+    """
+
+    def _orjson_options(self):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._orjson_options()).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        if orjson is None or pretty:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._orjson_options() | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+# Spécifications de l'API publique
+
+CATEGORY_REF = {
+    'name': 'name',
+    'slug': 'slug',
+    'color': 'color'
+}
+
+CATEGORY = {
+    'id': 'id',
+    'name': 'name',
+    'slug': 'slug',
+    'description': 'description',
+    'color': 'color',
+    'icon': 'icon'
+}
+
+POST_LIST = {
+    'id': 'id',
+    'title': 'title',
+    'slug': 'slug',
+    'excerpt': 'excerpt',
+    'content': 'content_html',
+    'post_type': 'post_type',
+    'featured_image': Format('featured_image', '/media/{}'),
+    'published_at': DateTime('published_at'),
+    'author': 'author.username',
+    'category': Nested('category_ref', CATEGORY_REF),
+    'tags': Pluck('tag_list', 'name'),
+    'activity': Nested('activity', {
+        'activity_type': 'activity_type',
+        'start_date': DateTime('start_date'),
+        'end_date': DateTime('end_date'),
+        'location': 'location',
+        'is_online': 'is_online',
+        'status': 'status'
+    }),
+    'offer': Nested('offer', {
+        'offer_type': 'offer_type',
+        'contract_type': 'contract_type',
+        'location': 'location',
+        'salary_range': 'salary_range',
+        'application_deadline': DateTime('application_deadline'),
+        'status': 'status'
+    })
+}
+
+POST_DETAIL = dict(POST_LIST, **{
+    'author': Nested('author', {
+        'username': 'username',
+        'first_name': 'first_name',
+        'last_name': 'last_name'
+    }),
+    'activity': Nested('activity', {
+        'activity_type': 'activity_type',
+        'start_date': DateTime('start_date'),
+        'end_date': DateTime('end_date'),
+        'location': 'location',
+        'is_online': 'is_online',
+        'registration_url': 'registration_url',
+        'status': 'status'
+    }),
+    'offer': Nested('offer', {
+        'offer_type': 'offer_type',
+        'contract_type': 'contract_type',
+        'location': 'location',
+        'salary_range': 'salary_range',
+        'experience_required': 'experience_required',
+        'application_deadline': DateTime('application_deadline'),
+        'start_date': DateTime('start_date'),
+        'is_remote': 'is_remote',
+        'status': 'status'
+    }),
+    'views': 'views',
+    'likes': 'likes'
+})
+
+ACTIVITY = {
+    'id': 'id',
+    'title': 'title',
+    'slug': 'slug',
+    'description': 'description',
+    'activity_type': 'activity_type',
+    'start_date': DateTime('start_date'),
+    'end_date': DateTime('end_date'),
+    'location': 'location',
+    'is_online': 'is_online',
+    'registration_url': 'registration_url',
+    'max_participants': 'max_participants',
+    'current_participants': 'current_participants',
+    'status': 'status',
+    'featured_image': Format('post.featured_image', '/media/{}'),
+    'post_slug': 'post.slug'
+}
+
+OFFER = {
+    'id': 'id',
+    'title': 'title',
+    'slug': 'slug',
+    'description': 'description',
+    'offer_type': 'offer_type',
+    'contract_type': 'contract_type',
+    'location': 'location',
+    'salary_range': 'salary_range',
+    'experience_required': 'experience_required',
+    'application_deadline': DateTime('application_deadline'),
+    'start_date': DateTime('start_date'),
+    'is_remote': 'is_remote',
+    'status': 'status',
+    'views': 'views',
+    'applications_count': 'applications_count',
+    'featured_image': Format('post.featured_image', '/media/{}'),
+    'post_slug': 'post.slug'
+}
+
+MEDIA = {
+    'id': 'id',
+    'filename': 'filename',
+    'original_filename': 'original_filename',
+    'url': Custom(media_url),
+    'thumbnail_url': Custom(thumbnail_url),
+    'file_type': 'file_type',
+    'mime_type': 'mime_type',
+    'file_size': 'file_size',
+    'created_at': DateTime('created_at'),
+    'description': 'description',
+    'alt_text': 'alt_text',
+    'width': 'width',
+    'height': 'height',
+    'processing_status': 'processing_status',
+    'srcset': Custom(srcset_for)
+}
+
+# Champs de la vue résumée (view=summary) des listes
+POST_SUMMARY_FIELDS = ('id', 'title', 'slug', 'excerpt', 'post_type', 'featured_image', 'published_at', 'category')
+ACTIVITY_SUMMARY_FIELDS = ('id', 'title', 'slug', 'activity_type', 'start_date', 'end_date', 'location',
+                           'is_online', 'status', 'featured_image', 'post_slug')
+OFFER_SUMMARY_FIELDS = ('id', 'title', 'slug', 'offer_type', 'contract_type', 'location',
+                        'application_deadline', 'is_remote', 'status', 'featured_image', 'post_slug')
+
+serialize_category = Serializer(CATEGORY)
+serialize_post = Serializer(POST_LIST)
+serialize_post_detail = Serializer(POST_DETAIL)
+serialize_activity = Serializer(ACTIVITY)
+serialize_offer = Serializer(OFFER)
+serialize_media = Serializer(MEDIA)
@@ -0,0 +1,402 @@
+import base64
+import mimetypes
+import os
+import shutil
+import time
+import uuid
+from urllib.parse import quote
+from itsdangerous import BadSignature, URLSafeSerializer
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # stockage S3 optionnel
+    boto3 = None
+
+CHUNK_SIZE = 1024 * 1024
+
+class StorageError(Exception):
+    """Opération de stockage impossible"""
+
+class NotFound(StorageError):
+    """Objet absent du stockage"""
+
+def _sha256_base64(sha256):
+    return base64.b64encode(bytes.fromhex(sha256)).decode('ascii')
+
+class LocalStorage:
+    """Stockage sur le disque local, sous `root` (UPLOAD_FOLDER)
+
+    Les URLs présignées pointent vers /media/storage/<clé>, signées avec la
+    clé secrète de l'application : même parcours client qu'avec S3, mais
+    les octets passent par l'application.
+    """
+
+    remote = False
+
+    def __init__(self, root, secret_key='', url_prefix='/media/storage'):
+        self.root = root
+        self.url_prefix = url_prefix
+        self._signer = URLSafeSerializer(secret_key, salt='storage')
+
+    def key(self, path):
+        return os.path.relpath(path, self.root).replace('\\', '/')
+
+    def path(self, key):
+        root = os.path.abspath(self.root)
+        path = os.path.abspath(os.path.join(root, key))
+        if not path.startswith(root + os.sep):
+            raise NotFound(key)
+        return os.path.join(self.root, os.path.relpath(path, root)).replace('\\', '/')
+
+    def put(self, key, source, content_type=None):
+        """Écrire un objet depuis un chemin local ou un flux (écriture atomique)"""
+        target = self.path(key)
+        if isinstance(source, str) and os.path.abspath(source) == os.path.abspath(target):
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f'{target}.{uuid.uuid4().hex}.tmp'
+        try:
+            if isinstance(source, str):
+                shutil.copyfile(source, tmp_path)
+            else:
+                with open(tmp_path, 'wb') as out:
+                    shutil.copyfileobj(source, out, CHUNK_SIZE)
+            os.replace(tmp_path, target)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise NotFound(key)
+
+    def read(self, key, length):
+        """Premiers octets d'un objet (détection du type)"""
+        try:
+            with open(self.path(key), 'rb') as f:
+                return f.read(length)
+        except FileNotFoundError:
+            raise NotFound(key)
+
+    def stream(self, key, chunk_size=CHUNK_SIZE):
+        try:
+            f = open(self.path(key), 'rb')
+        except FileNotFoundError:
+            raise NotFound(key)
+        with f:
+            yield from iter(lambda: f.read(chunk_size), b'')
+
+    def head(self, key):
+        """Taille et empreinte SHA-256 (None si le stockage ne la fournit pas)"""
+        try:
+            return {'size': os.path.getsize(self.path(key)), 'sha256': None}
+        except FileNotFoundError:
+            raise NotFound(key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_prefix(self, prefix):
+        shutil.rmtree(self.path(prefix), ignore_errors=True)
+
+    def move(self, src_key, dst_key):
+        target = self.path(dst_key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.replace(self.path(src_key), target)
+        except FileNotFoundError:
+            raise NotFound(src_key)
+
+    def fetch(self, key, path):
+        """Garantir une copie locale de l'objet en `path`"""
+        if os.path.abspath(path) == os.path.abspath(self.path(key)):
+            if not os.path.exists(path):
+                raise NotFound(key)
+            return
+        self.put(self.key(path), self.path(key))
+
+    def evict(self, path):
+        # Le disque local est le stockage lui-même : rien à libérer
+        pass
+
+    def _sign(self, key, method, expires, **claims):
+        token = self._signer.dumps({'k': key, 'm': method, 'e': int(time.time()) + expires, **claims})
+        return f'{self.url_prefix}/{quote(key)}?token={token}'
+
+    def presign_get(self, key, expires=3600, content_type=None):
+        return self._sign(key, 'GET', expires)
+
+    def presign_put(self, key, size, expires=3600, content_type=None, sha256=None):
+        return {'url': self._sign(key, 'PUT', expires, n=size), 'method': 'PUT', 'headers': {}}
+
+    def verify(self, key, method, token):
+        """Contenu d'un jeton d'URL présignée, StorageError s'il est invalide ou expiré"""
+        try:
+            claims = self._signer.loads(token)
+        except BadSignature:
+            raise StorageError('Signature invalide')
+        if claims.get('k') != key or claims.get('m') != method or claims.get('e', 0) < time.time():
+            raise StorageError('Lien invalide ou expiré')
+        return claims
+
+class S3Storage:
+    """Stockage compatible S3 (AWS, MinIO, R2...) ; le disque local sert de cache de travail
+
+    Les chemins locaux (colonnes file_path) restent la référence : la clé
+    d'un objet est son chemin relatif à `root`. Le client boto3 est créé à
+    la demande, ce qui permet de transmettre le pilote au pool de traitement.
+    """
+
+    remote = True
+
+    def __init__(self, root, bucket, endpoint_url=None, region=None, access_key_id=None,
+                 secret_access_key=None, prefix=''):
+        if boto3 is None:
+            raise RuntimeError("Le stockage 's3' nécessite le paquet boto3")
+        if not bucket:
+            raise RuntimeError('S3_BUCKET doit être renseigné pour le stockage s3')
+        self.root = root
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self._client = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_client'] = None
+        return state
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = boto3.client(
+                's3',
+                endpoint_url=self.endpoint_url,
+                region_name=self.region,
+                aws_access_key_id=self.access_key_id,
+                aws_secret_access_key=self.secret_access_key,
+                # Adressage par chemin : requis par MinIO et la plupart des stockages compatibles
+                config=BotoConfig(signature_version='s3v4',
+                                  s3={'addressing_style': 'path' if self.endpoint_url else 'auto'})
+            )
+        return self._client
+
+    def key(self, path):
+        return os.path.relpath(path, self.root).replace('\\', '/')
+
+    def _object(self, key):
+        return f'{self.prefix}{key}'
+
+    @staticmethod
+    def _error(e, key):
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return NotFound(key)
+        return StorageError(f'{key} : {e}')
+
+    def put(self, key, source, content_type=None):
+        """Envoyer un chemin local ou un flux (multipart géré par boto3 au-delà de 8MB)"""
+        content_type = content_type or mimetypes.guess_type(key)[0]
+        extra = {'ContentType': content_type} if content_type else None
+        try:
+            if isinstance(source, str):
+                self.client.upload_file(source, self.bucket, self._object(key), ExtraArgs=extra)
+            else:
+                self.client.upload_fileobj(source, self.bucket, self._object(key), ExtraArgs=extra)
+        except ClientError as e:
+            raise self._error(e, key)
+
+    def _get_object(self, key, **params):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._object(key), **params)
+        except ClientError as e:
+            raise self._error(e, key)
+
+    def get(self, key):
+        return self._get_object(key)['Body'].read()
+
+    def read(self, key, length):
+        return self._get_object(key, Range=f'bytes=0-{length - 1}')['Body'].read()
+
+    def stream(self, key, chunk_size=CHUNK_SIZE):
+        body = self._get_object(key)['Body']
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def head(self, key):
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self._object(key), ChecksumMode='ENABLED')
+        except ClientError as e:
+            raise self._error(e, key)
+        checksum = response.get('ChecksumSHA256')
+        # Empreinte composite (upload multipart, suffixe -N) : pas celle du contenu
+        sha256 = base64.b64decode(checksum).hex() if checksum and '-' not in checksum else None
+        return {'size': response['ContentLength'], 'sha256': sha256}
+
+    def exists(self, key):
+        try:
+            self.head(key)
+        except NotFound:
+            return False
+        return True
+
+    def delete(self, key):
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=self._object(key))
+        except ClientError as e:
+            raise self._error(e, key)
+
+    def delete_prefix(self, prefix):
+        """Supprimer tous les objets sous `prefix`, par pages de 1000 (limite de l'API)"""
+        paginator = self.client.get_paginator('list_objects_v2')
+        try:
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=self._object(prefix.rstrip('/') + '/')):
+                objects = [{'Key': item['Key']} for item in page.get('Contents', ())]
+                if objects:
+                    self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': objects, 'Quiet': True})
+        except ClientError as e:
+            raise self._error(e, prefix)
+
+    def move(self, src_key, dst_key):
+        """Copie côté serveur puis suppression : aucun octet ne transite par l'application"""
+        try:
+            self.client.copy({'Bucket': self.bucket, 'Key': self._object(src_key)}, self.bucket, self._object(dst_key))
+        except ClientError as e:
+            raise self._error(e, src_key)
+        self.delete(src_key)
+
+    def fetch(self, key, path):
+        """Télécharger l'objet en `path` s'il n'y a pas déjà de copie locale"""
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            self.client.download_file(self.bucket, self._object(key), tmp_path)
+            os.replace(tmp_path, path)
+        except ClientError as e:
+            raise self._error(e, key)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def evict(self, path):
+        """Supprimer la copie locale d'un objet déjà publié"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def presign_get(self, key, expires=3600, content_type=None):
+        params = {'Bucket': self.bucket, 'Key': self._object(key)}
+        if content_type:
+            params['ResponseContentType'] = content_type
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires)
+
+    def presign_put(self, key, size, expires=3600, content_type=None, sha256=None):
+        """URL d'envoi direct ; taille, type et empreinte font partie de la signature"""
+        params = {'Bucket': self.bucket, 'Key': self._object(key), 'ContentLength': size}
+        headers = {}
+        if content_type:
+            params['ContentType'] = headers['Content-Type'] = content_type
+        if sha256:
+            # Le stockage refuse un contenu qui ne correspond pas à l'empreinte annoncée
+            params['ChecksumSHA256'] = headers['x-amz-checksum-sha256'] = _sha256_base64(sha256)
+        url = self.client.generate_presigned_url('put_object', Params=params, ExpiresIn=expires)
+        return {'url': url, 'method': 'PUT', 'headers': headers}
+
+class Storage:
+    """Accès aux fichiers uploadés, quel que soit le pilote configuré
+
+    Les appelants manipulent les chemins enregistrés en base ; le pilote
+    les traduit en clés. En local, publier ou libérer un fichier ne fait
+    rien ; avec S3, `publish` envoie le fichier et `evict` libère le disque.
+    """
+
+    def __init__(self):
+        self.driver = None
+        self.presign_expire = 3600
+
+    def init_app(self, app):
+        backend = app.config.get('STORAGE_BACKEND', 'local')
+        root = app.config['UPLOAD_FOLDER']
+        if backend == 's3':
+            self.driver = S3Storage(
+                root,
+                app.config.get('S3_BUCKET'),
+                endpoint_url=app.config.get('S3_ENDPOINT_URL'),
+                region=app.config.get('S3_REGION'),
+                access_key_id=app.config.get('S3_ACCESS_KEY_ID'),
+                secret_access_key=app.config.get('S3_SECRET_ACCESS_KEY'),
+                prefix=app.config.get('S3_PREFIX') or ''
+            )
+        elif backend == 'local':
+            self.driver = LocalStorage(root, app.config['SECRET_KEY'])
+        else:
+            raise RuntimeError(f'Backend de stockage inconnu : {backend}')
+        self.presign_expire = app.config.get('STORAGE_PRESIGN_EXPIRE', 3600)
+        app.extensions['storage'] = self
+
+    @property
+    def remote(self):
+        return self.driver.remote
+
+    def key(self, path):
+        return self.driver.key(path)
+
+    def exists(self, path):
+        return self.driver.exists(self.key(path))
+
+    def is_available(self, path):
+        """Un fichier enregistré en base peut-il être servi ?
+
+        Avec un stockage distant, un chemin n'est enregistré qu'après
+        publication : aucune requête au stockage n'est nécessaire.
+        """
+        return bool(path) and (self.remote or os.path.exists(path))
+
+    def publish(self, path, content_type=None):
+        self.driver.put(self.key(path), path, content_type)
+
+    def localize(self, path):
+        """Copie locale d'un fichier stocké (traitement d'image) ; False s'il n'existe pas"""
+        try:
+            self.driver.fetch(self.key(path), path)
+        except NotFound:
+            return False
+        return True
+
+    def evict(self, path):
+        self.driver.evict(path)
+
+    def remove(self, path):
+        self.driver.delete(self.key(path))
+        self.driver.evict(path)
+
+    def remove_tree(self, path):
+        self.driver.delete_prefix(self.key(path))
+        if self.remote:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def url(self, path, content_type=None):
+        """URL présignée de lecture directe, ou None si l'application sert elle-même le fichier"""
+        if not self.remote:
+            return None
+        return self.driver.presign_get(self.key(path), self.presign_expire, content_type)
+
+storage = Storage()
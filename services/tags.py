@@ -0,0 +1,94 @@
+from datetime import datetime
+from slugify import slugify
+from sqlalchemy import or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from database.models import db, Tag, post_tags
+
+def parse_tag_names(raw):
+    """Noms de tags d'une saisie séparée par des virgules, sans doublon, dans l'ordre"""
+    return list(dict.fromkeys(name.strip() for name in (raw or '').split(',') if name.strip()))
+
+def _lookup(names, slugs):
+    return Tag.query.filter(or_(Tag.name.in_(names), Tag.slug.in_(slugs))).all()
+
+def _insert_missing(rows):
+    """INSERT des tags manquants, sans erreur pour ceux créés entre-temps par un autre worker"""
+    table = Tag.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        db.session.execute(postgresql.insert(table).values(rows).on_conflict_do_nothing())
+    elif dialect == 'sqlite':
+        db.session.execute(sqlite.insert(table).values(rows).on_conflict_do_nothing())
+    else:
+        # Pas d'upsert portable : un point de sauvegarde par tag
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(table.insert().values(row))
+            except IntegrityError:
+                pass
+
+def resolve_tags(names):
+    """Tags correspondant aux noms donnés, créés au besoin, dans l'ordre des noms
+
+    Une requête IN pour les tags existants, puis, s'il en manque, un seul
+    INSERT ... ON CONFLICT DO NOTHING et une relecture : le nombre de
+    requêtes ne dépend pas du nombre de tags. Un nom dont le slug appartient
+    déjà à un autre tag (« Maths » et « maths ») est rattaché à ce tag.
+    """
+    if not names:
+        return []
+    slugs = {name: slugify(name) for name in names}
+    tags = _lookup(names, set(slugs.values()))
+
+    by_name = {tag.name: tag for tag in tags}
+    by_slug = {tag.slug: tag for tag in tags}
+    missing = [name for name in names if name not in by_name and slugs[name] not in by_slug]
+    if missing:
+        rows = {}
+        for name in missing:
+            rows.setdefault(slugs[name], {'name': name, 'slug': slugs[name]})
+        _insert_missing(list(rows.values()))
+        for tag in _lookup(missing, set(rows)):
+            by_name.setdefault(tag.name, tag)
+            by_slug.setdefault(tag.slug, tag)
+
+    resolved = {}
+    for name in names:
+        tag = by_name.get(name) or by_slug.get(slugs[name])
+        if tag is not None:
+            resolved.setdefault(tag.id, tag)
+    return list(resolved.values())
+
+def set_post_tags(post, names):
+    """Aligner les tags d'un post sur `names` en n'écrivant que la différence
+
+    Les liens inchangés ne sont ni supprimés ni réinsérés : un DELETE pour
+    les tags retirés, un INSERT pour les tags ajoutés, rien si l'ensemble
+    est identique. Retourne True si les tags du post ont changé.
+    """
+    if post.id is None:
+        db.session.add(post)
+        db.session.flush()
+
+    wanted = {tag.id for tag in resolve_tags(names)}
+    current = set(db.session.scalars(select(post_tags.c.tag_id).where(post_tags.c.post_id == post.id)))
+    removed = current - wanted
+    added = wanted - current
+
+    if removed:
+        db.session.execute(post_tags.delete().where(post_tags.c.post_id == post.id,
+                                                    post_tags.c.tag_id.in_(removed)))
+    if added:
+        db.session.execute(post_tags.insert().values([{'post_id': post.id, 'tag_id': tag_id}
+                                                      for tag_id in sorted(added)]))
+    if not (removed or added):
+        return False
+
+    # Liens écrits hors de l'ORM : recharger la vue des tags et marquer le
+    # post modifié pour les hooks après commit (cache des réponses)
+    db.session.expire(post, ['tag_list'])
+    post.updated_at = datetime.utcnow()
+    return True
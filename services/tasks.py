@@ -0,0 +1,85 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class BackgroundTasks:
+    """Tâches périodiques exécutées dans un thread de chaque worker
+
+    Le thread démarre à la première requête servie par le processus (et non
+    à l'import), pour ne pas tourner dans les scripts d'initialisation ni
+    être perdu lors du fork des workers gunicorn. Les tâches marquées
+    `at_shutdown` sont aussi exécutées à l'arrêt du processus.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._tasks = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._atexit_registered = False
+
+    def init_app(self, app):
+        self.app = app
+        if app.config.get('BACKGROUND_TASKS_ENABLED', True):
+            app.before_request(self._ensure_started)
+        if not self._atexit_registered:
+            atexit.register(self.shutdown)
+            self._atexit_registered = True
+        app.extensions['background_tasks'] = self
+
+    def register(self, name, func, interval, at_shutdown=False):
+        """Enregistrer (ou remplacer) une fonction à appeler toutes les `interval` secondes"""
+        with self._lock:
+            self._tasks = [task for task in self._tasks if task['name'] != name]
+            self._tasks.append({
+                'name': name,
+                'func': func,
+                'interval': interval,
+                'at_shutdown': at_shutdown,
+                'next_run': time.monotonic() + interval
+            })
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='background-tasks', daemon=True)
+            self._thread.start()
+
+    def _run(self, task):
+        try:
+            with self.app.app_context():
+                task['func']()
+        except Exception:
+            logger.exception('Échec de la tâche de fond %s', task['name'])
+
+    def _loop(self):
+        while not self._stop.wait(1.0):
+            now = time.monotonic()
+            for task in list(self._tasks):
+                if task['next_run'] <= now:
+                    task['next_run'] = now + task['interval']
+                    self._run(task)
+
+    def run_pending(self, at_shutdown=False):
+        """Exécuter immédiatement toutes les tâches (ou celles d'arrêt)"""
+        for task in list(self._tasks):
+            if not at_shutdown or task['at_shutdown']:
+                self._run(task)
+
+    def shutdown(self):
+        self._stop.set()
+        if self.app is not None:
+            self.run_pending(at_shutdown=True)
+
+background_tasks = BackgroundTasks()
@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import threading
+import time
+from sqlalchemy import bindparam
+
+from database.events import on_commit
+from database.models import db, ApiToken
+
+logger = logging.getLogger(__name__)
+
+class TokenCache:
+    """Cache des tokens API déjà validés, borné dans le temps
+
+    Seuls les tokens actifs sont mis en cache, avec leur date d'expiration
+    pour que celle-ci reste vérifiée à chaque appel. Une modification ou une
+    suppression d'un ApiToken retire l'entrée dès le commit ; dans les autres
+    workers, l'entrée disparaît au plus tard après `ttl` secondes.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['cached_until'] < time.monotonic():
+                del self._entries[key]
+                return None
+            return entry
+
+    def set(self, token, api_token):
+        entry = {
+            'id': api_token.id,
+            'expires_at': api_token.expires_at,
+            'cached_until': time.monotonic() + self.ttl
+        }
+        with self._lock:
+            self._entries[self._key(token)] = entry
+        return entry
+
+    def invalidate_ids(self, token_ids):
+        token_ids = set(token_ids)
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if entry['id'] in token_ids]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class LastUsedTracker:
+    """Regroupement des écritures de `api_tokens.last_used`
+
+    Un token n'est marqué qu'une fois toutes les `min_interval` secondes ;
+    les dates en attente sont écrites par lots lors du vidage périodique.
+    """
+
+    def __init__(self, min_interval=300):
+        self.min_interval = min_interval
+        self._pending = {}
+        self._last_marked = {}
+        self._lock = threading.Lock()
+
+    def touch(self, token_id, when):
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_marked.get(token_id)
+            if last is not None and now - last < self.min_interval:
+                return
+            self._last_marked[token_id] = now
+            self._pending[token_id] = when
+
+    def flush(self):
+        """Écrire les dates de dernière utilisation en attente"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        tokens = ApiToken.__table__
+        try:
+            db.session.execute(
+                tokens.update()
+                .where(tokens.c.id == bindparam('b_id'))
+                .values(last_used=bindparam('b_when')),
+                [{'b_id': token_id, 'b_when': when} for token_id, when in pending.items()]
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception('Échec de la mise à jour de last_used des tokens API')
+            with self._lock:
+                for token_id, when in pending.items():
+                    self._pending.setdefault(token_id, when)
+            return 0
+        return len(pending)
+
+token_cache = TokenCache()
+last_used_tracker = LastUsedTracker()
+
+@on_commit(ApiToken)
+def _invalidate_tokens(changes):
+    token_cache.invalidate_ids(pk for _, pk, _ in changes)
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+import magic
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from services.blobs import acquire_blob, hash_file
+from services.renditions import single_flight
+from services.storage import NotFound, storage
+
+WRITE_BUFFER = 64 * 1024
+
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+class UploadError(ValueError):
+    """Requête d'upload par morceaux refusée"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+def _upload_folder():
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'chunked')
+
+def _paths(upload_id):
+    if not _UPLOAD_ID.match(upload_id):
+        raise UploadError('Upload introuvable', 404)
+    base = os.path.join(_upload_folder(), upload_id)
+    return f'{base}.part', f'{base}.json'
+
+def _remove(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def _save_state(state):
+    # Écriture atomique : un worker ne lit jamais un état à moitié écrit
+    _, state_path = _paths(state['id'])
+    tmp_path = f'{state_path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+def _check_size(size):
+    max_size = current_app.config['MEDIA_UPLOAD_MAX_SIZE']
+    if size < 0 or size > max_size:
+        raise UploadError(f'Taille invalide (maximum {max_size} octets)', 413 if size > max_size else 400)
+
+def start_upload(filename, size, user_id):
+    """Ouvrir un upload par morceaux : fichier partiel vide et état à côté"""
+    _check_size(size)
+
+    os.makedirs(_upload_folder(), exist_ok=True)
+    state = {
+        'id': uuid.uuid4().hex,
+        'filename': filename,
+        'size': size,
+        'offset': 0,
+        'user_id': user_id,
+        'created_at': time.time()
+    }
+    part_path, _ = _paths(state['id'])
+    open(part_path, 'wb').close()
+    _save_state(state)
+    return state
+
+def load_upload(upload_id, user_id):
+    """État d'un upload en cours, réservé à l'utilisateur qui l'a ouvert"""
+    part_path, state_path = _paths(upload_id)
+    try:
+        with open(state_path, encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        raise UploadError('Upload introuvable', 404)
+    if state['user_id'] != user_id:
+        raise UploadError('Upload introuvable', 404)
+    return state
+
+def write_chunk(upload_id, user_id, offset, stream, length):
+    """Ajouter un morceau à la position `offset` en recopiant le flux par petits blocs
+
+    Le morceau doit commencer exactement à la taille déjà reçue : un client
+    qui reprend après une coupure relit d'abord l'offset courant.
+    """
+    chunk_size = current_app.config['MEDIA_UPLOAD_CHUNK_SIZE']
+    if length is None:
+        raise UploadError('Content-Length requis', 411)
+    if length > chunk_size:
+        raise UploadError(f'Morceau trop grand (maximum {chunk_size} octets)', 413)
+
+    part_path, state_path = _paths(upload_id)
+    with single_flight(upload_id, f'{state_path}.lock'):
+        state = load_upload(upload_id, user_id)
+        if offset != state['offset']:
+            raise UploadError('Offset inattendu', 409, state['offset'])
+        if offset + length > state['size']:
+            raise UploadError('Le morceau dépasse la taille annoncée', 416, state['offset'])
+
+        written = 0
+        with open(part_path, 'r+b') as out:
+            out.seek(offset)
+            while written < length:
+                data = stream.read(min(WRITE_BUFFER, length - written))
+                if not data:
+                    break
+                out.write(data)
+                written += len(data)
+            # Un morceau interrompu est écarté : l'offset reste le dernier complet
+            out.truncate(offset + written if written == length else offset)
+
+        if written != length:
+            raise UploadError('Morceau incomplet', 400, state['offset'])
+        state['offset'] = offset + written
+        _save_state(state)
+    return state
+
+def finish_upload(upload_id, user_id, checksum=None):
+    """Clore un upload complet : empreinte, type réel, puis stockage par contenu
+
+    Le fichier est relu par blocs pour l'empreinte et seuls ses premiers
+    octets servent à la détection du type : la mémoire reste bornée quelle
+    que soit la taille.
+    """
+    part_path, state_path = _paths(upload_id)
+    with single_flight(upload_id, f'{state_path}.lock'):
+        state = load_upload(upload_id, user_id)
+        if state['offset'] != state['size']:
+            raise UploadError('Upload incomplet', 409, state['offset'])
+
+        sha256 = hash_file(part_path)
+        if checksum and checksum.lower() != sha256:
+            raise UploadError('Empreinte SHA-256 différente du fichier reçu', 422)
+        with open(part_path, 'rb') as f:
+            mime_type = magic.from_buffer(f.read(2048), mime=True)
+
+        ext = os.path.splitext(state['filename'])[1].lower()
+        blob = acquire_blob(sha256, part_path, state['size'], ext)
+        _remove(state_path)
+    _remove(f'{state_path}.lock')
+    return state, blob, mime_type
+
+def abort_upload(upload_id, user_id):
+    """Abandonner un upload et supprimer ce qui a été reçu"""
+    part_path, state_path = _paths(upload_id)
+    with single_flight(upload_id, f'{state_path}.lock'):
+        load_upload(upload_id, user_id)
+        _remove(part_path, state_path)
+    _remove(f'{state_path}.lock')
+
+def purge_expired_uploads():
+    """Supprimer les uploads abandonnés depuis plus de MEDIA_UPLOAD_EXPIRE secondes"""
+    folder = _upload_folder()
+    if not os.path.isdir(folder):
+        return 0
+    cutoff = time.time() - current_app.config['MEDIA_UPLOAD_EXPIRE']
+    purged = 0
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                purged += name.endswith('.part')
+        except OSError:
+            continue
+    return purged
+
+# Upload direct : le client envoie le fichier au stockage via une URL
+# présignée, sans passer par les workers de l'application. Le jeton rendu
+# au client porte l'état de l'upload : aucun état à partager entre instances.
+
+def _direct_serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='direct-upload')
+
+def start_direct_upload(filename, size, sha256, content_type, user_id):
+    """Préparer un envoi direct : URL présignée vers incoming/ et jeton de confirmation"""
+    _check_size(size)
+    sha256 = (sha256 or '').lower()
+    if not _SHA256.match(sha256):
+        raise UploadError('Empreinte SHA-256 requise')
+
+    key = f'incoming/{uuid.uuid4().hex}_{filename}'
+    upload = storage.driver.presign_put(key, size, storage.presign_expire, content_type, sha256)
+    token = _direct_serializer().dumps({
+        'key': key,
+        'filename': filename,
+        'size': size,
+        'sha256': sha256,
+        'user_id': user_id
+    })
+    return dict(upload, token=token, expires_in=storage.presign_expire)
+
+def _stream_digest(chunks):
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+def finish_direct_upload(token, user_id):
+    """Vérifier l'objet reçu (taille, empreinte, type réel) et le rattacher à son blob
+
+    L'empreinte fournie par le stockage est utilisée si elle existe ; sinon
+    l'objet est relu en flux. Le contenu est ensuite déplacé côté stockage
+    vers l'emplacement de son blob, ou supprimé s'il y est déjà.
+    """
+    try:
+        claims = _direct_serializer().loads(token, max_age=storage.presign_expire)
+    except BadSignature:
+        raise UploadError('Upload introuvable', 404)
+    if claims['user_id'] != user_id:
+        raise UploadError('Upload introuvable', 404)
+
+    driver = storage.driver
+    key = claims['key']
+    try:
+        info = driver.head(key)
+    except NotFound:
+        raise UploadError('Fichier non reçu par le stockage', 409)
+    if info['size'] != claims['size']:
+        driver.delete(key)
+        raise UploadError('Taille différente de celle annoncée', 422)
+    sha256 = info['sha256'] or _stream_digest(driver.stream(key))
+    if sha256 != claims['sha256']:
+        driver.delete(key)
+        raise UploadError('Empreinte SHA-256 différente du fichier reçu', 422)
+    mime_type = magic.from_buffer(driver.read(key, 2048), mime=True)
+
+    ext = os.path.splitext(claims['filename'])[1].lower()
+    blob = acquire_blob(sha256, None, claims['size'], ext)
+    if storage.exists(blob.file_path):
+        driver.delete(key)
+    else:
+        driver.move(key, storage.key(blob.file_path))
+    return claims['filename'], blob, mime_type
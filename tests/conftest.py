@@ -0,0 +1,88 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+# Racine du dépôt importable sans installation, configuration de test même
+# pour l'application créée à l'import de app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FLASK_CONFIG', 'testing')
+
+from app import create_app, db
+from database.models import User, Post, Category, Tag, Activity, Offer
+from services.cache import response_cache
+from services.counters import view_counter
+
+@pytest.fixture
+def app():
+    """Application de test sur une base SQLite en mémoire"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        # Vues comptées en mémoire : les écrire tant que les tables existent
+        view_counter.flush()
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    """Client HTTP de test"""
+    return app.test_client()
+
+@pytest.fixture
+def seed_posts(app):
+    """Créer `count` posts publiés avec auteur, catégorie, tags, activité et offre"""
+    def seed(count):
+        author = User(username='auteur', email='auteur@labmath.com', password_hash='x',
+                      first_name='Ada', last_name='Lovelace')
+        categories = [Category(name=f'Catégorie {i}') for i in range(3)]
+        tags = [Tag(name=f'tag{i}') for i in range(5)]
+        db.session.add(author)
+        db.session.add_all(categories + tags)
+        db.session.flush()
+        
+        posts = []
+        for i in range(count):
+            post = Post(title=f'Post {i}', content=f'Contenu **{i}**', content_html=f'<p>Contenu <strong>{i}</strong></p>',
+                        post_type='article', status='published', user_id=author.id,
+                        category_id=categories[i % len(categories)].id,
+                        published_at=datetime(2024, 1, 1) + timedelta(hours=i))
+            post.tags.extend([tags[i % len(tags)], tags[(i + 1) % len(tags)]])
+            post.activity = Activity(title=f'Atelier {i}', activity_type='workshop',
+                                     start_date=datetime(2030, 1, 1) + timedelta(days=i))
+            post.offer = Offer(title=f'Offre {i}', description='Description', offer_type='job')
+            posts.append(post)
+        db.session.add_all(posts)
+        db.session.commit()
+        response_cache.invalidate()
+        return posts
+    return seed
+
+class StatementCounter:
+    """Compter les requêtes SQL émises sur le moteur pendant un bloc `with`"""
+    
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+    
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+    
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+    
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+    
+    @property
+    def count(self):
+        return len(self.statements)
+
+@pytest.fixture
+def count_statements(app):
+    """Fabrique de compteurs de requêtes sur le moteur de l'application"""
+    return lambda: StatementCounter(db.engine)
@@ -0,0 +1,65 @@
+"""Nombre de requêtes SQL et colonnes chargées par les endpoints publics
+
+Les relations sont chargées en amont : le nombre de requêtes d'une page ne
+doit pas dépendre du nombre de posts qu'elle contient.
+"""
+import re
+
+import pytest
+
+# count + page (auteur, catégorie, activité, offre joints) + tags (IN)
+POSTS_PAGE_MAX_STATEMENTS = 3
+# post (relations jointes) + tags (IN)
+POST_DETAIL_MAX_STATEMENTS = 2
+
+@pytest.mark.parametrize('limit', [1, 10, 50])
+def test_posts_page_statement_count(client, seed_posts, count_statements, limit):
+    seed_posts(60)
+    
+    with count_statements() as counter:
+        response = client.get(f'/api/posts?limit={limit}')
+    
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert len(data) == limit
+    assert all(post['author'] and post['category'] and post['tags'] for post in data)
+    assert all(post['activity'] and post['offer'] for post in data)
+    assert counter.count <= POSTS_PAGE_MAX_STATEMENTS, counter.statements
+
+def test_post_detail_statement_count(client, seed_posts, count_statements):
+    slug = seed_posts(5)[2].slug
+    
+    with count_statements() as counter:
+        response = client.get(f'/api/posts/{slug}')
+    
+    assert response.status_code == 200
+    post = response.get_json()['data']
+    assert post['author'] and post['category'] and post['activity'] and post['offer']
+    assert len(post['tags']) == 2
+    assert counter.count <= POST_DETAIL_MAX_STATEMENTS, counter.statements
+
+def test_cached_posts_page_issues_no_statement(client, seed_posts, count_statements):
+    seed_posts(20)
+    client.get('/api/posts?limit=10')
+    
+    with count_statements() as counter:
+        response = client.get('/api/posts?limit=10')
+    
+    assert response.status_code == 200
+    assert counter.count == 0, counter.statements
+
+@pytest.mark.parametrize('url', [
+    '/api/activities?status=all', '/api/activities?status=all&fields=title,post_slug,featured_image',
+    '/api/offers?status=all', '/api/offers?status=all&fields=title,post_slug,featured_image',
+])
+def test_linked_post_loads_only_served_columns(client, seed_posts, count_statements, url):
+    seed_posts(5)
+    
+    with count_statements() as counter:
+        response = client.get(url)
+    
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert len(data) == 5 and all(item['post_slug'] for item in data)
+    assert counter.count <= 2, counter.statements
+    assert not any(re.search(r'posts(_\d+)?\.content', statement) for statement in counter.statements), counter.statements
@@ -0,0 +1,47 @@
+"""Références aux contenus dédoublonnés (services.blobs)"""
+from flask_sqlalchemy.query import Query
+
+from app import db
+from database.models import MediaBlob, Tag
+from services.blobs import acquire_blob, acquire_blobs
+
+SHA256 = 'ab' * 32
+
+def insert_concurrent_blob():
+    """Ligne du même contenu insérée par un autre worker, invisible à la première lecture"""
+    db.session.execute(MediaBlob.__table__.insert().values(
+        sha256=SHA256, file_path='uploads/blobs/ab/ab/x.png', file_size=10, ref_count=1
+    ))
+
+def miss_once(monkeypatch, method):
+    original = getattr(Query, method)
+    calls = []
+    
+    def patched(self, *args, **kwargs):
+        calls.append(1)
+        return ([] if method == 'all' else None) if len(calls) == 1 else original(self, *args, **kwargs)
+    monkeypatch.setattr(Query, method, patched)
+
+def test_acquire_blob_conflict_keeps_transaction(app, monkeypatch):
+    db.session.add(Tag(name='Pendant'))
+    insert_concurrent_blob()
+    miss_once(monkeypatch, 'first')
+    
+    blob = acquire_blob(SHA256, None, 10, '.png')
+    db.session.commit()
+    
+    assert blob.ref_count == 2
+    assert MediaBlob.query.count() == 1
+    assert Tag.query.filter_by(name='Pendant').count() == 1
+
+def test_acquire_blobs_conflict_keeps_transaction(app, monkeypatch):
+    db.session.add(Tag(name='Pendant'))
+    insert_concurrent_blob()
+    miss_once(monkeypatch, 'all')
+    
+    blobs = acquire_blobs([(SHA256, None, 10, '.png')])
+    db.session.commit()
+    
+    assert blobs[SHA256].ref_count == 2
+    assert MediaBlob.query.count() == 1
+    assert Tag.query.filter_by(name='Pendant').count() == 1
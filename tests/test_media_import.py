@@ -0,0 +1,28 @@
+"""Import de médias par archive"""
+import io
+import zipfile
+
+from PIL import Image
+
+from services.media_import import import_archive
+
+def png(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+def test_archive_results_follow_member_order(app, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # UPLOAD_FOLDER relatif : fichiers écrits sous tmp_path
+    path = tmp_path / 'lot.zip'
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('a.png', png('red'))
+        archive.writestr('gros.png', png('green') + b'\0' * 4096)
+        archive.writestr('script.exe', b'MZ')
+        archive.writestr('b.png', png('blue'))
+    app.config['MEDIA_UPLOAD_MAX_SIZE'] = 2048
+    
+    results = import_archive(str(path), uploaded_by=1, batch_size=2)
+    
+    assert [result['name'] for result in results] == ['a.png', 'gros.png', 'script.exe', 'b.png']
+    assert [result['status'] for result in results] == ['created', 'skipped', 'skipped', 'created']
+    assert results[1]['error'] == 'Fichier trop volumineux'
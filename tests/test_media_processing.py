@@ -0,0 +1,42 @@
+"""Reprise des traitements de médias interrompus"""
+from datetime import datetime, timedelta
+
+from app import db
+from database.models import Media
+from services.media_processing import MediaProcessor
+
+def worker(app, submitted):
+    """Processeur d'un worker : les jobs remis en file sont seulement notés"""
+    processor = MediaProcessor()
+    processor.init_app(app)
+    processor.submit = lambda media_id, *args: submitted.append(media_id)
+    return processor
+
+def add_media(status, age):
+    media = Media(filename=f'{status}.png', file_path=f'uploads/images/{status}.png', file_type='image',
+                  processing_status=status, created_at=datetime.utcnow() - timedelta(seconds=age))
+    db.session.add(media)
+    db.session.commit()
+    return media.id
+
+def test_stale_media_requeued_by_a_single_worker(app):
+    stale = add_media('processing', 3600)
+    add_media('processing', 10)
+    add_media('ready', 3600)
+    submitted = []
+    
+    assert worker(app, submitted).requeue_stale() == 1
+    assert worker(app, submitted).requeue_stale() == 0
+    assert submitted == [stale]
+
+def test_claimed_media_requeued_again_once_stale(app):
+    stale = add_media('processing', 3600)
+    submitted = []
+    processor = worker(app, submitted)
+    processor.requeue_stale()
+    
+    db.session.get(Media, stale).processing_claimed_at = datetime.utcnow() - timedelta(seconds=3600)
+    db.session.commit()
+    
+    assert worker(app, submitted).requeue_stale() == 1
+    assert submitted == [stale, stale]
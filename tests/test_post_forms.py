@@ -0,0 +1,56 @@
+"""Formulaires de création et d'édition des posts"""
+import pytest
+
+from app import db
+from database.models import User, Post
+
+@pytest.fixture
+def logged_client(app, client):
+    user = User(username='auteur', email='auteur@labmath.com', password_hash='x',
+                first_name='Ada', last_name='Lovelace')
+    db.session.add(user)
+    db.session.commit()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+    return client
+
+def flashes(client):
+    with client.session_transaction() as session:
+        return session.get('_flashes', [])
+
+def test_create_with_invalid_published_at(logged_client):
+    response = logged_client.post('/posts/create', data={
+        'title': 'Titre', 'content': 'Contenu', 'status': 'published', 'published_at': 'garbage'
+    })
+    
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/posts/create')
+    assert ('danger', 'Date de publication invalide.') in flashes(logged_client)
+    assert Post.query.count() == 0
+
+def test_edit_with_invalid_published_at(logged_client):
+    post = Post(title='Titre', content='Contenu', post_type='article', status='draft',
+                user_id=User.query.first().id)
+    db.session.add(post)
+    db.session.commit()
+    
+    response = logged_client.post(f'/posts/{post.id}/edit', data={
+        'title': 'Autre titre', 'content': 'Contenu', 'post_type': 'article',
+        'status': 'published', 'published_at': '2024-13-45T99:00'
+    })
+    
+    assert response.status_code == 302
+    assert ('danger', 'Date de publication invalide.') in flashes(logged_client)
+    db.session.expire_all()
+    post = db.session.get(Post, post.id)
+    assert (post.title, post.status, post.published_at) == ('Titre', 'draft', None)
+
+def test_create_with_scheduled_published_at(logged_client):
+    logged_client.post('/posts/create', data={
+        'title': 'Programmé', 'content': 'Contenu', 'status': 'published', 'published_at': '2099-01-01T08:30'
+    })
+    
+    post = Post.query.one()
+    assert post.status == 'scheduled'
+    assert post.published_at.isoformat() == '2099-01-01T08:30:00'
@@ -0,0 +1,33 @@
+"""Extraits surlignés de la recherche plein texte"""
+from datetime import datetime
+
+from app import db
+from database.models import User, Post
+from services.post_search import search_snippets
+from services.rendering import markdown_renderer
+
+def add_post(content):
+    author = User.query.first()
+    if author is None:
+        author = User(username='auteur', email='auteur@labmath.com', password_hash='x',
+                      first_name='Ada', last_name='Lovelace')
+        db.session.add(author)
+        db.session.flush()
+    post = Post(title='Titre', content=content, content_html=markdown_renderer.convert(content),
+                post_type='article', status='published', user_id=author.id, published_at=datetime(2024, 1, 1))
+    db.session.add(post)
+    db.session.commit()
+    return post
+
+def test_snippet_is_plain_text(app):
+    post = add_post('# Rapport\n\nhello **world** [29](https://labmath.org)')
+    
+    assert search_snippets('world', [post.id])[post.id] == 'Rapport hello <mark>world</mark> 29'
+
+def test_snippet_escapes_content(app):
+    post = add_post('a < b & <script>alert(1)</script> world')
+    
+    snippet = search_snippets('world', [post.id])[post.id]
+    assert '<script>' not in snippet and '&lt;script&gt;' not in snippet
+    assert snippet.startswith('a &lt; b &amp; ')
+    assert snippet.endswith('<mark>world</mark>')
@@ -0,0 +1,33 @@
+"""Récupération groupée de posts (/api/posts/batch)"""
+import pytest
+
+def test_batch_by_slugs_and_ids(client, seed_posts):
+    posts = seed_posts(3)
+    slug, post_id = posts[0].slug, posts[1].id
+    
+    response = client.post('/api/posts/batch', json={'slugs': [slug, 'absent'], 'ids': [post_id, 999]})
+    
+    assert response.status_code == 200
+    body = response.get_json()
+    assert len(body['data']) == 2
+    assert body['missing'] == {'slugs': ['absent'], 'ids': [999]}
+
+@pytest.mark.parametrize('body', [
+    [1, 2],
+    'post-0',
+    {'slugs': 'post-0,post-1'},
+    {'ids': '1,2'},
+    {'slugs': [{'slug': 'post-0'}]},
+    {'ids': ['un']},
+])
+def test_batch_rejects_malformed_body(client, seed_posts, body):
+    seed_posts(2)
+    
+    response = client.post('/api/posts/batch', json=body)
+    
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Identifiants invalides'}
+
+def test_batch_without_identifiers(client):
+    assert client.post('/api/posts/batch', json={}).status_code == 400
+    assert client.post('/api/posts/batch').status_code == 400
@@ -0,0 +1,28 @@
+"""Publication programmée sur plusieurs workers"""
+from datetime import datetime, timedelta
+
+from app import db
+from database.models import Post, User
+from services.cache import response_cache
+from services.scheduler import PublishScheduler
+
+def test_every_worker_invalidates_cache_once_due(app, monkeypatch):
+    author = User(username='auteur', email='auteur@labmath.com', password_hash='x')
+    db.session.add(author)
+    db.session.flush()
+    due = datetime.utcnow() + timedelta(hours=1)
+    post = Post(title='Programmé', content='Contenu', post_type='article', status='scheduled',
+                user_id=author.id, published_at=due)
+    db.session.add(post)
+    db.session.commit()
+    workers = [PublishScheduler(), PublishScheduler()]
+    for worker in workers:
+        worker.run(datetime.utcnow())
+    
+    invalidations = []
+    monkeypatch.setattr(response_cache, 'invalidate', lambda: invalidations.append(1))
+    counts = [worker.run(due + timedelta(minutes=1)) for worker in workers]
+    
+    assert [c['posts_published'] for c in counts] == [1, 0]
+    assert len(invalidations) == 2
+    assert db.session.get(Post, post.id).status == 'published'